@@ -0,0 +1,213 @@
+"""Local index of the words already in the Anki deck.
+
+    python -m ankinizer.added_index sync            # (re)seed from the deck over AnkiConnect
+    python -m ankinizer.added_index forget WORD...  # after deleting notes in Anki
+"""
+import argparse
+import asyncio
+import contextlib
+import dataclasses
+import hashlib
+import html
+import logging
+import re
+import sqlite3
+import sys
+import time
+import typing
+from pathlib import Path
+from typing import Optional
+
+from ankinizer import env
+from ankinizer import reverso_cache
+
+logger = logging.getLogger(__name__)
+
+BOT, SYNC = "bot", "sync"
+
+_TAG = re.compile(r"<[^>]*>")
+# The bot's front field is the word followed by example sentences in divs
+_FIELD_BREAK = re.compile(r"<div|<br|\n", re.IGNORECASE)
+
+
+class SeedingUnsupported(RuntimeError):
+    """The Anki backend in use can't list the deck's notes."""
+
+
+def content_hash(front_html: str, back_html: str) -> str:
+    return hashlib.sha256(f"{front_html}\0{back_html}".encode()).hexdigest()
+
+
+def word_from_front(front_html: str) -> str:
+    """The word a note is for: the text of its front field before the first line break."""
+    first_line = _FIELD_BREAK.split(front_html, 1)[0]
+    return reverso_cache.normalize_word(html.unescape(_TAG.sub("", first_line)))
+
+
+@dataclasses.dataclass
+class AddedWord:
+    word: str
+    added_at: float
+    content_hash: str
+    source: str
+
+
+class AddedIndex:
+    """SQLite table of the words the deck has cards for, keyed by normalized word.
+
+    Filled as the bot adds cards and seeded once from the deck's existing
+    notes (see sync_from_deck), so duplicates are caught before a lookup or
+    a browser session is spent on them.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._db = sqlite3.connect(str(path))
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS words ("
+            " word TEXT PRIMARY KEY,"
+            " added_at REAL NOT NULL,"
+            " content_hash TEXT NOT NULL,"
+            " source TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._db.commit()
+
+    def get(self, word: str) -> Optional[AddedWord]:
+        row = self._db.execute(
+            "SELECT word, added_at, content_hash, source FROM words WHERE word = ?", (reverso_cache.normalize_word(word),)
+        ).fetchone()
+        return AddedWord(*row) if row is not None else None
+
+    def record(self, word: str, front_html: str, back_html: str, source: str = BOT) -> None:
+        self.record_many([(word, content_hash(front_html, back_html))], source)
+
+    def record_many(self, entries: typing.Iterable[typing.Tuple[str, str]], source: str) -> int:
+        """Add (word, content hash) pairs; words already indexed keep their original entry."""
+        now = time.time()
+        cursor = self._db.executemany(
+            "INSERT OR IGNORE INTO words (word, added_at, content_hash, source) VALUES (?, ?, ?, ?)",
+            ((reverso_cache.normalize_word(word), now, digest, source) for word, digest in entries if word.strip()),
+        )
+        self._db.commit()
+        return cursor.rowcount
+
+    def forget(self, word: str) -> bool:
+        cursor = self._db.execute("DELETE FROM words WHERE word = ?", (reverso_cache.normalize_word(word),))
+        self._db.commit()
+        return cursor.rowcount > 0
+
+    def count(self) -> int:
+        (count,) = self._db.execute("SELECT COUNT(*) FROM words").fetchone()
+        return count
+
+    @property
+    def synced_at(self) -> Optional[float]:
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'synced_at'").fetchone()
+        return float(row[0]) if row is not None else None
+
+    def mark_synced(self) -> None:
+        self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('synced_at', ?)", (str(time.time()),))
+        self._db.commit()
+
+    def close(self) -> None:
+        self._db.close()
+
+
+_index: Optional[AddedIndex] = None
+
+
+def is_enabled() -> bool:
+    return env.get_int("ANKINIZER_ADDED_INDEX", 1) != 0
+
+
+def get_index() -> AddedIndex:
+    """Process-wide index stored in the data dir, created on first use."""
+    global _index
+    if _index is None:
+        _index = AddedIndex(env.data_dir() / "added_words.sqlite3")
+    return _index
+
+
+def lookup(word: str) -> Optional[AddedWord]:
+    """The index entry for word, None if it isn't there or the index is turned off."""
+    return get_index().get(word) if is_enabled() else None
+
+
+async def sync_from_deck(index: Optional[AddedIndex] = None) -> int:
+    """Index every note in the deck; needs the AnkiConnect backend. Returns how many words were new."""
+    from ankinizer import anki_agent
+    from ankinizer import anki_connect
+
+    index = index or get_index()
+    backend = anki_agent.get_backend()
+    if not isinstance(backend, anki_connect.AnkiConnectBackend):
+        raise SeedingUnsupported("Seeding the index needs ANKINIZER_ANKI_BACKEND=ankiconnect")
+    notes = await backend.deck_notes()
+    added = index.record_many(((word_from_front(front), content_hash(front, back)) for front, back in notes), SYNC)
+    index.mark_synced()
+    logger.info(f"Indexed {len(notes)} notes from the deck, {added} new words, {index.count()} in total")
+    return added
+
+
+async def seed_once() -> None:
+    """Sync from the deck unless that was done before; failures are logged, the bot works without it."""
+    if not is_enabled() or get_index().synced_at is not None:
+        return
+    try:
+        await sync_from_deck()
+    except SeedingUnsupported:
+        # Expected on AnkiWeb, where the index only learns the cards the bot adds
+        logger.info("Not seeding the added-words index, the Anki backend can't list the deck")
+    except Exception as e:
+        logger.warning(f"Could not seed the added-words index from the deck: {e}")
+
+
+_seeding: Optional[asyncio.Task] = None
+
+
+def start_seeding() -> None:
+    """Run seed_once in the background so startup doesn't wait for the deck."""
+    global _seeding
+    if _seeding is None and is_enabled() and get_index().synced_at is None:
+        _seeding = asyncio.create_task(seed_once())
+
+
+async def stop_seeding() -> None:
+    global _seeding
+    task, _seeding = _seeding, None
+    if task is not None:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+
+
+async def _sync_and_close(index: AddedIndex) -> None:
+    from ankinizer import anki_agent
+
+    try:
+        await sync_from_deck(index)
+    finally:
+        await anki_agent.close_backend()
+
+
+def main(argv: Optional[typing.Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("sync", help="index every note in the deck")
+    forget = commands.add_parser("forget", help="drop words from the index")
+    forget.add_argument("words", nargs="+")
+    args = parser.parse_args(argv)
+
+    index = get_index()
+    if args.command == "sync":
+        asyncio.run(_sync_and_close(index))
+    else:
+        for word in args.words:
+            print(f"{word}: {'forgotten' if index.forget(word) else 'not in the index'}")
+    index.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
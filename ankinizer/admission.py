@@ -0,0 +1,116 @@
+import asyncio
+import collections
+import contextlib
+import logging
+import typing
+from typing import Optional
+
+from ankinizer import env
+from ankinizer import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SESSIONS = 3
+DEFAULT_MAX_QUEUE = 20
+
+OnQueued = typing.Callable[[int], typing.Awaitable[None]]
+
+ADMISSION_ACTIVE: metrics.Gauge = metrics.REGISTRY.register(metrics.Gauge(
+    "ankinizer_admission_active", "Lookups and card adds currently holding a browser session",
+    callback=lambda: get_controller().active,
+))
+ADMISSION_QUEUED: metrics.Gauge = metrics.REGISTRY.register(metrics.Gauge(
+    "ankinizer_admission_queued", "Lookups and card adds waiting for a browser session",
+    callback=lambda: get_controller().queued,
+))
+ADMISSION_REJECTED: metrics.Counter = metrics.REGISTRY.register(metrics.Counter(
+    "ankinizer_admission_rejected_total", "Requests turned away because the wait queue was full",
+))
+
+
+class AdmissionRejected(Exception):
+    """The wait queue is full; the caller should tell the user to come back later."""
+
+    def __init__(self, queued: int) -> None:
+        super().__init__(f"Too busy right now ({queued} requests waiting), please try again in a minute")
+        self.queued = queued
+
+
+class AdmissionController:
+    """Caps how many lookups and card adds drive a browser at the same time.
+
+    Up to max_sessions callers run at once; the next max_queue wait in FIFO
+    order and learn their place in line through on_queued, anyone beyond that
+    is turned away with AdmissionRejected instead of waiting silently.
+    """
+
+    def __init__(self, max_sessions: int = DEFAULT_MAX_SESSIONS, max_queue: int = DEFAULT_MAX_QUEUE) -> None:
+        if max_sessions < 1:
+            raise ValueError("max_sessions must be at least 1")
+        self.max_sessions = max_sessions
+        self.max_queue = max_queue
+        self.active = 0
+        self._waiters: typing.Deque[asyncio.Future] = collections.deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    @contextlib.asynccontextmanager
+    async def admit(self, on_queued: Optional[OnQueued] = None) -> typing.AsyncIterator[None]:
+        await self._acquire(on_queued)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _acquire(self, on_queued: Optional[OnQueued]) -> None:
+        if self.active < self.max_sessions and not self._waiters:
+            self.active += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            ADMISSION_REJECTED.inc()
+            raise AdmissionRejected(len(self._waiters))
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            if on_queued is not None:
+                try:
+                    await on_queued(len(self._waiters))
+                except Exception:
+                    # A failed notice (e.g. the status message is gone) mustn't cost the place in line
+                    logger.exception("Queue notice failed")
+            with metrics.span("admission_wait"):
+                await waiter
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up, pass it on
+                self._release()
+            else:
+                waiter.cancel()
+                with contextlib.suppress(ValueError):
+                    self._waiters.remove(waiter)
+            raise
+
+    def _release(self) -> None:
+        # Hand the slot straight to the next waiter so a newcomer can't jump the queue
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+_controller: Optional[AdmissionController] = None
+
+
+def get_controller() -> AdmissionController:
+    global _controller
+    if _controller is None:
+        _controller = AdmissionController(
+            max_sessions=env.get_int("ANKINIZER_MAX_SESSIONS", DEFAULT_MAX_SESSIONS),
+            max_queue=env.get_int("ANKINIZER_MAX_QUEUE", DEFAULT_MAX_QUEUE),
+        )
+        logger.info(f"Admission control: {_controller.max_sessions=} {_controller.max_queue=}")
+    return _controller
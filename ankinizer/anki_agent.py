@@ -1,13 +1,25 @@
+from __future__ import annotations
+
+import abc
 import os
 import time
 import asyncio
+import contextlib
 import dataclasses
 import logging
-from typing import Optional
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, AsyncIterator, List, Optional
 
-import playwright.async_api
+from ankinizer import added_index
+from ankinizer import admission
+from ankinizer import chromium_watchdog
 from ankinizer import reverso_agent
 from ankinizer import env
+from ankinizer import metrics
+from ankinizer import resilience
+
+if TYPE_CHECKING:
+    import playwright.async_api
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +28,16 @@ class PlaywrightParams:
     headless: bool = True
     slow_mo: int = 0
 
+@dataclasses.dataclass
+class CardReport:
+    en_word: str
+    added: bool
+    error: Optional[str] = None
+    # The deck already had the word, nothing was sent to Anki
+    already_added: bool = False
+    # Add was pressed but never confirmed; the card may be in the deck, so it must not be retried
+    unconfirmed: bool = False
+
 def format_back_html(reverso_result: reverso_agent.ReversoResult) -> str:
     return (''
         + " / ".join(reverso_result.ru_translations)
@@ -33,74 +55,507 @@ def format_front_html(reverso_result: reverso_agent.ReversoResult) -> str:
         + ''
     )
 
-async def add_card_to_anki(reverso_result: reverso_agent.ReversoResult, playwright_params: Optional[PlaywrightParams] = None) -> bool:
-    if playwright_params is None:
-        playwright_params = PlaywrightParams()
-    async with playwright.async_api.async_playwright() as p:
-        browser = await p.chromium.launch(headless=playwright_params.headless, slow_mo=playwright_params.slow_mo)
-        context = await browser.new_context()
-        page = await context.new_page()
-        
-        logger.info("Navigating to AnkiWeb")
-        await page.goto("https://ankiweb.net/about")
-        await page.get_by_role("link", name="Log In").click()
+
+ANKIWEB_URL = "https://ankiweb.net"
+DECK_NAME = "English words"
+
+
+def get_ankiweb_url() -> str:
+    return os.environ.get("ANKINIZER_ANKIWEB_URL", ANKIWEB_URL).rstrip("/")
+
+
+def get_storage_state_path() -> Path:
+    return Path(os.environ.get("ANKINIZER_ANKI_STATE_PATH") or env.data_dir() / "anki_storage_state.json")
+
+
+class AnkiSession:
+    """A browser context that stays logged in to AnkiWeb between cards.
+
+    Cookies are persisted to a Playwright storage_state file, so a restart
+    does not need a fresh login either. An expired session is detected when
+    the deck list does not show up and is fixed by logging in again. Once the
+    watchdog finds the browser due for recycling it is relaunched before the
+    next card, which the saved cookies make cheap.
+    """
+
+    def __init__(self, playwright_params: Optional[PlaywrightParams] = None, storage_state_path: Optional[Path] = None) -> None:
+        self.playwright_params = playwright_params or PlaywrightParams()
+        self.storage_state_path = storage_state_path or get_storage_state_path()
+        self.lock = asyncio.Lock()
+        self._playwright: Optional[playwright.async_api.Playwright] = None
+        self._browser: Optional[playwright.async_api.Browser] = None
+        self._context: Optional[playwright.async_api.BrowserContext] = None
+        self._page: Optional[playwright.async_api.Page] = None
+        self._tracked: Optional[chromium_watchdog.TrackedBrowser] = None
+        self._editor_ready = False
+
+    async def __aenter__(self) -> "AnkiSession":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+
+    async def start(self) -> None:
+        import playwright.async_api
+
+        self._playwright = await playwright.async_api.async_playwright().start()
+        await self._launch()
+
+    async def close(self) -> None:
+        await self._close_browser()
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+    def is_healthy(self) -> bool:
+        return (
+            self._browser is not None
+            and self._browser.is_connected()
+            and self._page is not None
+            and not self._page.is_closed()
+        )
+
+    async def _launch(self) -> None:
+        assert self._playwright is not None
+        with metrics.span("anki_browser_launch"):
+            async with chromium_watchdog.launching("ankiweb") as tracked:
+                self._browser = await self._playwright.chromium.launch(
+                    headless=self.playwright_params.headless, slow_mo=self.playwright_params.slow_mo
+                )
+        self._tracked = tracked
+        storage_state = str(self.storage_state_path) if self.storage_state_path.exists() else None
+        if storage_state is not None:
+            logger.info(f"Reusing AnkiWeb session from {storage_state}")
+        with metrics.span("anki_context_create"):
+            self._context = await self._browser.new_context(storage_state=storage_state)
+            self._page = await self._context.new_page()
+        self._editor_ready = False
+
+    async def _close_browser(self) -> None:
+        self._editor_ready = False
+        if self._context is not None:
+            with contextlib.suppress(Exception):
+                await self._context.close()
+            self._context = None
+        if self._browser is not None:
+            with contextlib.suppress(Exception):
+                await self._browser.close()
+            self._browser = None
+        chromium_watchdog.closed(self._tracked)
+        self._tracked = None
+        self._page = None
+
+    @property
+    def recycle_due(self) -> bool:
+        return self._tracked is not None and self._tracked.recycle_due
+
+    def page_done(self) -> None:
+        if self._tracked is not None:
+            self._tracked.page_done()
+
+    async def _ensure_running(self) -> playwright.async_api.Page:
+        if not self.is_healthy() or self.recycle_due:
+            if self.recycle_due:
+                logger.info("Relaunching AnkiWeb browser to free memory")
+            else:
+                logger.warning("AnkiWeb browser is gone, relaunching")
+            await self._close_browser()
+            await self._launch()
+        assert self._page is not None
+        return self._page
+
+    async def _login(self, page: playwright.async_api.Page) -> bool:
+        with metrics.track("anki_login"):
+            return await self._do_login(page)
+
+    async def _do_login(self, page: playwright.async_api.Page) -> bool:
+        import playwright.async_api
+
+        assert self._context is not None
+        logger.info("Logging in to AnkiWeb")
+        await page.goto(f"{get_ankiweb_url()}/account/login")
         await page.get_by_role("textbox", name="Email").click()
         await page.get_by_role("textbox", name="Email").fill(os.environ["ANKI_USERNAME"])
         await page.get_by_role("textbox", name="Password").click()
         await page.get_by_role("textbox", name="Password").fill(os.environ["ANKI_PASSWORD"])
         await page.get_by_role("button", name="Log In").click()
-        logger.info("Logging in...")
-        
         try:
-            await page.get_by_role("button", name="English words").wait_for(timeout=5000)
+            await page.get_by_role("button", name=DECK_NAME).wait_for(timeout=5000)
         except playwright.async_api.TimeoutError:
             logger.error("Failed to login")
             return False
-            
-        logger.info("Logged in, navigating to deck")
-        await page.get_by_role("button", name="English words").click()
-        logger.info("Navigated to deck")
-        await page.get_by_role("link", name="Add").click()
-        logger.info("Navigated to add card")
-        
-        logger.info("Waiting for front div")
+        await self._context.storage_state(path=str(self.storage_state_path))
+        logger.info(f"Logged in, session saved to {self.storage_state_path}")
+        return True
+
+    async def open_decks(self) -> bool:
+        """Show the deck list, logging in first if the saved session is missing or expired."""
+        import playwright.async_api
+
+        page = await self._ensure_running()
+        self._editor_ready = False
+        logger.info("Navigating to AnkiWeb decks")
+        with metrics.span("anki_goto_decks"):
+            await page.goto(f"{get_ankiweb_url()}/decks")
+        deck_button = page.get_by_role("button", name=DECK_NAME)
+        login_box = page.get_by_role("textbox", name="Email")
         try:
-            front_div = page.get_by_role("main").locator("div").filter(has_text="Front").locator("div").nth(1)
+            with metrics.span("anki_wait_decks"):
+                await deck_button.or_(login_box).first.wait_for(timeout=5000)
         except playwright.async_api.TimeoutError:
-            logger.error("Failed to find front div")
+            pass
+        if await deck_button.is_visible():
+            return True
+        logger.info("AnkiWeb session is missing or expired")
+        return await self._login(page)
+
+    async def open_add_editor(self) -> Optional[playwright.async_api.Page]:
+        """Return the page with the Add editor open, reusing it if it already is."""
+        if self.editor_ready:
+            return self._page
+        if not await self.open_decks():
+            return None
+        page = await self._ensure_running()
+        logger.info("Navigating to deck")
+        with metrics.span("anki_open_editor"):
+            await page.get_by_role("button", name=DECK_NAME).click()
+            await page.get_by_role("link", name="Add").click()
+        logger.info("Navigated to add card")
+        self._editor_ready = True
+        return page
+
+    @property
+    def editor_ready(self) -> bool:
+        return self._editor_ready and self.is_healthy() and not self.recycle_due
+
+    def invalidate_editor(self) -> None:
+        self._editor_ready = False
+
+
+_session: Optional[AnkiSession] = None
+# Held across the check and the launch so concurrent first callers share one browser
+_session_lock = asyncio.Lock()
+
+
+def get_session() -> Optional[AnkiSession]:
+    return _session
+
+
+async def start_session(playwright_params: Optional[PlaywrightParams] = None) -> AnkiSession:
+    """Start the process-wide AnkiWeb session used by add_card_to_anki."""
+    global _session
+    async with _session_lock:
+        if _session is None:
+            session = AnkiSession(playwright_params)
+            await session.start()
+            _session = session
+        return _session
+
+
+async def close_session() -> None:
+    global _session
+    async with _session_lock:
+        session, _session = _session, None
+        if session is not None:
+            await session.close()
+
+
+class AnkiStepTimeout(TimeoutError):
+    """A step of adding a card did not reach its expected editor state in time.
+
+    Subclasses the builtin TimeoutError, not Playwright's, so handlers for
+    Playwright errors don't catch it; the card-adding code catches both.
+    """
+
+    def __init__(self, step: str) -> None:
+        super().__init__(f"Timed out at step '{step}'")
+        self.step = step
+
+
+class AnkiAddUnconfirmed(Exception):
+    """Add was pressed but AnkiWeb never confirmed the card, so it may be in the deck or not.
+
+    Never retried: adding the card again could leave a duplicate.
+    """
+
+    def __init__(self, en_word: str) -> None:
+        super().__init__(f"AnkiWeb did not confirm the card for {en_word}, check the deck before adding it again")
+        self.en_word = en_word
+
+
+STEP_TIMEOUT_MS = 10000
+
+# Replaces the field content and lets the editor know, like typing would.
+# Returns the content as the browser serialized it, to compare against later.
+_SET_FIELD_HTML_JS = """(el, html) => {
+    el.focus();
+    el.innerHTML = html;
+    el.dispatchEvent(new Event('input', { bubbles: true }));
+    el.dispatchEvent(new Event('blur', { bubbles: true }));
+    return el.innerHTML;
+}"""
+
+
+@contextlib.asynccontextmanager
+async def _step(page: playwright.async_api.Page, name: str) -> AsyncIterator[None]:
+    import playwright.async_api
+
+    logger.info(f"Step: {name}")
+    try:
+        yield
+    except AnkiStepTimeout:
+        raise
+    except playwright.async_api.TimeoutError as e:
+        logger.error(f"Timed out at step '{name}'")
+        with contextlib.suppress(playwright.async_api.Error):
             await page.screenshot(path="screenshot.png")
+        raise AnkiStepTimeout(name) from e
+
+
+def _editor_field(page: playwright.async_api.Page, name: str) -> playwright.async_api.Locator:
+    return page.get_by_role("main").locator("div").filter(has_text=name).locator("div").nth(1)
+
+
+async def _set_field_html(page: playwright.async_api.Page, name: str, html: str) -> str:
+    field = _editor_field(page, name)
+    async with _step(page, f"{name}: find editor"):
+        handle = await field.element_handle(timeout=STEP_TIMEOUT_MS)
+    async with _step(page, f"{name}: set content"):
+        applied_html = await handle.evaluate(_SET_FIELD_HTML_JS, html)
+    async with _step(page, f"{name}: content kept by editor"):
+        await page.wait_for_function(
+            "([el, html]) => el.innerHTML === html", arg=[handle, applied_html], timeout=STEP_TIMEOUT_MS
+        )
+    return applied_html
+
+
+async def _fill_card(page: playwright.async_api.Page, reverso_result: reverso_agent.ReversoResult) -> bool:
+    """Fill both fields and press Add; raises AnkiStepTimeout naming the step that got stuck,
+    or AnkiAddUnconfirmed once Add was pressed.
+    """
+    import playwright.async_api
+
+    with metrics.span("anki_fill_editor"):
+        front_html = await _set_field_html(page, "Front", format_front_html(reverso_result))
+        await _set_field_html(page, "Back", format_back_html(reverso_result))
+
+    async with _step(page, "Add: click"):
+        # Playwright waits for the button to be visible and enabled
+        await page.get_by_role("button", name="Add").click(timeout=STEP_TIMEOUT_MS)
+    try:
+        async with _step(page, "Add: confirmation"):
+            with metrics.span("anki_add_confirm"):
+                await page.get_by_text("Added").wait_for(timeout=STEP_TIMEOUT_MS)
+        # A toast from the previous card may still be showing; the editor being
+        # emptied is what proves this card went through
+        async with _step(page, "Add: editor cleared"):
+            front = await _editor_field(page, "Front").element_handle(timeout=STEP_TIMEOUT_MS)
+            await page.wait_for_function(
+                "([el, html]) => el.innerHTML !== html", arg=[front, front_html], timeout=STEP_TIMEOUT_MS
+            )
+    except (playwright.async_api.Error, AnkiStepTimeout) as e:
+        raise AnkiAddUnconfirmed(reverso_result.en_word) from e
+    logger.info(f"Card for {reverso_result.en_word} added")
+    return True
+
+
+async def _add_card_in_editor(session: AnkiSession, reverso_result: reverso_agent.ReversoResult) -> bool:
+    page = await session.open_add_editor()
+    if page is None:
+        return False
+    try:
+        return await _fill_card(page, reverso_result)
+    except BaseException:
+        session.invalidate_editor()
+        raise
+    finally:
+        session.page_done()
+
+
+async def _add_card_in_session(session: AnkiSession, reverso_result: reverso_agent.ReversoResult) -> bool:
+    import playwright.async_api
+
+    reused_editor = session.editor_ready
+    try:
+        if await _add_card_in_editor(session, reverso_result):
+            return True
+    except (playwright.async_api.Error, AnkiStepTimeout):
+        # Only failures before Add was pressed get here, AnkiAddUnconfirmed is passed on
+        if not reused_editor:
             raise
-        await front_div.fill('tst')
-        logger.info("tst fill happened, applying real front formatting")
-        front_html = format_front_html(reverso_result)
-        escaped_front_html = front_html.replace("'", "\\'").replace("\n", "\\n")
-        logger.info(f"Front html {escaped_front_html=}")
-        await front_div.evaluate(f"el => {{ el.innerHTML = '{escaped_front_html}'; el.dispatchEvent(new Event('input', {{ bubbles: true }})); }}")
-        await front_div.click()
-        logger.info(f"Front html evaluated")
-        await page.wait_for_timeout(300)
-        
-        logger.info("Going for back div")
-        back_div = page.get_by_role("main").locator("div").filter(has_text="Back").locator("div").nth(1)
-        await back_div.fill('tst')
-        logger.info("tst fill happened, applying real back formatting")
-        back_html = format_back_html(reverso_result)
-        escaped_back_html = back_html.replace("'", "\\'").replace("\n", "\\n")
-        logger.info(f"Back html {escaped_back_html=}")
-        await back_div.evaluate(f"el => {{ el.innerHTML = '{escaped_back_html}'; el.dispatchEvent(new Event('input', {{ bubbles: true }})); }}")
-        await back_div.click()
-        logger.info(f"Back html evaluated")
-        await page.wait_for_timeout(300)
-        logger.info("Adding card")
-        await page.get_by_role("button", name="Add").click()
-        try:
-            await page.get_by_text("Added").wait_for(timeout=1000)
-        except playwright.async_api.TimeoutError:
-            logger.error("Failed to add card")
-            return False
-        logger.info("Card added")
+        logger.exception("Adding card failed")
+    if not reused_editor:
+        return False
+    # The editor was left over from an earlier card and the session may have
+    # expired since; go through the deck list (and login) once more
+    logger.info("Retrying with a fresh editor")
+    return await _add_card_in_editor(session, reverso_result)
+
+
+async def _add_card_with_session(session: AnkiSession, reverso_result: reverso_agent.ReversoResult) -> bool:
+    async with session.lock:
+        return await _add_card_in_session(session, reverso_result)
+
+
+async def _add_cards_with_session(session: AnkiSession, reverso_results: List[reverso_agent.ReversoResult]) -> List[CardReport]:
+    import playwright.async_api
+
+    reports = []
+    async with session.lock:
+        for reverso_result in reverso_results:
+            unconfirmed = False
+            try:
+                added = await _add_card_in_session(session, reverso_result)
+                error = None if added else "AnkiWeb did not confirm the card"
+            except (playwright.async_api.Error, AnkiStepTimeout, AnkiAddUnconfirmed) as e:
+                logger.exception(f"Failed to add card for {reverso_result.en_word}")
+                added, error, unconfirmed = False, str(e), isinstance(e, AnkiAddUnconfirmed)
+            reports.append(CardReport(en_word=reverso_result.en_word, added=added, error=error, unconfirmed=unconfirmed))
+    return reports
+
+
+class AnkiBackend(abc.ABC):
+    """Somewhere cards can be added to; selected with ANKINIZER_ANKI_BACKEND."""
+
+    @abc.abstractmethod
+    async def add_card(self, reverso_result: reverso_agent.ReversoResult, on_queued: Optional[admission.OnQueued] = None) -> bool:
+        """Add one card; on_queued hears the place in line if the backend waits for a browser."""
+
+    @abc.abstractmethod
+    async def add_cards(self, reverso_results: List[reverso_agent.ReversoResult]) -> List[CardReport]:
+        """Add several cards, reporting on each."""
+
+    async def warm_up(self) -> bool:
+        """Do the slow first-card work (connecting, logging in) ahead of time; False if it failed."""
         return True
 
+    async def close(self) -> None:
+        pass
+
+
+class AnkiWebBackend(AnkiBackend):
+    """Drives the AnkiWeb editor in a browser through the shared AnkiSession.
+
+    Adds go through the "ankiweb" circuit breaker and rate limiter, so while
+    AnkiWeb keeps failing cards fail fast instead of each tying up the
+    browser until its timeouts run out, and then take an admission slot
+    like browser lookups do.
+    """
+
+    async def add_card(self, reverso_result: reverso_agent.ReversoResult, on_queued: Optional[admission.OnQueued] = None) -> bool:
+        session = get_session() or await start_session()
+
+        async def add() -> bool:
+            async with admission.get_controller().admit(on_queued):
+                return await _add_card_with_session(session, reverso_result)
+
+        return await resilience.get_upstream("ankiweb").call(add, succeeded=bool)
+
+    async def add_cards(self, reverso_results: List[reverso_agent.ReversoResult]) -> List[CardReport]:
+        session = get_session() or await start_session()
+
+        async def add() -> List[CardReport]:
+            async with admission.get_controller().admit():
+                return await _add_cards_with_session(session, reverso_results)
+
+        return await resilience.get_upstream("ankiweb").call(
+            add, succeeded=lambda reports: not reports or any(report.added for report in reports),
+        )
+
+    async def warm_up(self) -> bool:
+        """Launch the browser, log in if needed and leave the Add editor open.
+
+        An editor that is already open may belong to a session that expired
+        while idle, so it is always reopened through the deck list.
+        """
+        session = get_session() or await start_session()
+        async with session.lock:
+            session.invalidate_editor()
+            return await session.open_add_editor() is not None
+
+    async def close(self) -> None:
+        await close_session()
+
+
+BACKENDS = ("ankiweb", "ankiconnect")
+
+_backend: Optional[AnkiBackend] = None
+
+
+def get_backend() -> AnkiBackend:
+    """The process-wide backend, "ankiweb" unless ANKINIZER_ANKI_BACKEND says otherwise."""
+    global _backend
+    if _backend is None:
+        name = os.environ.get("ANKINIZER_ANKI_BACKEND", "ankiweb")
+        if name == "ankiweb":
+            _backend = AnkiWebBackend()
+        elif name == "ankiconnect":
+            from ankinizer import anki_connect
+            _backend = anki_connect.AnkiConnectBackend()
+        else:
+            raise ValueError(f"Unknown ANKINIZER_ANKI_BACKEND {name!r}, expected one of {BACKENDS}")
+    return _backend
+
+
+async def close_backend() -> None:
+    global _backend
+    backend, _backend = _backend, None
+    if backend is not None:
+        await backend.close()
+
+
+def _remember(reverso_result: reverso_agent.ReversoResult) -> None:
+    if added_index.is_enabled():
+        added_index.get_index().record(
+            reverso_result.en_word, format_front_html(reverso_result), format_back_html(reverso_result)
+        )
+
+
+async def add_card_to_anki(
+    reverso_result: reverso_agent.ReversoResult,
+    playwright_params: Optional[PlaywrightParams] = None,
+    on_queued: Optional[admission.OnQueued] = None,
+) -> bool:
+    """Add a card unless the added-words index says the deck has the word already."""
+    if playwright_params is None:
+        if added_index.lookup(reverso_result.en_word) is not None:
+            logger.info(f"{reverso_result.en_word} is already in Anki, not adding it again")
+            metrics.OPERATIONS.inc(operation="anki_add", outcome="duplicate")
+            return True
+        with metrics.track("anki_add"):
+            added = await get_backend().add_card(reverso_result, on_queued)
+        if added:
+            _remember(reverso_result)
+        return added
+    async with admission.get_controller().admit(on_queued), AnkiSession(playwright_params) as session:
+        return await _add_card_with_session(session, reverso_result)
+
+
+async def add_cards_to_anki(reverso_results: List[reverso_agent.ReversoResult], playwright_params: Optional[PlaywrightParams] = None) -> List[CardReport]:
+    """Add several cards in one go (one login and Add editor on AnkiWeb), reporting on each card.
+
+    Words the deck already has are reported as already_added without being sent.
+    """
+    if playwright_params is None:
+        known = {i for i, result in enumerate(reverso_results) if added_index.lookup(result.en_word) is not None}
+        new_results = [result for i, result in enumerate(reverso_results) if i not in known]
+        new_reports = []
+        if new_results:
+            with metrics.track("anki_add_batch"):
+                new_reports = await get_backend().add_cards(new_results)
+        for result, report in zip(new_results, new_reports):
+            metrics.OPERATIONS.inc(operation="anki_add", outcome="success" if report.added else "failure")
+            if report.added:
+                _remember(result)
+        reports = iter(new_reports)
+        return [
+            CardReport(en_word=result.en_word, added=True, already_added=True) if i in known else next(reports)
+            for i, result in enumerate(reverso_results)
+        ]
+    async with AnkiSession(playwright_params) as session:
+        return await _add_cards_with_session(session, reverso_results)
+
 
 async def main() -> None:
     env.setup_env()
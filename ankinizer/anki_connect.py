@@ -0,0 +1,156 @@
+import ast
+import logging
+import os
+import typing
+from typing import Any, List, Optional
+
+import httpx
+
+from ankinizer import admission
+from ankinizer import anki_agent
+from ankinizer import resilience
+from ankinizer import reverso_agent
+
+logger = logging.getLogger(__name__)
+
+ANKICONNECT_URL = "http://127.0.0.1:8765"
+ANKICONNECT_VERSION = 6
+MODEL_NAME = "Basic"
+# notesInfo answers get big, ask for this many notes at a time
+NOTES_INFO_CHUNK = 500
+# What AnkiConnect says when allowDuplicate is off and the deck has the note
+DUPLICATE_ERROR = "cannot create note because it is a duplicate"
+
+
+class AnkiConnectError(Exception):
+    """AnkiConnect answered with an error."""
+
+
+def _note_errors(error: Any, failed: int) -> Optional[List[str]]:
+    """Split an addNotes error, the repr of a list with a reason per note not added.
+
+    None if the reasons cannot be told apart.
+    """
+    try:
+        errors = ast.literal_eval(str(error))
+    except (ValueError, SyntaxError):
+        errors = None
+    if isinstance(errors, list) and len(errors) == failed:
+        return [str(e) for e in errors]
+    if failed == 1 and error is not None:
+        return [str(error)]
+    return None
+
+
+class AnkiConnectBackend(anki_agent.AnkiBackend):
+    """Adds notes through the AnkiConnect add-on of a (headless) Anki desktop.
+
+    Configured with ANKINIZER_ANKICONNECT_URL and, if the add-on requires one,
+    ANKINIZER_ANKICONNECT_KEY.
+
+    Adds go through the "ankiconnect" circuit breaker and rate limiter like
+    AnkiWeb adds do, but take no admission slot: no browser is involved.
+    Notes the deck already has count as already added.
+    """
+
+    def __init__(self, url: Optional[str] = None, api_key: Optional[str] = None, deck_name: str = anki_agent.DECK_NAME, model_name: str = MODEL_NAME) -> None:
+        self.url = url or os.environ.get("ANKINIZER_ANKICONNECT_URL", ANKICONNECT_URL)
+        self.api_key = api_key or os.environ.get("ANKINIZER_ANKICONNECT_KEY")
+        self.deck_name = deck_name
+        self.model_name = model_name
+        self._client = httpx.AsyncClient(timeout=httpx.Timeout(30.0))
+
+    async def request(self, action: str, **params: Any) -> typing.Dict[str, Any]:
+        """POST one action and return the raw {"result": ..., "error": ...} answer."""
+        payload: typing.Dict[str, Any] = {"action": action, "version": ANKICONNECT_VERSION, "params": params}
+        if self.api_key:
+            payload["key"] = self.api_key
+        response = await self._client.post(self.url, json=payload)
+        response.raise_for_status()
+        return response.json()
+
+    async def invoke(self, action: str, **params: Any) -> Any:
+        answer = await self.request(action, **params)
+        if answer.get("error") is not None:
+            raise AnkiConnectError(f"{action}: {answer['error']}")
+        return answer.get("result")
+
+    async def warm_up(self) -> bool:
+        # Opens the connection and checks that Anki with the add-on is up
+        await self.invoke("version")
+        return True
+
+    def make_note(self, reverso_result: reverso_agent.ReversoResult) -> typing.Dict[str, Any]:
+        return {
+            "deckName": self.deck_name,
+            "modelName": self.model_name,
+            "fields": {
+                "Front": anki_agent.format_front_html(reverso_result),
+                "Back": anki_agent.format_back_html(reverso_result),
+            },
+            "options": {"allowDuplicate": False},
+            "tags": ["ankinizer"],
+        }
+
+    async def add_card(self, reverso_result: reverso_agent.ReversoResult, on_queued: Optional[admission.OnQueued] = None) -> bool:
+        return await resilience.get_upstream("ankiconnect").call(lambda: self._add_card(reverso_result), succeeded=bool)
+
+    async def _add_card(self, reverso_result: reverso_agent.ReversoResult) -> bool:
+        try:
+            note_id = await self.invoke("addNote", note=self.make_note(reverso_result))
+        except AnkiConnectError as e:
+            if DUPLICATE_ERROR not in str(e):
+                raise
+            logger.info(f"{reverso_result.en_word} is already in the deck")
+            return True
+        logger.info(f"Added note {note_id} for {reverso_result.en_word}")
+        return note_id is not None
+
+    async def add_cards(self, reverso_results: List[reverso_agent.ReversoResult]) -> List[anki_agent.CardReport]:
+        """Add all notes with a single addNotes call.
+
+        AnkiConnect answers with a note id per note, null for notes it could not
+        add, and puts the reasons in "error".
+        """
+        if not reverso_results:
+            return []
+        return await resilience.get_upstream("ankiconnect").call(
+            lambda: self._add_cards(reverso_results),
+            succeeded=lambda reports: not reports or any(report.added for report in reports),
+        )
+
+    async def _add_cards(self, reverso_results: List[reverso_agent.ReversoResult]) -> List[anki_agent.CardReport]:
+        answer = await self.request("addNotes", notes=[self.make_note(r) for r in reverso_results])
+        note_ids = answer.get("result")
+        error = answer.get("error")
+        if not isinstance(note_ids, list) or len(note_ids) != len(reverso_results):
+            note_ids = [None] * len(reverso_results)
+        errors = iter(_note_errors(error, note_ids.count(None)) or [])
+        reports = []
+        for reverso_result, note_id in zip(reverso_results, note_ids):
+            if note_id is not None:
+                reports.append(anki_agent.CardReport(en_word=reverso_result.en_word, added=True))
+                continue
+            note_error = next(errors, None)
+            if note_error is not None and DUPLICATE_ERROR in note_error:
+                reports.append(anki_agent.CardReport(en_word=reverso_result.en_word, added=True, already_added=True))
+            else:
+                reports.append(anki_agent.CardReport(
+                    en_word=reverso_result.en_word,
+                    added=False,
+                    error=note_error or str(error or "AnkiConnect did not add the note"),
+                ))
+        return reports
+
+    async def deck_notes(self) -> List[typing.Tuple[str, str]]:
+        """Front and back HTML of every note in the deck."""
+        note_ids = await self.invoke("findNotes", query=f'deck:"{self.deck_name}"')
+        notes = []
+        for start in range(0, len(note_ids), NOTES_INFO_CHUNK):
+            for info in await self.invoke("notesInfo", notes=note_ids[start:start + NOTES_INFO_CHUNK]):
+                fields = info.get("fields", {})
+                notes.append((fields.get("Front", {}).get("value", ""), fields.get("Back", {}).get("value", "")))
+        return notes
+
+    async def close(self) -> None:
+        await self._client.aclose()
@@ -0,0 +1,146 @@
+"""Browser lookups: in-page extraction against shipping the whole page to Python.
+
+    python -m ankinizer.benchmarks.extraction --rounds 20   # Chromium against the fake Reverso
+    python -m ankinizer.benchmarks.extraction --offline     # bytes only, no browser needed
+
+Both extraction modes run on the same loaded corpus page: "content" is
+page.content() and parse_result, "evaluate" is the in-page script and
+parse_extracted. Reported are the bytes each brings back over the Playwright
+pipe and the time from the loaded page to a ReversoResult; the two results
+must be equal or the benchmark fails. --offline takes the bytes from the
+saved pages, rebuilding the script's output with lxml; those are estimates
+of what the script would return, not measurements. The pages are the
+synthetic corpus of ankinizer.benchmarks.parsing, so neither mode's numbers
+reflect real Reverso pages.
+"""
+import argparse
+import asyncio
+import dataclasses
+import json
+import os
+import sys
+import time
+import typing
+from pathlib import Path
+
+import lxml.html
+
+from ankinizer import browser_pool
+from ankinizer import reverso_agent
+from ankinizer.benchmarks import fakes
+from ankinizer.benchmarks import parsing
+
+MODES = ("content", "evaluate")
+DEFAULT_ROUNDS = 10
+
+
+@dataclasses.dataclass
+class ExtractionResult:
+    page: str
+    mode: str
+    bytes: int
+    rounds: int
+    seconds: float
+
+    @property
+    def ms_per_lookup(self) -> float:
+        return self.seconds / self.rounds * 1e3 if self.rounds else 0.0
+
+
+def emulate_extract(html: str, limit: typing.Optional[int] = reverso_agent.MAX_USAGE_SAMPLES) -> typing.Dict[str, typing.Any]:
+    """What the in-page script returns for a page, built with lxml."""
+    root = lxml.html.document_fromstring(html)
+    examples = []
+    for example in reverso_agent._EXAMPLES(root):
+        if limit is not None and len(examples) >= limit:
+            break
+        en, ru = reverso_agent._EXAMPLE_SRC(example), reverso_agent._EXAMPLE_TRG(example)
+        if en and ru:
+            examples.append([
+                lxml.html.tostring(element, encoding="unicode", with_tail=False) for element in (en[0], ru[0])
+            ])
+    return {"terms": reverso_agent.parse_translations(html), "examples": examples}
+
+
+def payload_bytes(value: typing.Any) -> int:
+    """Size of value as the JSON Playwright sends it over its pipe."""
+    return len(json.dumps(value, ensure_ascii=False).encode())
+
+
+def run_offline(pages: typing.Sequence[parsing.Page]) -> typing.List[ExtractionResult]:
+    results = []
+    for page in pages:
+        results.append(ExtractionResult(page.name, "content", payload_bytes(page.html), 0, 0.0))
+        results.append(ExtractionResult(page.name, "evaluate", payload_bytes(emulate_extract(page.html)), 0, 0.0))
+    return results
+
+
+async def _extract(page: typing.Any, word: str, mode: str) -> typing.Tuple[reverso_agent.ReversoResult, int]:
+    if mode == "content":
+        content = await page.content()
+        return reverso_agent.parse_result(word, content), payload_bytes(content)
+    extracted = await page.evaluate(reverso_agent._EXTRACT_SCRIPT, reverso_agent.MAX_USAGE_SAMPLES)
+    return reverso_agent.parse_extracted(word, extracted), payload_bytes(extracted)
+
+
+async def run_browser(pages: typing.Sequence[parsing.Page], rounds: int) -> typing.Tuple[typing.List[ExtractionResult], typing.List[str]]:
+    """Results, and the pages where the two modes disagreed."""
+    results, mismatches = [], []
+    reverso = fakes.FakeReverso()
+    await reverso.start()
+    os.environ["ANKINIZER_REVERSO_URL"] = reverso.url
+    try:
+        async with browser_pool.BrowserPool(reverso_agent.get_pool_params(size=1)) as pool:
+            async with pool.acquire() as browser_page:
+                for page in pages:
+                    await reverso_agent._open_translation_page(browser_page, page.word)
+                    outputs = {}
+                    for mode in MODES:
+                        await _extract(browser_page, page.word, mode)  # warm up
+                        started = time.perf_counter()
+                        for _ in range(rounds):
+                            output, size = await _extract(browser_page, page.word, mode)
+                        results.append(ExtractionResult(page.name, mode, size, rounds, time.perf_counter() - started))
+                        outputs[mode] = output.to_dict()
+                    if outputs["content"] != outputs["evaluate"]:
+                        mismatches.append(page.name)
+    finally:
+        await reverso.stop()
+    return results, mismatches
+
+
+def format_table(results: typing.Sequence[ExtractionResult]) -> str:
+    lines = [f"{'page':<20} {'mode':<10} {'KiB':>10} {'ms/lookup':>10}"]
+    for r in results:
+        lines.append(f"{r.page:<20} {r.mode:<10} {r.bytes / 1024:>10.1f} {r.ms_per_lookup:>10.2f}")
+    return "\n".join(lines)
+
+
+def main(argv: typing.Optional[typing.Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--page", action="append", help="only these corpus pages (file stem), repeatable")
+    parser.add_argument("--rounds", type=int, default=DEFAULT_ROUNDS, help="extractions timed per page and mode")
+    parser.add_argument("--offline", action="store_true", help="only compare bytes, from the saved pages")
+    parser.add_argument("--json", type=Path, help="also write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    pages = parsing.load_corpus(args.page)
+    if not pages:
+        print(f"No pages found in {parsing.CORPUS_DIR}", file=sys.stderr)
+        return 1
+
+    mismatches: typing.List[str] = []
+    if args.offline:
+        results = run_offline(pages)
+    else:
+        results, mismatches = asyncio.run(run_browser(pages, args.rounds))
+    print(format_table(results))
+    if args.json:
+        args.json.write_text(json.dumps([dataclasses.asdict(r) for r in results], indent=2) + "\n")
+    for name in mismatches:
+        print(f"MISMATCH {name}: the modes extracted different results", file=sys.stderr)
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
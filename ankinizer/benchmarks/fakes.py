@@ -0,0 +1,353 @@
+"""Local stand-ins for Reverso Context, AnkiWeb and the Telegram Bot API.
+
+They are served by ankinizer.http_server so the bot can be driven end to end
+without the network; see ankinizer.benchmarks.load.
+"""
+import asyncio
+import collections
+import itertools
+import json
+import time
+import typing
+import urllib.parse
+from typing import Optional
+
+import httpx
+
+from ankinizer import anki_agent
+from ankinizer import http_server
+from ankinizer import reverso_agent
+from ankinizer.benchmarks import parsing
+
+JsonDict = typing.Dict[str, typing.Any]
+
+
+class FakeServer:
+    def __init__(self) -> None:
+        self.server = http_server.HttpServer()
+        self.add_routes()
+
+    def add_routes(self) -> None:
+        raise NotImplementedError
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.server.host}:{self.server.port}"
+
+    async def start(self) -> None:
+        await self.server.start()
+
+    async def stop(self) -> None:
+        await self.server.stop()
+
+
+class FakeReverso(FakeServer):
+    """Serves the synthetic corpus pages; words without a saved page get the template page."""
+
+    TEMPLATE_PAGE = "serendipity"
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.pages = {page.word: page.html for page in parsing.load_corpus()}
+        self.template = self.pages[self.TEMPLATE_PAGE]
+        self.requests = 0
+        super().__init__()
+
+    def add_routes(self) -> None:
+        self.server.route_prefix("GET", f"/translation/{reverso_agent.LANGUAGE_PAIR}/", self.translation)
+
+    async def translation(self, request: http_server.Request) -> http_server.Response:
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        word = urllib.parse.unquote(request.path.rsplit("/", 1)[1])
+        html = self.pages.get(word) or self.template.replace(self.TEMPLATE_PAGE, word)
+        return http_server.Response(body=html.encode(), content_type="text/html; charset=utf-8")
+
+
+_LOGIN_HTML = """<!DOCTYPE html>
+<html><body><main>
+<form onsubmit="document.cookie = 'ankiweb=1; path=/'; location = '/decks'; return false;">
+  <input type="text" aria-label="Email">
+  <input type="password" aria-label="Password">
+  <button type="submit">Log In</button>
+</form>
+</main></body></html>
+"""
+
+_DECKS_HTML = """<!DOCTYPE html>
+<html><body><main>
+<button onclick="document.getElementById('add').hidden = false">{deck}</button>
+<a id="add" href="/add" hidden>Add</a>
+</main></body></html>
+"""
+
+# Same shape as the real editor as far as anki_agent's locators are concerned:
+# one div per field holding a label div and a contenteditable div
+_ADD_HTML = """<!DOCTYPE html>
+<html><body><main>
+<div><div>Front</div><div class="field" contenteditable="true"></div></div>
+<div><div>Back</div><div class="field" contenteditable="true"></div></div>
+<button id="add-button">Add</button>
+<p id="toast"></p>
+<script>
+document.getElementById('add-button').onclick = async () => {
+  const [front, back] = document.querySelectorAll('.field');
+  await fetch('/add/note', {method: 'POST', body: JSON.stringify({front: front.innerHTML, back: back.innerHTML})});
+  front.innerHTML = '';
+  back.innerHTML = '';
+  document.getElementById('toast').textContent = 'Added';
+};
+</script>
+</main></body></html>
+"""
+
+
+class FakeAnkiWeb(FakeServer):
+    """The AnkiWeb login, deck list and Add editor, plus an AnkiConnect endpoint at /.
+
+    AnkiConnect supports the actions the bot uses: addNote(s), version, and
+    findNotes/notesInfo, which list every note regardless of the query.
+    """
+
+    def __init__(self, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.notes: typing.List[JsonDict] = []
+        super().__init__()
+
+    def add_routes(self) -> None:
+        self.server.route("GET", "/account/login", self.login)
+        self.server.route("GET", "/decks", self.decks)
+        self.server.route("GET", "/add", self.add_editor)
+        self.server.route("POST", "/add/note", self.add_note)
+        self.server.route("POST", "/", self.anki_connect)
+
+    @staticmethod
+    def _html(text: str) -> http_server.Response:
+        return http_server.Response(body=text.encode(), content_type="text/html; charset=utf-8")
+
+    async def login(self, request: http_server.Request) -> http_server.Response:
+        return self._html(_LOGIN_HTML)
+
+    async def decks(self, request: http_server.Request) -> http_server.Response:
+        if "ankiweb=1" not in request.headers.get("cookie", ""):
+            return http_server.Response(status=302, headers={"Location": "/account/login"})
+        return self._html(_DECKS_HTML.format(deck=anki_agent.DECK_NAME))
+
+    async def add_editor(self, request: http_server.Request) -> http_server.Response:
+        return self._html(_ADD_HTML)
+
+    async def add_note(self, request: http_server.Request) -> http_server.Response:
+        await asyncio.sleep(self.latency)
+        self.notes.append(json.loads(request.body))
+        return http_server.Response(body=b"{}", content_type="application/json")
+
+    async def anki_connect(self, request: http_server.Request) -> http_server.Response:
+        payload = json.loads(request.body)
+        if payload["action"] in ("version", "findNotes", "notesInfo"):
+            return self._anki_connect_answer(self._anki_connect_query(payload))
+        notes = [payload["params"]["note"]] if payload["action"] == "addNote" else payload["params"].get("notes", [])
+        await asyncio.sleep(self.latency)
+        self.notes.extend(notes)
+        ids = [len(self.notes) - len(notes) + i for i in range(len(notes))]
+        result: typing.Any = ids[0] if payload["action"] == "addNote" else ids
+        return self._anki_connect_answer(result)
+
+    def _anki_connect_query(self, payload: JsonDict) -> typing.Any:
+        if payload["action"] == "version":
+            return 6
+        if payload["action"] == "findNotes":
+            return list(range(len(self.notes)))
+        # Notes added through the editor are {front, back}, through AnkiConnect {fields: {...}}
+        return [
+            {"noteId": i, "fields": {
+                name: {"value": note.get("fields", {}).get(name, note.get(name.lower(), "")), "order": order}
+                for order, name in enumerate(("Front", "Back"))
+            }}
+            for i, note in ((i, self.notes[i]) for i in payload["params"]["notes"])
+        ]
+
+    @staticmethod
+    def _anki_connect_answer(result: typing.Any) -> http_server.Response:
+        return http_server.Response(body=json.dumps({"result": result, "error": None}).encode(), content_type="application/json")
+
+
+class FakeTelegram(FakeServer):
+    """A Bot API server whose updates come from simulated users instead of Telegram.
+
+    Updates are handed out through getUpdates, or once the bot has called
+    setWebhook, posted to its webhook with the secret token like Telegram does.
+    The bot's messages are recorded per chat; an edit changes the recorded
+    message in place, so waiters see it the same way a user would.
+    """
+
+    BOT_USER = {"id": 1, "is_bot": True, "first_name": "Ankinizer", "username": "ankinizer_bot"}
+    MAX_POLL_TIMEOUT = 5.0
+
+    def __init__(self, token: str = "123:fake") -> None:
+        self.token = token
+        self.chats: typing.Dict[int, typing.List[JsonDict]] = {}
+        self._updates: typing.List[JsonDict] = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._callback_ids = itertools.count(1)
+        self._changed = asyncio.Condition()
+        self._closing = False
+        self.calls: typing.Counter[str] = collections.Counter()
+        self.webhook_url = ""
+        self.webhook_secret = ""
+        self._webhook_client: Optional[httpx.AsyncClient] = None
+        self.methods: typing.Dict[str, typing.Callable[[JsonDict], typing.Awaitable[typing.Any]]] = {
+            "getMe": self.get_me,
+            "getUpdates": self.get_updates,
+            "sendMessage": self.send_message,
+            "editMessageText": self.edit_message_text,
+            "setWebhook": self.set_webhook,
+            "deleteWebhook": self.delete_webhook,
+        }
+        super().__init__()
+
+    @property
+    def base_url(self) -> str:
+        """What to pass as the bot's base_url; the token is appended by the client."""
+        return f"{self.url}/bot"
+
+    def add_routes(self) -> None:
+        self.server.route_prefix("POST", f"/bot{self.token}/", self.dispatch)
+
+    async def dispatch(self, request: http_server.Request) -> http_server.Response:
+        method = request.path.rsplit("/", 1)[1]
+        self.calls[method] += 1
+        if request.headers.get("content-type", "").startswith("application/json"):
+            params = json.loads(request.body or b"{}")
+        else:
+            params = {k: v[0] for k, v in urllib.parse.parse_qs(request.body.decode()).items()}
+        handler = self.methods.get(method)
+        result = await handler(params) if handler is not None else True
+        return http_server.Response(body=json.dumps({"ok": True, "result": result}).encode(), content_type="application/json")
+
+    async def stop(self) -> None:
+        # Answer pending long polls so their connections can close
+        async with self._changed:
+            self._closing = True
+            self._changed.notify_all()
+        if self._webhook_client is not None:
+            await self._webhook_client.aclose()
+            self._webhook_client = None
+        await super().stop()
+
+    # Bot API methods
+
+    async def get_me(self, params: JsonDict) -> JsonDict:
+        return self.BOT_USER
+
+    async def get_updates(self, params: JsonDict) -> typing.List[JsonDict]:
+        offset = int(params.get("offset", 0))
+        timeout = min(float(params.get("timeout", 0)), self.MAX_POLL_TIMEOUT)
+        async with self._changed:
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+            if not self._updates and timeout:
+                try:
+                    await asyncio.wait_for(self._changed.wait_for(lambda: bool(self._updates) or self._closing), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            return list(self._updates)
+
+    async def set_webhook(self, params: JsonDict) -> bool:
+        self.webhook_url = params["url"]
+        self.webhook_secret = params.get("secret_token", "")
+        return True
+
+    async def delete_webhook(self, params: JsonDict) -> bool:
+        self.webhook_url = self.webhook_secret = ""
+        return True
+
+    async def send_message(self, params: JsonDict) -> JsonDict:
+        chat_id = int(params["chat_id"])
+        message = self._message(chat_id, self.BOT_USER, params["text"])
+        if params.get("reply_markup"):
+            message["reply_markup"] = self._json(params["reply_markup"])
+        async with self._changed:
+            self.chats.setdefault(chat_id, []).append(message)
+            self._changed.notify_all()
+        return message
+
+    async def edit_message_text(self, params: JsonDict) -> JsonDict:
+        chat_id, message_id = int(params["chat_id"]), int(params["message_id"])
+        async with self._changed:
+            message = next(m for m in self.chats.get(chat_id, []) if m["message_id"] == message_id)
+            message["text"] = params["text"]
+            message.pop("reply_markup", None)
+            if params.get("reply_markup"):
+                message["reply_markup"] = self._json(params["reply_markup"])
+            self._changed.notify_all()
+        return message
+
+    # Simulated users
+
+    async def send_text(self, chat_id: int, text: str) -> None:
+        await self._push({"message": self._message(chat_id, self._user(chat_id), text)})
+
+    async def press_button(self, chat_id: int, message: JsonDict, callback_data: str) -> None:
+        await self._push({"callback_query": {
+            "id": str(next(self._callback_ids)),
+            "from": self._user(chat_id),
+            "chat_instance": str(chat_id),
+            "message": message,
+            "data": callback_data,
+        }})
+
+    async def wait_for_message(
+        self,
+        chat_id: int,
+        predicate: typing.Callable[[JsonDict], bool],
+        start: int = 0,
+        timeout: Optional[float] = None,
+    ) -> typing.Tuple[int, JsonDict]:
+        """The first bot message in the chat from index start on that satisfies predicate."""
+        found: typing.List[typing.Tuple[int, JsonDict]] = []
+
+        def check() -> bool:
+            messages = self.chats.get(chat_id, [])
+            found[:] = [(i, m) for i, m in enumerate(messages[start:], start) if predicate(m)][:1]
+            return bool(found)
+
+        async with self._changed:
+            await asyncio.wait_for(self._changed.wait_for(check), timeout)
+        return found[0]
+
+    def message_count(self, chat_id: int) -> int:
+        return len(self.chats.get(chat_id, []))
+
+    async def _push(self, update: JsonDict) -> None:
+        update = {"update_id": next(self._update_ids), **update}
+        if self.webhook_url:
+            response = await self.post_to_webhook(update, self.webhook_secret)
+            response.raise_for_status()
+            return
+        async with self._changed:
+            self._updates.append(update)
+            self._changed.notify_all()
+
+    async def post_to_webhook(self, update: JsonDict, secret: str) -> httpx.Response:
+        if self._webhook_client is None:
+            self._webhook_client = httpx.AsyncClient()
+        return await self._webhook_client.post(
+            self.webhook_url, json=update, headers={"X-Telegram-Bot-Api-Secret-Token": secret}
+        )
+
+    def _message(self, chat_id: int, sender: JsonDict, text: str) -> JsonDict:
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": sender,
+            "text": text,
+        }
+
+    @staticmethod
+    def _user(chat_id: int) -> JsonDict:
+        return {"id": chat_id, "is_bot": False, "first_name": f"User {chat_id}"}
+
+    @staticmethod
+    def _json(value: typing.Any) -> typing.Any:
+        return json.loads(value) if isinstance(value, str) else value
@@ -0,0 +1,319 @@
+"""End-to-end load test: the real bot handlers against local fake Reverso, AnkiWeb and Telegram.
+
+    python -m ankinizer.benchmarks.load --users 20 --words 5
+    python -m ankinizer.benchmarks.load --users 50 --anki-backend ankiweb --reverso-mode browser
+
+Every simulated user sends a word, waits for the result with the accept
+keyboard, presses OK and waits until the card is reported added, then moves
+on to its next word. Latency of both steps is reported as p50/p95/p99, along
+with throughput and the peak RSS of this process and its children (the
+browsers). The fakes run in the same process and are included in the RSS.
+"""
+import argparse
+import asyncio
+import dataclasses
+import json
+import math
+import os
+import resource
+import sys
+import tempfile
+import time
+import typing
+from pathlib import Path
+from typing import Optional
+
+from ankinizer import tgram
+from ankinizer import webhook
+from ankinizer.benchmarks import fakes
+
+STAGES = ("lookup", "add")
+DEFAULT_STEP_TIMEOUT = 60.0
+
+
+@dataclasses.dataclass
+class LoadParams:
+    users: int = 10
+    words_per_user: int = 3
+    reverso_latency: float = 0.05
+    anki_latency: float = 0.05
+    anki_backend: str = "ankiconnect"
+    reverso_mode: str = "http"
+    telegram_mode: str = "polling"
+    cache: bool = False
+    step_timeout: float = DEFAULT_STEP_TIMEOUT
+
+
+@dataclasses.dataclass
+class StageStats:
+    count: int
+    errors: int
+    p50: float
+    p95: float
+    p99: float
+    max: float
+
+
+@dataclasses.dataclass
+class LoadReport:
+    params: LoadParams
+    seconds: float
+    completed: int
+    stages: typing.Dict[str, StageStats]
+    peak_rss_bytes: int
+    bot_api_calls: typing.Dict[str, int]
+
+    @property
+    def throughput(self) -> float:
+        """Words taken from message to added card per second."""
+        return self.completed / self.seconds if self.seconds else 0.0
+
+    def format(self) -> str:
+        lines = [
+            f"users={self.params.users} words/user={self.params.words_per_user} "
+            f"backend={self.params.anki_backend} reverso={self.params.reverso_mode} telegram={self.params.telegram_mode}",
+            f"{'stage':<8} {'count':>6} {'errors':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}",
+        ]
+        for name, s in self.stages.items():
+            lines.append(
+                f"{name:<8} {s.count:>6} {s.errors:>6} {s.p50 * 1000:>9.1f} {s.p95 * 1000:>9.1f} "
+                f"{s.p99 * 1000:>9.1f} {s.max * 1000:>9.1f}"
+            )
+        lines.append(f"throughput: {self.throughput:.2f} words/s over {self.seconds:.1f}s")
+        lines.append(f"peak RSS: {self.peak_rss_bytes / 2 ** 20:.1f} MiB")
+        words = self.params.users * self.params.words_per_user
+        sent = sum(n for method, n in self.bot_api_calls.items() if method not in ("getUpdates", "getMe", "setWebhook", "deleteWebhook"))
+        lines.append(f"bot API calls: {sent / words:.1f} per word {dict(sorted(self.bot_api_calls.items()))}")
+        return "\n".join(lines)
+
+
+def percentile(values: typing.Sequence[float], q: float) -> float:
+    """Nearest-rank percentile, q in [0, 100]."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, math.ceil(q / 100 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+def stage_stats(latencies: typing.Sequence[float], errors: int) -> StageStats:
+    return StageStats(
+        count=len(latencies),
+        errors=errors,
+        p50=percentile(latencies, 50),
+        p95=percentile(latencies, 95),
+        p99=percentile(latencies, 99),
+        max=max(latencies, default=0.0),
+    )
+
+
+class RssSampler:
+    """Peak resident memory of this process and all its descendants, sampled from /proc."""
+
+    def __init__(self, interval: float = 0.1) -> None:
+        self.interval = interval
+        self.peak = 0
+        self._task: Optional[asyncio.Task] = None
+        self._page_size = os.sysconf("SC_PAGE_SIZE")
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> int:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.sample()
+        return self.peak
+
+    async def _run(self) -> None:
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+    def sample(self) -> None:
+        self.peak = max(self.peak, self.tree_rss())
+
+    def tree_rss(self) -> int:
+        proc = Path("/proc")
+        if not proc.exists():
+            # No /proc (macOS): the peak of this process alone is the best we get
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        children: typing.Dict[int, typing.List[int]] = {}
+        for stat in proc.glob("[0-9]*/stat"):
+            try:
+                fields = stat.read_text().rsplit(")", 1)[1].split()
+            except OSError:
+                continue
+            children.setdefault(int(fields[1]), []).append(int(stat.parent.name))
+        total, pending = 0, [os.getpid()]
+        while pending:
+            pid = pending.pop()
+            pending.extend(children.get(pid, []))
+            try:
+                total += int((proc / str(pid) / "statm").read_text().split()[1]) * self._page_size
+            except OSError:
+                continue
+        return total
+
+
+def configure_env(params: LoadParams, telegram: fakes.FakeTelegram, reverso: fakes.FakeReverso, anki: fakes.FakeAnkiWeb, data_dir: str) -> None:
+    os.environ.update({
+        "ANKINIZER_REVERSO_URL": reverso.url,
+        "ANKINIZER_REVERSO_MODE": params.reverso_mode,
+        "ANKINIZER_REVERSO_CACHE": "1" if params.cache else "0",
+        "ANKINIZER_ANKIWEB_URL": anki.url,
+        "ANKINIZER_ANKICONNECT_URL": anki.url,
+        "ANKINIZER_ANKI_BACKEND": params.anki_backend,
+        "ANKINIZER_DATA_DIR": data_dir,
+        "ANKINIZER_METRICS_PORT": "0",
+        # Measure the bot, not the limits it puts on the real sites
+        "ANKINIZER_REVERSO_RATE": "0",
+        "ANKINIZER_ANKIWEB_RATE": "0",
+        "ANKI_USERNAME": "load@example.com",
+        "ANKI_PASSWORD": "load",
+    })
+
+
+def _is_add_finished(message: fakes.JsonDict) -> bool:
+    text = message["text"]
+    return text.startswith(("Card added", "Error")) or (text.startswith("Card for") and "Anki" in text)
+
+
+def _accept_button(message: fakes.JsonDict) -> Optional[str]:
+    for row in message.get("reply_markup", {}).get("inline_keyboard", []):
+        for button in row:
+            if button.get("callback_data", "").startswith(tgram.AcceptBoth.key):
+                return button["callback_data"]
+    return None
+
+
+async def simulate_user(
+    telegram: fakes.FakeTelegram,
+    chat_id: int,
+    words: typing.Sequence[str],
+    timeout: float,
+    latencies: typing.Dict[str, typing.List[float]],
+    errors: typing.Dict[str, int],
+) -> int:
+    """Run one user through its words; returns how many ended with a card added."""
+    completed = 0
+    for word in words:
+        stage = "lookup"
+        try:
+            cursor = telegram.message_count(chat_id)
+            started = time.perf_counter()
+            await telegram.send_text(chat_id, word)
+            index, message = await telegram.wait_for_message(chat_id, lambda m: _accept_button(m) is not None, cursor, timeout)
+            latencies[stage].append(time.perf_counter() - started)
+
+            stage = "add"
+            cursor = index + 1
+            started = time.perf_counter()
+            await telegram.press_button(chat_id, message, typing.cast(str, _accept_button(message)))
+            _, reply = await telegram.wait_for_message(chat_id, _is_add_finished, cursor, timeout)
+            if reply["text"].startswith("Error"):
+                errors[stage] += 1
+                continue
+            latencies[stage].append(time.perf_counter() - started)
+            completed += 1
+        except asyncio.TimeoutError:
+            errors[stage] += 1
+    return completed
+
+
+async def run(params: LoadParams) -> LoadReport:
+    telegram, reverso, anki = fakes.FakeTelegram(), fakes.FakeReverso(params.reverso_latency), fakes.FakeAnkiWeb(params.anki_latency)
+    for fake in (telegram, reverso, anki):
+        await fake.start()
+    sampler = RssSampler()
+    sampler.start()
+    with tempfile.TemporaryDirectory(prefix="ankinizer-load-") as data_dir:
+        configure_env(params, telegram, reverso, anki, data_dir)
+        application = tgram.build_application(telegram.token, base_url=telegram.base_url)
+        await application.initialize()
+        await tgram.post_init(application)
+        await application.start()
+        assert application.updater is not None
+        webhook_server = None
+        if params.telegram_mode == "webhook":
+            webhook_server = webhook.WebhookServer(application, webhook.WebhookConfig(listen="127.0.0.1", port=0))
+            await webhook_server.start()
+        else:
+            await application.updater.start_polling(poll_interval=0, timeout=1)
+
+        latencies: typing.Dict[str, typing.List[float]] = {stage: [] for stage in STAGES}
+        errors = {stage: 0 for stage in STAGES}
+        started = time.perf_counter()
+        try:
+            done = await asyncio.gather(*(
+                simulate_user(
+                    telegram,
+                    chat_id=1000 + user,
+                    words=[f"word{user}x{i}" for i in range(params.words_per_user)],
+                    timeout=params.step_timeout,
+                    latencies=latencies,
+                    errors=errors,
+                )
+                for user in range(params.users)
+            ))
+            seconds = time.perf_counter() - started
+        finally:
+            if webhook_server is not None:
+                await webhook_server.stop()
+            else:
+                await application.updater.stop()
+            await application.stop()
+            await tgram.post_shutdown(application)
+            await application.shutdown()
+            peak_rss = await sampler.stop()
+            for fake in (telegram, reverso, anki):
+                await fake.stop()
+
+    return LoadReport(
+        params=params,
+        seconds=seconds,
+        completed=sum(done),
+        stages={stage: stage_stats(latencies[stage], errors[stage]) for stage in STAGES},
+        peak_rss_bytes=peak_rss,
+        bot_api_calls=dict(telegram.calls),
+    )
+
+
+def main(argv: Optional[typing.Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=LoadParams.users, help="simulated users running at the same time")
+    parser.add_argument("--words", type=int, default=LoadParams.words_per_user, help="words each user looks up and adds")
+    parser.add_argument("--reverso-latency", type=float, default=LoadParams.reverso_latency, help="seconds the fake Reverso takes per page")
+    parser.add_argument("--anki-latency", type=float, default=LoadParams.anki_latency, help="seconds the fake Anki takes per note")
+    parser.add_argument("--anki-backend", choices=("ankiconnect", "ankiweb"), default=LoadParams.anki_backend)
+    parser.add_argument("--reverso-mode", choices=("http", "browser"), default=LoadParams.reverso_mode)
+    parser.add_argument("--telegram-mode", choices=webhook.TELEGRAM_MODES, default=LoadParams.telegram_mode)
+    parser.add_argument("--cache", action="store_true", help="keep the Reverso lookup cache on")
+    parser.add_argument("--step-timeout", type=float, default=DEFAULT_STEP_TIMEOUT, help="give up on a lookup or add after this many seconds")
+    parser.add_argument("--json", type=Path, help="also write the report as JSON to this file")
+    args = parser.parse_args(argv)
+
+    params = LoadParams(
+        users=args.users,
+        words_per_user=args.words,
+        reverso_latency=args.reverso_latency,
+        anki_latency=args.anki_latency,
+        anki_backend=args.anki_backend,
+        reverso_mode=args.reverso_mode,
+        telegram_mode=args.telegram_mode,
+        cache=args.cache,
+        step_timeout=args.step_timeout,
+    )
+    report = asyncio.run(run(params))
+    print(report.format())
+    if args.json:
+        args.json.write_text(json.dumps(
+            {**dataclasses.asdict(report), "throughput": report.throughput}, indent=2
+        ) + "\n")
+    failed = sum(s.errors for s in report.stages.values())
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+"""Offline benchmark of the Reverso page parsers over a corpus of saved pages.
+
+    python -m ankinizer.benchmarks.parsing                    # check goldens, then benchmark
+    python -m ankinizer.benchmarks.parsing --check            # only check goldens
+    python -m ankinizer.benchmarks.parsing --update-goldens   # after an intended output change
+
+Each page in the corpus has a golden file next to it with the expected parser
+output and card HTML, so a parser optimization can be measured and checked
+for regressions without touching the network.
+
+The corpus is synthetic: the pages in tests/data/reverso are hand-written
+mock-ups with the element structure the parsers select on, not captures of
+Reverso Context. Real pages are larger and carry far more markup, scripts and
+ads, so the timings and sizes measured here compare parsers against each
+other but don't predict production numbers.
+"""
+import argparse
+import dataclasses
+import json
+import sys
+import time
+import tracemalloc
+import typing
+from pathlib import Path
+
+import lxml.html
+
+from ankinizer import anki_agent
+from ankinizer import reverso_agent
+
+CORPUS_DIR = Path(__file__).resolve().parent.parent / "tests" / "data" / "reverso"
+GOLDEN_SUFFIX = ".golden.json"
+DEFAULT_MIN_TIME = 0.2
+
+
+@dataclasses.dataclass
+class Page:
+    name: str
+    word: str
+    html: str
+
+    @property
+    def golden_path(self) -> Path:
+        return CORPUS_DIR / f"{self.name}{GOLDEN_SUFFIX}"
+
+
+@dataclasses.dataclass
+class BenchResult:
+    case: str
+    page: str
+    calls: int
+    seconds: float
+    peak_bytes: int
+    retained_bytes: int
+
+    @property
+    def calls_per_second(self) -> float:
+        return self.calls / self.seconds if self.seconds else float("inf")
+
+    @property
+    def us_per_call(self) -> float:
+        return self.seconds / self.calls * 1e6
+
+
+def load_corpus(names: typing.Optional[typing.Sequence[str]] = None) -> typing.List[Page]:
+    """Saved pages are named after the looked up word, with spaces as underscores."""
+    pages = []
+    for path in sorted(CORPUS_DIR.glob("*.html")):
+        if names and path.stem not in names:
+            continue
+        pages.append(Page(name=path.stem, word=path.stem.replace("_", " "), html=path.read_text()))
+    return pages
+
+
+def compute_golden(page: Page) -> typing.Dict[str, typing.Any]:
+    result = reverso_agent.parse_result(page.word, page.html)
+    return {
+        "translations": reverso_agent.parse_translations(page.html),
+        "examples": reverso_agent.parse_examples(page.html),
+        "front_html": anki_agent.format_front_html(result),
+        "back_html": anki_agent.format_back_html(result),
+    }
+
+
+def check_golden(page: Page) -> typing.List[str]:
+    """Names of the golden fields the current parsers disagree with."""
+    if not page.golden_path.exists():
+        return [f"missing {page.golden_path.name}"]
+    expected = json.loads(page.golden_path.read_text())
+    actual = compute_golden(page)
+    return [key for key in expected.keys() | actual.keys() if expected.get(key) != actual.get(key)]
+
+
+def write_golden(page: Page) -> None:
+    page.golden_path.write_text(json.dumps(compute_golden(page), ensure_ascii=False, indent=2) + "\n")
+
+
+def raw_example_fragments(html: str) -> typing.List[str]:
+    """The example sentences as they appear in the page, before clean_html."""
+    root = lxml.html.document_fromstring(html)
+    return [
+        lxml.html.tostring(element, encoding="unicode", with_tail=False)
+        for element in root.xpath(
+            "//*[@id='examples-content']//*[contains(concat(' ', @class, ' '), ' example ')]"
+            "//*[contains(concat(' ', @class, ' '), ' text ')]"
+        )
+    ]
+
+
+def make_cases(page: Page) -> typing.Dict[str, typing.Callable[[], typing.Any]]:
+    html = page.html
+    fragments = raw_example_fragments(html)
+    cleaned = [reverso_agent.clean_html(fragment) for fragment in fragments]
+    result = reverso_agent.parse_result(page.word, html)
+    return {
+        "parse_translations": lambda: reverso_agent.parse_translations(html),
+        "parse_examples": lambda: reverso_agent.parse_examples(html),
+        "parse_result": lambda: reverso_agent.parse_result(page.word, html),
+        "clean_html": lambda: [reverso_agent.clean_html(fragment) for fragment in fragments],
+        "replace_em_tags": lambda: [reverso_agent.replace_em_tags(text) for text in cleaned],
+        "format_front_html": lambda: anki_agent.format_front_html(result),
+        "format_back_html": lambda: anki_agent.format_back_html(result),
+    }
+
+
+def measure(case: str, page: str, fn: typing.Callable[[], typing.Any], min_time: float = DEFAULT_MIN_TIME) -> BenchResult:
+    """Time fn until min_time has passed, then trace the memory of one more call."""
+    fn()  # warm up caches and lazy imports
+    calls, started = 0, time.perf_counter()
+    while True:
+        fn()
+        calls += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time:
+            break
+
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        output = fn()
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del output
+    return BenchResult(case=case, page=page, calls=calls, seconds=elapsed, peak_bytes=peak - before, retained_bytes=after - before)
+
+
+def run(pages: typing.Sequence[Page], cases: typing.Optional[typing.Sequence[str]] = None, min_time: float = DEFAULT_MIN_TIME) -> typing.List[BenchResult]:
+    results = []
+    for page in pages:
+        for case, fn in make_cases(page).items():
+            if cases and case not in cases:
+                continue
+            results.append(measure(case, page.name, fn, min_time))
+    return results
+
+
+def format_table(results: typing.Sequence[BenchResult]) -> str:
+    lines = [f"{'page':<20} {'case':<20} {'calls/s':>12} {'us/call':>10} {'peak KiB':>10} {'kept KiB':>10}"]
+    for r in results:
+        lines.append(
+            f"{r.page:<20} {r.case:<20} {r.calls_per_second:>12.1f} {r.us_per_call:>10.1f} "
+            f"{r.peak_bytes / 1024:>10.1f} {r.retained_bytes / 1024:>10.1f}"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: typing.Optional[typing.Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--page", action="append", help="only these corpus pages (file stem), repeatable")
+    parser.add_argument("--case", action="append", help="only these functions, repeatable")
+    parser.add_argument("--min-time", type=float, default=DEFAULT_MIN_TIME, help="seconds to spend on each case")
+    parser.add_argument("--json", type=Path, help="also write the results as JSON to this file")
+    parser.add_argument("--check", action="store_true", help="only check the golden files")
+    parser.add_argument("--update-goldens", action="store_true", help="rewrite the golden files from the current parsers")
+    args = parser.parse_args(argv)
+
+    pages = load_corpus(args.page)
+    if not pages:
+        print(f"No pages found in {CORPUS_DIR}", file=sys.stderr)
+        return 1
+
+    if args.update_goldens:
+        for page in pages:
+            write_golden(page)
+            print(f"Wrote {page.golden_path}")
+        return 0
+
+    failed = False
+    for page in pages:
+        mismatches = check_golden(page)
+        if mismatches:
+            failed = True
+            print(f"GOLDEN MISMATCH {page.name}: {', '.join(sorted(mismatches))}", file=sys.stderr)
+    if failed or args.check:
+        return int(failed)
+
+    results = run(pages, args.case, args.min_time)
+    print(format_table(results))
+    if args.json:
+        args.json.write_text(json.dumps([dataclasses.asdict(r) for r in results], indent=2) + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,280 @@
+from __future__ import annotations
+
+import asyncio
+import collections
+import contextlib
+import dataclasses
+import logging
+import typing
+from typing import Optional
+
+from ankinizer import chromium_watchdog
+from ankinizer import env
+from ankinizer import metrics
+
+if typing.TYPE_CHECKING:
+    import playwright.async_api
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 2
+
+
+@dataclasses.dataclass
+class PoolParams:
+    size: int = DEFAULT_POOL_SIZE
+    # How the browser is labelled in the watchdog's metrics
+    name: str = "pool"
+    headless: bool = True
+    slow_mo: int = 0
+    launch_args: typing.List[str] = dataclasses.field(default_factory=list)
+    context_options: typing.Dict[str, typing.Any] = dataclasses.field(default_factory=dict)
+    page_headers: typing.Dict[str, str] = dataclasses.field(default_factory=dict)
+    # Run once on every new context, e.g. to install request routing for its whole life
+    setup_context: Optional[typing.Callable[[playwright.async_api.BrowserContext], typing.Awaitable[None]]] = None
+
+
+@dataclasses.dataclass
+class _Slot:
+    context: playwright.async_api.BrowserContext
+    page: playwright.async_api.Page
+    generation: int
+
+
+class BrowserPool:
+    """One long-lived Chromium with a bounded set of ready context/page slots.
+
+    Lookups borrow a page with ``acquire()`` and hand it back when done, so the
+    driver start and browser launch are paid once per process instead of once
+    per word. A crashed browser is relaunched on the next borrow. Once the
+    watchdog finds the browser due for recycling, the next borrow launches a
+    replacement and new pages come from it only; the old browser drains and is
+    closed when its last borrowed page comes back.
+    """
+
+    def __init__(self, params: Optional[PoolParams] = None) -> None:
+        self.params = params or PoolParams()
+        self._playwright: Optional[playwright.async_api.Playwright] = None
+        self._browser: Optional[playwright.async_api.Browser] = None
+        self._tracked: Optional[chromium_watchdog.TrackedBrowser] = None
+        self._generation = 0
+        # Pages out, by the generation of the browser they belong to
+        self._borrowed: typing.Counter[int] = collections.Counter()
+        # Browsers replaced by a recycle while pages were out, by generation
+        self._draining: typing.Dict[int, typing.Tuple[playwright.async_api.Browser, Optional[chromium_watchdog.TrackedBrowser]]] = {}
+        # Browsers being closed on purpose, whose disconnect is no news
+        self._retired: typing.Set[playwright.async_api.Browser] = set()
+        self._idle: typing.List[_Slot] = []
+        self._semaphore = asyncio.Semaphore(self.params.size)
+        self._launch_lock = asyncio.Lock()
+        self._closed = False
+
+    async def __aenter__(self) -> "BrowserPool":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info: typing.Any) -> None:
+        await self.close()
+
+    async def start(self) -> None:
+        import playwright.async_api
+
+        logger.info(f"Starting browser pool: {self.params.size=}")
+        self._closed = False
+        self._playwright = await playwright.async_api.async_playwright().start()
+        await self._ensure_browser()
+        for _ in range(self.params.size):
+            self._idle.append(await self._new_slot())
+        logger.info("Browser pool is ready")
+
+    async def close(self) -> None:
+        self._closed = True
+        idle, self._idle = self._idle, []
+        for slot in idle:
+            await self._close_slot(slot)
+        if self._browser is not None:
+            await self._close_browser(self._browser)
+            self._browser = None
+        chromium_watchdog.closed(self._tracked)
+        self._tracked = None
+        for generation in list(self._draining):
+            await self._close_drained(generation)
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+        logger.info("Browser pool closed")
+
+    def is_healthy(self) -> bool:
+        return self._browser is not None and self._browser.is_connected()
+
+    async def health_check(self) -> bool:
+        """Relaunch the browser if it died; returns whether it was healthy."""
+        if self.is_healthy():
+            return True
+        logger.warning("Browser pool is unhealthy, restarting browser")
+        await self._ensure_browser()
+        return False
+
+    async def restart(self) -> None:
+        """Throw away the current browser and all idle slots and launch afresh."""
+        async with self._launch_lock:
+            await self._relaunch()
+
+    @contextlib.asynccontextmanager
+    async def acquire(self) -> typing.AsyncIterator[playwright.async_api.Page]:
+        if self._closed or self._playwright is None:
+            raise RuntimeError("Browser pool is not running")
+        async with self._semaphore:
+            slot = await self._take_slot()
+            self._borrowed[slot.generation] += 1
+            try:
+                yield slot.page
+            except BaseException:
+                # The page may be mid-navigation or stuck; don't hand it to the next lookup
+                await self._close_slot(slot)
+                raise
+            finally:
+                self._borrowed[slot.generation] -= 1
+                if self._tracked is not None and slot.generation == self._generation:
+                    self._tracked.page_done()
+                if not self._borrowed[slot.generation]:
+                    del self._borrowed[slot.generation]
+                    if slot.generation in self._draining:
+                        await self._close_drained(slot.generation)
+            await self._return_slot(slot)
+
+    async def _take_slot(self) -> _Slot:
+        await self._ensure_browser()
+        if self._recycle_due():
+            async with self._launch_lock:
+                if self._recycle_due():
+                    await self._recycle()
+        while self._idle:
+            slot = self._idle.pop()
+            if self._slot_is_usable(slot):
+                return slot
+            await self._close_slot(slot)
+        return await self._new_slot()
+
+    async def _return_slot(self, slot: _Slot) -> None:
+        if self._closed or not self._slot_is_usable(slot):
+            asyncio.ensure_future(self._close_slot(slot))
+            return
+        # Stop whatever the page is still loading before it idles until the next lookup
+        try:
+            await slot.page.goto("about:blank")
+        except Exception:
+            await self._close_slot(slot)
+            return
+        self._idle.append(slot)
+
+    def _slot_is_usable(self, slot: _Slot) -> bool:
+        return (
+            slot.generation == self._generation
+            and self.is_healthy()
+            and not slot.page.is_closed()
+        )
+
+    def _recycle_due(self) -> bool:
+        return self._tracked is not None and self._tracked.recycle_due
+
+    async def _ensure_browser(self) -> None:
+        if self.is_healthy():
+            return
+        async with self._launch_lock:
+            if not self.is_healthy():
+                await self._relaunch()
+
+    async def _recycle(self) -> None:
+        """Launch a replacement browser; the old one is closed once none of its pages is out."""
+        assert self._browser is not None
+        generation = self._generation
+        self._draining[generation] = (self._browser, self._tracked)
+        self._browser, self._tracked = None, None
+        await self._relaunch()
+        if not self._borrowed[generation]:
+            await self._close_drained(generation)
+        else:
+            logger.info(f"Draining browser {generation}, {self._borrowed[generation]} pages still out")
+
+    async def _close_drained(self, generation: int) -> None:
+        browser, tracked = self._draining.pop(generation)
+        await self._close_browser(browser)
+        chromium_watchdog.closed(tracked)
+
+    async def _close_browser(self, browser: playwright.async_api.Browser) -> None:
+        self._retired.add(browser)
+        with contextlib.suppress(Exception):
+            await browser.close()
+
+    async def _relaunch(self) -> None:
+        assert self._playwright is not None
+        if self._browser is not None:
+            logger.warning("Relaunching browser")
+            await self._close_browser(self._browser)
+        chromium_watchdog.closed(self._tracked)
+        self._tracked = None
+        idle, self._idle = self._idle, []
+        for slot in idle:
+            await self._close_slot(slot)
+        with metrics.span("browser_launch"):
+            async with chromium_watchdog.launching(self.params.name) as tracked:
+                self._browser = await self._playwright.chromium.launch(
+                    headless=self.params.headless,
+                    slow_mo=self.params.slow_mo,
+                    args=self.params.launch_args,
+                )
+        self._tracked = tracked
+        self._generation += 1
+        self._browser.on("disconnected", self._on_disconnected)
+
+    def _on_disconnected(self, browser: playwright.async_api.Browser) -> None:
+        if browser in self._retired:
+            self._retired.discard(browser)
+            return
+        if not self._closed:
+            logger.error("Browser disconnected, it will be relaunched on next use")
+
+    async def _new_slot(self) -> _Slot:
+        assert self._browser is not None
+        with metrics.span("context_create"):
+            context = await self._browser.new_context(**self.params.context_options)
+            if self.params.setup_context is not None:
+                await self.params.setup_context(context)
+            page = await context.new_page()
+        if self.params.page_headers:
+            await page.set_extra_http_headers(self.params.page_headers)
+        return _Slot(context=context, page=page, generation=self._generation)
+
+    async def _close_slot(self, slot: _Slot) -> None:
+        with contextlib.suppress(Exception):
+            await slot.context.close()
+
+
+_pool: Optional[BrowserPool] = None
+
+
+def get_pool() -> Optional[BrowserPool]:
+    return _pool
+
+
+def get_pool_size() -> int:
+    return env.get_int("ANKINIZER_BROWSER_POOL_SIZE", DEFAULT_POOL_SIZE)
+
+
+async def start_pool(params: PoolParams) -> BrowserPool:
+    """Start the process-wide pool; lookups pick it up via get_pool()."""
+    global _pool
+    if _pool is not None:
+        return _pool
+    pool = BrowserPool(params)
+    await pool.start()
+    _pool = pool
+    return pool
+
+
+async def close_pool() -> None:
+    global _pool
+    pool, _pool = _pool, None
+    if pool is not None:
+        await pool.close()
@@ -0,0 +1,372 @@
+"""Import a word list: look every word up on Reverso and add the cards to Anki.
+
+    python -m ankinizer.bulk words.txt
+    python -m ankinizer.bulk vocab.csv --column word --concurrency 8 --batch-size 50
+
+A .txt list has one word per line, # starts a comment; a .csv list is read
+from --column, a header name or a 0-based index. The list is streamed, so
+its size doesn't matter. Outcomes are saved to a checkpoint next to the
+list as cards are added: running the same command again after an
+interruption skips the words already done and retries the ones that failed.
+Words whose add Anki never confirmed are not retried, the card may be in the
+deck already; check those by hand. While the progress line is shown on a
+terminal, log messages go to a .log file next to the list instead.
+Lookups share the bot's cache and Reverso rate limit (--rate overrides it);
+the Anki backend is the bot's too, AnkiWeb needs ANKI_USERNAME and
+ANKI_PASSWORD in the environment.
+"""
+import argparse
+import asyncio
+import csv
+import dataclasses
+import logging
+import os
+import sqlite3
+import sys
+import time
+import typing
+from pathlib import Path
+from typing import Optional
+
+from ankinizer import added_index
+from ankinizer import anki_agent
+from ankinizer import browser_pool
+from ankinizer import chromium_watchdog
+from ankinizer import resilience
+from ankinizer import reverso_agent
+from ankinizer import reverso_cache
+from ankinizer import reverso_http
+
+logger = logging.getLogger(__name__)
+
+ADDED, ALREADY_ADDED, NOT_FOUND, FAILED = "added", "already_added", "not_found", "failed"
+# Add was pressed but never confirmed; retrying could put the card in the deck twice
+UNCONFIRMED = "unconfirmed"
+# Words with these outcomes are skipped when a run is resumed; failed ones are tried again
+DONE = (ADDED, ALREADY_ADDED, NOT_FOUND, UNCONFIRMED)
+STATUSES = (ADDED, ALREADY_ADDED, NOT_FOUND, FAILED, UNCONFIRMED)
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_BATCH_SIZE = 20
+
+
+def read_words(path: Path, column: str = "0") -> typing.Iterator[str]:
+    """The words of a .txt or .csv list, read a line at a time."""
+    with path.open(newline="", encoding="utf-8-sig") as f:
+        if path.suffix.lower() != ".csv":
+            for line in f:
+                word = line.strip()
+                if word and not word.startswith("#"):
+                    yield word
+            return
+        if column.isdigit():
+            rows: typing.Iterable[typing.Any] = csv.reader(f)
+            key: typing.Any = int(column)
+        else:
+            rows, key = csv.DictReader(f), column
+        for row in rows:
+            try:
+                word = (row[key] or "").strip()
+            except (IndexError, KeyError):
+                continue
+            if word:
+                yield word
+
+
+class Checkpoint:
+    """SQLite table of each word's outcome, keyed by normalized word."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._db = sqlite3.connect(str(path))
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS words ("
+            " word TEXT PRIMARY KEY,"
+            " status TEXT NOT NULL,"
+            " error TEXT,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def is_done(self, word: str) -> bool:
+        row = self._db.execute(
+            "SELECT status FROM words WHERE word = ?", (reverso_cache.normalize_word(word),)
+        ).fetchone()
+        return row is not None and row[0] in DONE
+
+    def record(self, outcomes: typing.Iterable["Outcome"]) -> None:
+        now = time.time()
+        self._db.executemany(
+            "INSERT OR REPLACE INTO words (word, status, error, updated_at) VALUES (?, ?, ?, ?)",
+            ((reverso_cache.normalize_word(o.word), o.status, o.error, now) for o in outcomes),
+        )
+        self._db.commit()
+
+    def counts(self) -> typing.Dict[str, int]:
+        return dict(self._db.execute("SELECT status, COUNT(*) FROM words GROUP BY status").fetchall())
+
+    def close(self) -> None:
+        self._db.close()
+
+
+def default_checkpoint_path(words_path: Path) -> Path:
+    return words_path.with_name(f"{words_path.name}.checkpoint.sqlite3")
+
+
+def default_log_path(words_path: Path) -> Path:
+    return words_path.with_name(f"{words_path.name}.log")
+
+
+def log_to_file(path: Path) -> None:
+    """Send all logging to path, so it doesn't draw over the progress line."""
+    root = logging.getLogger()
+    handlers = root.handlers[:]
+    file_handler = logging.FileHandler(path, encoding="utf-8")
+    if handlers:
+        file_handler.setFormatter(handlers[0].formatter)
+    for handler in handlers:
+        root.removeHandler(handler)
+    root.addHandler(file_handler)
+
+
+@dataclasses.dataclass
+class Outcome:
+    word: str
+    status: str = ""
+    error: Optional[str] = None
+    # Set while the card is waiting for its batch
+    result: Optional[reverso_agent.ReversoResult] = None
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m" if hours else f"{minutes}m{seconds:02d}s"
+
+
+@dataclasses.dataclass
+class Progress:
+    total: int
+    # Words done in an earlier run, or repeated in the list
+    skipped: int = 0
+    statuses: typing.Dict[str, int] = dataclasses.field(default_factory=lambda: dict.fromkeys(STATUSES, 0))
+    started: float = dataclasses.field(default_factory=time.monotonic)
+
+    @property
+    def processed(self) -> int:
+        return sum(self.statuses.values())
+
+    def count(self, outcomes: typing.Iterable[Outcome]) -> None:
+        for outcome in outcomes:
+            self.statuses[outcome.status] += 1
+
+    def line(self) -> str:
+        elapsed = time.monotonic() - self.started
+        rate = self.processed / elapsed if elapsed > 0 else 0.0
+        remaining = max(self.total - self.skipped - self.processed, 0)
+        eta = format_duration(remaining / rate) if rate > 0 else "?"
+        counts = ", ".join(f"{status.replace('_', ' ')} {count}" for status, count in self.statuses.items())
+        return (
+            f"{self.skipped + self.processed}/{self.total} words ({counts}, skipped {self.skipped})"
+            f" {rate:.1f} words/s, ETA {eta}"
+        )
+
+
+class BulkImport:
+    """Streams a word list through lookups and batched Anki adds.
+
+    concurrency lookup tasks take words from a bounded queue (which keeps
+    reading the list only as fast as lookups go) and hand the results to a
+    single writer. The writer adds cards batch_size at a time and records
+    each batch's outcomes in the checkpoint once Anki has them, so an
+    interrupted run loses at most the batch in flight. While a circuit is
+    open the word or batch waits and is tried again instead of failing.
+    """
+
+    def __init__(
+        self,
+        words_path: Path,
+        checkpoint: Checkpoint,
+        column: str = "0",
+        concurrency: int = DEFAULT_CONCURRENCY,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        progress_interval: float = 1.0,
+        out: typing.TextIO = sys.stderr,
+    ) -> None:
+        self.words_path = words_path
+        self.checkpoint = checkpoint
+        self.column = column
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.progress_interval = progress_interval
+        self.out = out
+        self.progress = Progress(total=0)
+
+    def _words(self) -> typing.Iterator[str]:
+        return read_words(self.words_path, self.column)
+
+    async def run(self) -> Progress:
+        self.progress = Progress(total=sum(1 for _ in self._words()))
+        words: asyncio.Queue[Optional[str]] = asyncio.Queue(maxsize=self.concurrency * 2)
+        outcomes: asyncio.Queue[Optional[Outcome]] = asyncio.Queue(maxsize=self.batch_size * 2)
+        lookups = [asyncio.create_task(self._look_up_all(words, outcomes)) for _ in range(self.concurrency)]
+
+        async def feed() -> None:
+            await self._read_all(words)
+            await asyncio.gather(*lookups)
+            await outcomes.put(None)
+
+        tasks = [*lookups, asyncio.create_task(feed()), asyncio.create_task(self._write_all(outcomes))]
+        reporter = asyncio.create_task(self._report())
+        try:
+            # A failing writer must not leave the readers blocked on full queues
+            await asyncio.gather(*tasks[-2:])
+        finally:
+            for task in (*tasks, reporter):
+                task.cancel()
+            await asyncio.gather(*tasks, reporter, return_exceptions=True)
+            self._print(self.progress.line(), final=True)
+        return self.progress
+
+    async def _read_all(self, words: "asyncio.Queue[Optional[str]]") -> None:
+        seen: typing.Set[str] = set()
+        for word in self._words():
+            key = reverso_cache.normalize_word(word)
+            if key in seen or self.checkpoint.is_done(word):
+                self.progress.skipped += 1
+                continue
+            seen.add(key)
+            await words.put(word)
+        for _ in range(self.concurrency):
+            await words.put(None)
+
+    async def _look_up_all(self, words: "asyncio.Queue[Optional[str]]", outcomes: "asyncio.Queue[Optional[Outcome]]") -> None:
+        while (word := await words.get()) is not None:
+            await outcomes.put(await self._look_up(word))
+
+    async def _look_up(self, word: str) -> Outcome:
+        if added_index.lookup(word) is not None:
+            # Known to be in the deck, don't spend a lookup on it
+            return Outcome(word, ALREADY_ADDED)
+        while True:
+            try:
+                result = await reverso_agent.get_reverso_result(word)
+                break
+            except resilience.CircuitOpenError as e:
+                await asyncio.sleep(e.retry_after)
+            except Exception as e:
+                logger.warning(f"Lookup of {word!r} failed: {e}")
+                return Outcome(word, FAILED, error=str(e) or type(e).__name__)
+        if not result.ru_translations:
+            return Outcome(word, NOT_FOUND)
+        return Outcome(word, result=result)
+
+    async def _write_all(self, outcomes: "asyncio.Queue[Optional[Outcome]]") -> None:
+        batch: typing.List[Outcome] = []
+        while (outcome := await outcomes.get()) is not None:
+            batch.append(outcome)
+            if len(batch) >= self.batch_size:
+                await self._write(batch)
+                batch = []
+        if batch:
+            await self._write(batch)
+
+    async def _write(self, batch: typing.List[Outcome]) -> None:
+        cards = [outcome for outcome in batch if outcome.result is not None]
+        if cards:
+            for outcome, report in zip(cards, await self._add_cards(cards)):
+                if report.already_added:
+                    outcome.status = ALREADY_ADDED
+                elif report.added:
+                    outcome.status = ADDED
+                elif report.unconfirmed:
+                    outcome.status, outcome.error = UNCONFIRMED, report.error
+                else:
+                    outcome.status, outcome.error = FAILED, report.error or "Anki did not confirm the card"
+                outcome.result = None
+        self.checkpoint.record(batch)
+        self.progress.count(batch)
+
+    async def _add_cards(self, cards: typing.List[Outcome]) -> typing.List[anki_agent.CardReport]:
+        results = [outcome.result for outcome in cards if outcome.result is not None]
+        while True:
+            try:
+                return await anki_agent.add_cards_to_anki(results)
+            except resilience.CircuitOpenError as e:
+                await asyncio.sleep(e.retry_after)
+            except Exception as e:
+                logger.exception(f"Adding a batch of {len(results)} cards failed")
+                return [anki_agent.CardReport(r.en_word, added=False, error=str(e) or type(e).__name__) for r in results]
+
+    async def _report(self) -> None:
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            self._print(self.progress.line())
+
+    def _print(self, line: str, final: bool = False) -> None:
+        if self.out.isatty():
+            # Redraw one status line in place; the final one stays
+            self.out.write(f"\r\033[K{line}" + ("\n" if final else ""))
+        else:
+            self.out.write(f"{line}\n")
+        self.out.flush()
+
+
+async def run_import(bulk: BulkImport) -> Progress:
+    """Run bulk with the browsers and clients the bot would use, closed afterwards."""
+    if reverso_agent.get_lookup_mode() != "http":
+        await browser_pool.start_pool(reverso_agent.get_pool_params())
+    chromium_watchdog.start()
+    try:
+        return await bulk.run()
+    finally:
+        await browser_pool.close_pool()
+        await anki_agent.close_backend()
+        await chromium_watchdog.stop()
+        await reverso_http.close_client()
+
+
+def main(argv: Optional[typing.Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("words", type=Path, help="a .txt (one word per line) or .csv word list")
+    parser.add_argument("--column", default="0", help="CSV column with the words: header name or 0-based index")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="lookups running at the same time")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="cards sent to Anki at a time")
+    parser.add_argument("--rate", type=int, help="Reverso lookups per minute at most (default: ANKINIZER_REVERSO_RATE)")
+    parser.add_argument("--checkpoint", type=Path, help="progress file (default: next to the list)")
+    args = parser.parse_args(argv)
+
+    if args.rate is not None:
+        os.environ["ANKINIZER_REVERSO_RATE"] = str(args.rate)
+    checkpoint = Checkpoint(args.checkpoint or default_checkpoint_path(args.words))
+    if sys.stderr.isatty():
+        log_path = default_log_path(args.words)
+        print(f"Logging to {log_path}", file=sys.stderr)
+        log_to_file(log_path)
+    done = checkpoint.counts()
+    if done:
+        print(f"Resuming from {checkpoint.path}: {done}", file=sys.stderr)
+    bulk = BulkImport(
+        args.words, checkpoint, column=args.column, concurrency=args.concurrency, batch_size=args.batch_size
+    )
+    try:
+        progress = asyncio.run(run_import(bulk))
+    except KeyboardInterrupt:
+        print(f"Interrupted, run the same command again to resume from {checkpoint.path}", file=sys.stderr)
+        return 130
+    finally:
+        checkpoint.close()
+    if progress.statuses[UNCONFIRMED]:
+        print(
+            f"{progress.statuses[UNCONFIRMED]} cards were not confirmed by Anki and won't be retried,"
+            f" check the deck for them (status {UNCONFIRMED!r} in {checkpoint.path})",
+            file=sys.stderr,
+        )
+    if progress.statuses[FAILED]:
+        print(f"{progress.statuses[FAILED]} words failed, run again to retry them", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
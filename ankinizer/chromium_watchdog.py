@@ -0,0 +1,309 @@
+import asyncio
+import collections
+import contextlib
+import dataclasses
+import logging
+import os
+import signal
+import typing
+from pathlib import Path
+from typing import Optional
+
+from ankinizer import env
+from ankinizer import metrics
+
+logger = logging.getLogger(__name__)
+
+PROC = Path("/proc")
+DEFAULT_MAX_PAGES = 500
+DEFAULT_MAX_MEMORY_MB = 768
+DEFAULT_INTERVAL = 30
+
+BROWSER_MEMORY: metrics.Gauge = metrics.REGISTRY.register(metrics.Gauge(
+    "ankinizer_browser_memory_bytes", "Memory of each browser's process tree (PSS where available)", labels=("browser",),
+))
+BROWSER_PAGES: metrics.Gauge = metrics.REGISTRY.register(metrics.Gauge(
+    "ankinizer_browser_pages", "Pages a browser has served since it was launched", labels=("browser",),
+))
+BROWSER_RECYCLES: metrics.Counter = metrics.REGISTRY.register(metrics.Counter(
+    "ankinizer_browser_recycles_total", "Browsers relaunched to shed memory, by reason (pages, memory)", labels=("browser", "reason"),
+))
+ORPHANS_KILLED: metrics.Counter = metrics.REGISTRY.register(metrics.Counter(
+    "ankinizer_browser_orphans_killed_total", "Chromium processes killed because no browser owner had them",
+))
+
+
+@dataclasses.dataclass(frozen=True)
+class Process:
+    pid: int
+    ppid: int
+    name: str
+    # Clock ticks after boot; with the pid it tells a process from a later one reusing the pid
+    start_time: int
+
+
+def read_process(pid: int, proc: Path = PROC) -> Optional[Process]:
+    try:
+        stat = (proc / str(pid) / "stat").read_text()
+    except OSError:
+        return None
+    # The name is in parentheses and may itself contain spaces and parentheses
+    head, _, rest = stat.rpartition(")")
+    fields = rest.split()
+    return Process(pid=pid, ppid=int(fields[1]), name=head.partition("(")[2], start_time=int(fields[19]))
+
+
+def list_processes(proc: Path = PROC) -> typing.Dict[int, Process]:
+    """Every process in /proc by pid; empty where there is no /proc."""
+    try:
+        entries = os.listdir(proc)
+    except OSError:
+        return {}
+    processes = {}
+    for entry in entries:
+        if entry.isdigit():
+            process = read_process(int(entry), proc)
+            if process is not None:
+                processes[process.pid] = process
+    return processes
+
+
+def is_chromium(process: Process) -> bool:
+    name = process.name.lower()
+    return "chrom" in name or "headless_shell" in name
+
+
+def descendants(pid: int, processes: typing.Dict[int, Process]) -> typing.List[int]:
+    children = collections.defaultdict(list)
+    for process in processes.values():
+        children[process.ppid].append(process.pid)
+    found, stack = [], [pid]
+    while stack:
+        for child in children[stack.pop()]:
+            found.append(child)
+            stack.append(child)
+    return found
+
+
+def chromium_roots(processes: typing.Dict[int, Process], ancestor: int) -> typing.Set[int]:
+    """Chromium processes under ancestor whose parent isn't Chromium, one per browser."""
+    return {
+        pid for pid in descendants(ancestor, processes)
+        if is_chromium(processes[pid])
+        and not (processes[pid].ppid in processes and is_chromium(processes[processes[pid].ppid]))
+    }
+
+
+def memory_bytes(pid: int, proc: Path = PROC) -> int:
+    """PSS of the process, so pages Chromium processes share aren't counted once per process; RSS without smaps_rollup."""
+    try:
+        for line in (proc / str(pid) / "smaps_rollup").read_text().splitlines():
+            if line.startswith("Pss:"):
+                return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    try:
+        resident_pages = int((proc / str(pid) / "statm").read_text().split()[1])
+    except (OSError, IndexError, ValueError):
+        return 0
+    return resident_pages * os.sysconf("SC_PAGE_SIZE")
+
+
+def kill_tree(pid: int, processes: typing.Dict[int, Process]) -> int:
+    """SIGKILL pid and everything under it; returns how many processes were signalled."""
+    killed = 0
+    for target in [pid, *descendants(pid, processes)]:
+        with contextlib.suppress(ProcessLookupError, PermissionError):
+            os.kill(target, signal.SIGKILL)
+            killed += 1
+    return killed
+
+
+@dataclasses.dataclass
+class TrackedBrowser:
+    """A browser as the watchdog sees it; its owner relaunches it once recycle_due."""
+
+    owner: str
+    max_pages: int
+    process: Optional[Process] = None
+    pages: int = 0
+    memory: int = 0
+    recycle_reason: Optional[str] = None
+    closed: bool = False
+
+    def page_done(self) -> None:
+        self.pages += 1
+        BROWSER_PAGES.set(self.pages, browser=self.owner)
+        if self.max_pages and self.pages >= self.max_pages:
+            self.request_recycle("pages")
+
+    def request_recycle(self, reason: str) -> None:
+        if self.recycle_reason is None:
+            logger.info(f"Recycling {self.owner} browser ({reason}): {self.pages} pages, {self.memory >> 20} MiB")
+            self.recycle_reason = reason
+
+    @property
+    def recycle_due(self) -> bool:
+        return self.recycle_reason is not None and not self.closed
+
+
+class Watchdog:
+    """Keeps track of every Chromium the bot launches, so none outgrows the container.
+
+    Owners (the Reverso browser pool, the AnkiWeb session) launch inside
+    launching() and tell closed() when they close the browser; the process
+    that appeared in between is the browser. A browser is due for recycling
+    after max_pages pages or once its process tree uses more than max_memory
+    bytes; its owner then launches a replacement and closes the old browser
+    once the pages it still has out are done. check()
+    also kills Chromium processes nobody owns: browsers whose close() failed
+    and leftovers of a launch that raised.
+    """
+
+    def __init__(
+        self,
+        max_pages: int = DEFAULT_MAX_PAGES,
+        max_memory: int = DEFAULT_MAX_MEMORY_MB << 20,
+        interval: float = DEFAULT_INTERVAL,
+        proc: Path = PROC,
+        pid: Optional[int] = None,
+    ) -> None:
+        self.max_pages = max_pages
+        self.max_memory = max_memory
+        self.interval = interval
+        self.proc = proc
+        self.pid = os.getpid() if pid is None else pid
+        self.browsers: typing.List[TrackedBrowser] = []
+        self._closed: typing.List[TrackedBrowser] = []
+        # Unowned browsers seen by the last check; killed if still there at the next one
+        self._unowned: typing.Set[typing.Tuple[int, int]] = set()
+        self._owners: typing.Set[str] = set()
+        self._launch_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @contextlib.asynccontextmanager
+    async def launching(self, owner: str) -> typing.AsyncIterator[TrackedBrowser]:
+        """Wrap a browser launch; launches are serialized so the new process can be told apart."""
+        tracked = TrackedBrowser(owner=owner, max_pages=self.max_pages)
+        async with self._launch_lock:
+            before = chromium_roots(list_processes(self.proc), self.pid)
+            try:
+                yield tracked
+            except BaseException:
+                processes = list_processes(self.proc)
+                for pid in chromium_roots(processes, self.pid) - before:
+                    logger.warning(f"Killing {owner} browser {pid} left by a failed launch")
+                    ORPHANS_KILLED.inc(kill_tree(pid, processes))
+                raise
+            processes = list_processes(self.proc)
+            new = sorted(chromium_roots(processes, self.pid) - before)
+        if new:
+            tracked.process = processes[new[0]]
+        self.browsers.append(tracked)
+        self._owners.add(owner)
+        BROWSER_PAGES.set(0, browser=owner)
+
+    def closed(self, tracked: TrackedBrowser) -> None:
+        """The owner closed the browser; anything of it still running at the next check is killed."""
+        if tracked.closed:
+            return
+        tracked.closed = True
+        if tracked in self.browsers:
+            self.browsers.remove(tracked)
+        if tracked.recycle_reason is not None:
+            BROWSER_RECYCLES.inc(browser=tracked.owner, reason=tracked.recycle_reason)
+        if tracked.process is not None:
+            self._closed.append(tracked)
+
+    def check(self, final: bool = False) -> None:
+        """Measure the browsers and kill orphans; final kills every unowned browser at once, for shutdown."""
+        processes = list_processes(self.proc)
+
+        def alive(process: Optional[Process]) -> bool:
+            current = processes.get(process.pid) if process is not None else None
+            return current is not None and current.start_time == process.start_time
+
+        memory = dict.fromkeys(self._owners, 0)
+        for tracked in self.browsers:
+            if not alive(tracked.process):
+                continue
+            assert tracked.process is not None
+            pids = [tracked.process.pid, *descendants(tracked.process.pid, processes)]
+            tracked.memory = sum(memory_bytes(pid, self.proc) for pid in pids)
+            memory[tracked.owner] += tracked.memory
+            if self.max_memory and tracked.memory > self.max_memory:
+                tracked.request_recycle("memory")
+        for owner, value in memory.items():
+            BROWSER_MEMORY.set(value, browser=owner)
+
+        leftovers, self._closed = self._closed, []
+        for tracked in leftovers:
+            if alive(tracked.process):
+                assert tracked.process is not None
+                logger.warning(f"Killing {tracked.owner} browser {tracked.process.pid}, it outlived its close()")
+                ORPHANS_KILLED.inc(kill_tree(tracked.process.pid, processes))
+
+        if self._launch_lock.locked():
+            # The browser being launched isn't registered yet
+            return
+        owned = {(t.process.pid, t.process.start_time) for t in self.browsers if t.process is not None}
+        unowned = {(pid, processes[pid].start_time) for pid in chromium_roots(processes, self.pid)} - owned
+        for pid, _ in unowned if final else unowned & self._unowned:
+            logger.warning(f"Killing orphaned browser {pid}")
+            ORPHANS_KILLED.inc(kill_tree(pid, processes))
+        self._unowned = unowned - self._unowned
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Browser watchdog check failed")
+
+    def start(self) -> None:
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+
+
+_watchdog: Optional[Watchdog] = None
+
+
+def get_watchdog() -> Watchdog:
+    """Process-wide watchdog; 0 turns a limit off (ANKINIZER_BROWSER_MAX_PAGES, ANKINIZER_BROWSER_MAX_MEMORY_MB)."""
+    global _watchdog
+    if _watchdog is None:
+        _watchdog = Watchdog(
+            max_pages=env.get_int("ANKINIZER_BROWSER_MAX_PAGES", DEFAULT_MAX_PAGES),
+            max_memory=env.get_int("ANKINIZER_BROWSER_MAX_MEMORY_MB", DEFAULT_MAX_MEMORY_MB) << 20,
+            interval=env.get_int("ANKINIZER_BROWSER_WATCHDOG_INTERVAL", DEFAULT_INTERVAL),
+        )
+    return _watchdog
+
+
+def launching(owner: str) -> typing.AsyncContextManager[TrackedBrowser]:
+    return get_watchdog().launching(owner)
+
+
+def closed(tracked: Optional[TrackedBrowser]) -> None:
+    if tracked is not None:
+        get_watchdog().closed(tracked)
+
+
+def start() -> None:
+    """Run the periodic memory and orphan checks; ANKINIZER_BROWSER_WATCHDOG_INTERVAL=0 turns them off."""
+    get_watchdog().start()
+
+
+async def stop() -> None:
+    """Stop the checks and kill whatever Chromium the owners' close() left running."""
+    if _watchdog is not None:
+        await _watchdog.stop()
+        _watchdog.check(final=True)
@@ -2,4 +2,31 @@ import os
 import sys
 
 # Add the project root directory to Python path
-sys.path.insert(0, os.path.abspath(os.path.dirname(__file__))) 
\ No newline at end of file
+sys.path.insert(0, os.path.abspath(os.path.dirname(__file__))) 
+
+import pytest
+
+from ankinizer import added_index
+from ankinizer import chromium_watchdog
+from ankinizer import resilience
+
+
+@pytest.fixture(autouse=True)
+def fresh_upstreams(monkeypatch):
+    # Failures one test provokes must not leave a circuit open for the next
+    monkeypatch.setattr(resilience, "_upstreams", {})
+
+
+@pytest.fixture(autouse=True)
+def empty_added_index(tmp_path, monkeypatch):
+    # Cards added by one test would otherwise be skipped as duplicates in the next
+    index = added_index.AddedIndex(tmp_path / "added_words.sqlite3")
+    monkeypatch.setattr(added_index, "_index", index)
+    yield index
+    index.close()
+
+
+@pytest.fixture(autouse=True)
+def fresh_watchdog(monkeypatch):
+    # Browsers tracked in one test (and its event loop's launch lock) stay there
+    monkeypatch.setattr(chromium_watchdog, "_watchdog", None)
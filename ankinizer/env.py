@@ -58,3 +58,23 @@ def setup_env():
     except Exception as e:
         logger.error(f"Failed to load credentials or bot token: {e}")
         raise
+
+
+def get_int(name: str, default: int) -> int:
+    """Read an integer setting from the environment, falling back to default"""
+    value = os.environ.get(name)
+    if not value:
+        return default
+    return int(value)
+
+
+def data_dir() -> Path:
+    """Directory for state that should outlive the process (caches, sessions, queues)"""
+    path = Path(os.environ.get("ANKINIZER_DATA_DIR") or Path(__file__).parent.parent / ".data")
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def get_str(name: str, default: str) -> str:
+    """Read a string setting from the environment, falling back to default when unset or empty"""
+    return os.environ.get(name) or default
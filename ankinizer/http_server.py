@@ -0,0 +1,146 @@
+import asyncio
+import contextlib
+import dataclasses
+import logging
+import typing
+import urllib.parse
+from http import HTTPStatus
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_BYTES = 10 * 1024 * 1024
+
+
+@dataclasses.dataclass
+class Request:
+    method: str
+    path: str
+    query: typing.Dict[str, typing.List[str]]
+    headers: typing.Dict[str, str]
+    body: bytes
+
+
+@dataclasses.dataclass
+class Response:
+    status: int = 200
+    body: bytes = b""
+    content_type: str = "text/plain; charset=utf-8"
+    headers: typing.Dict[str, str] = dataclasses.field(default_factory=dict)
+
+    @classmethod
+    def text(cls, text: str, status: int = 200) -> "Response":
+        return cls(status=status, body=text.encode())
+
+
+Handler = typing.Callable[[Request], typing.Awaitable[Response]]
+
+
+class HttpServer:
+    """A small asyncio HTTP/1.1 server for the bot's own endpoints (metrics, health, webhook).
+
+    Only Content-Length bodies are supported; that is all Telegram and
+    Prometheus send.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.host = host
+        self.port = port
+        self._routes: typing.Dict[typing.Tuple[str, str], Handler] = {}
+        self._prefix_routes: typing.List[typing.Tuple[str, str, Handler]] = []
+        self._server: Optional[asyncio.Server] = None
+        self._connections: typing.Set[asyncio.StreamWriter] = set()
+
+    def route(self, method: str, path: str, handler: Handler) -> None:
+        self._routes[(method.upper(), path)] = handler
+
+    def route_prefix(self, method: str, prefix: str, handler: Handler) -> None:
+        """Route every path under prefix; the longest matching prefix wins, exact routes first."""
+        self._prefix_routes.append((method.upper(), prefix, handler))
+        self._prefix_routes.sort(key=lambda route: len(route[1]), reverse=True)
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._serve_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"HTTP server listening on {self.host}:{self.port}, routes: {sorted(self._routes)}")
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            # Idle keep-alive connections would otherwise outlive the server
+            for writer in list(self._connections):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._connections.add(writer)
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                response = await self._dispatch(request)
+                keep_alive = request.headers.get("connection", "").lower() != "close"
+                self._write_response(writer, response, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+            with contextlib.suppress(Exception):
+                await writer.wait_closed()
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Request]:
+        request_line = await reader.readline()
+        if not request_line.strip():
+            return None
+        method, target, _ = request_line.decode("latin-1").split(" ", 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get("content-length", "0"))
+        if length > MAX_BODY_BYTES:
+            raise ValueError("Request body too large")
+        body = await reader.readexactly(length) if length else b""
+        url = urllib.parse.urlsplit(target)
+        return Request(
+            method=method.upper(),
+            path=url.path,
+            query=urllib.parse.parse_qs(url.query),
+            headers=headers,
+            body=body,
+        )
+
+    async def _dispatch(self, request: Request) -> Response:
+        handler = self._routes.get((request.method, request.path))
+        if handler is None:
+            handler = next(
+                (h for method, prefix, h in self._prefix_routes if method == request.method and request.path.startswith(prefix)),
+                None,
+            )
+        if handler is None:
+            return Response.text("Not found\n", status=404)
+        try:
+            return await handler(request)
+        except Exception:
+            logger.exception(f"Handler for {request.method} {request.path} failed")
+            return Response.text("Internal server error\n", status=500)
+
+    def _write_response(self, writer: asyncio.StreamWriter, response: Response, keep_alive: bool) -> None:
+        reason = HTTPStatus(response.status).phrase
+        headers = {
+            "Content-Type": response.content_type,
+            "Content-Length": str(len(response.body)),
+            "Connection": "keep-alive" if keep_alive else "close",
+            **response.headers,
+        }
+        head = f"HTTP/1.1 {response.status} {reason}\r\n" + "".join(f"{k}: {v}\r\n" for k, v in headers.items())
+        writer.write(head.encode("latin-1") + b"\r\n" + response.body)
@@ -0,0 +1,228 @@
+import asyncio
+import bisect
+import contextlib
+import logging
+import time
+import typing
+from typing import Optional
+
+from ankinizer import env
+from ankinizer import http_server
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_METRICS_PORT = 9100
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelValues = typing.Tuple[str, ...]
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: typing.Sequence[str], values: typing.Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: typing.Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+
+    def _key(self, labels: typing.Dict[str, str]) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def render(self) -> typing.List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    def _samples(self) -> typing.List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: typing.Sequence[str] = ()) -> None:
+        super().__init__(name, help, labels)
+        self._values: typing.Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> typing.List[str]:
+        return [f"{self.name}{_format_labels(self.label_names, key)} {value}" for key, value in sorted(self._values.items())]
+
+
+class Gauge(Metric):
+    """A value read at scrape time from a callback, or set explicitly."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: typing.Sequence[str] = (), callback: Optional[typing.Callable[[], float]] = None) -> None:
+        super().__init__(name, help, labels)
+        self.callback = callback
+        self._values: typing.Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[self._key(labels)] = value
+
+    def _samples(self) -> typing.List[str]:
+        if self.callback is not None:
+            return [f"{self.name} {self.callback()}"]
+        return [f"{self.name}{_format_labels(self.label_names, key)} {value}" for key, value in sorted(self._values.items())]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: typing.Sequence[str] = (), buckets: typing.Sequence[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: counts per bucket (non-cumulative, last one is +Inf), sum
+        self._counts: typing.Dict[LabelValues, typing.List[int]] = {}
+        self._sums: typing.Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sums[key] = self._sums.get(key, 0.0) + value
+
+    def count(self, **labels: str) -> int:
+        return sum(self._counts.get(self._key(labels), []))
+
+    def _samples(self) -> typing.List[str]:
+        lines = []
+        for key, counts in sorted(self._counts.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _format_labels(self.label_names, key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {self._sums[key]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: typing.Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> typing.Any:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines: typing.List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS: Histogram = REGISTRY.register(Histogram(
+    "ankinizer_stage_seconds", "Time spent in each stage of a lookup or card add", labels=("stage",)
+))
+OPERATIONS: Counter = REGISTRY.register(Counter(
+    "ankinizer_operations_total", "Finished operations by outcome (success, failure, timeout)", labels=("operation", "outcome")
+))
+OPERATION_SECONDS: Histogram = REGISTRY.register(Histogram(
+    "ankinizer_operation_seconds", "End to end time of an operation", labels=("operation",)
+))
+EVENT_LOOP_LAG_SECONDS: Histogram = REGISTRY.register(Histogram(
+    "ankinizer_event_loop_lag_seconds", "How late the event loop wakes up a sleeping task",
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+))
+
+
+@contextlib.contextmanager
+def span(stage: str) -> typing.Iterator[None]:
+    """Time the enclosed block into ankinizer_stage_seconds{stage=...}."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage)
+
+
+def _is_timeout(error: BaseException) -> bool:
+    # asyncio, builtin and Playwright timeouts don't share a base class
+    return any(cls.__name__ == "TimeoutError" for cls in type(error).__mro__)
+
+
+@contextlib.contextmanager
+def track(operation: str) -> typing.Iterator[None]:
+    """Count the outcome and time of the enclosed operation."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        OPERATIONS.inc(operation=operation, outcome="timeout" if _is_timeout(e) else "failure")
+        raise
+    else:
+        OPERATIONS.inc(operation=operation, outcome="success")
+    finally:
+        OPERATION_SECONDS.observe(time.perf_counter() - started, operation=operation)
+
+
+async def monitor_event_loop(interval: float = 0.5) -> None:
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG_SECONDS.observe(max(time.perf_counter() - started - interval, 0.0))
+
+
+async def _serve_metrics(request: http_server.Request) -> http_server.Response:
+    return http_server.Response(body=REGISTRY.render().encode(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def add_routes(server: http_server.HttpServer) -> None:
+    server.route("GET", "/metrics", _serve_metrics)
+
+
+_server: Optional[http_server.HttpServer] = None
+_loop_monitor: Optional[asyncio.Task] = None
+
+
+async def start_server() -> Optional[http_server.HttpServer]:
+    """Serve /metrics (and the bot adds /healthz) on ANKINIZER_METRICS_HOST:ANKINIZER_METRICS_PORT; port 0 turns it off."""
+    global _server, _loop_monitor
+    port = env.get_int("ANKINIZER_METRICS_PORT", DEFAULT_METRICS_PORT)
+    if _server is not None or port == 0:
+        return _server
+    server = http_server.HttpServer(env.get_str("ANKINIZER_METRICS_HOST", "127.0.0.1"), port)
+    add_routes(server)
+    await server.start()
+    _server = server
+    _loop_monitor = asyncio.create_task(monitor_event_loop())
+    return server
+
+
+def get_server() -> Optional[http_server.HttpServer]:
+    return _server
+
+
+async def stop_server() -> None:
+    global _server, _loop_monitor
+    if _loop_monitor is not None:
+        _loop_monitor.cancel()
+        _loop_monitor = None
+    server, _server = _server, None
+    if server is not None:
+        await server.stop()
@@ -0,0 +1,268 @@
+import asyncio
+import contextlib
+import dataclasses
+import json
+import logging
+import sqlite3
+import time
+import typing
+from pathlib import Path
+from typing import Optional
+
+from ankinizer import anki_agent
+from ankinizer import env
+from ankinizer import resilience
+from ankinizer import reverso_agent
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 10
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_BACKOFF_SECONDS = 5.0
+DEFAULT_POLL_INTERVAL = 30.0
+# How long cards that are done with (added or given up on) are kept, and how often they are swept
+DEFAULT_RETENTION_SECONDS = 7 * 24 * 3600
+PRUNE_INTERVAL = 3600.0
+
+PENDING = "pending"
+ADDED = "added"
+FAILED = "failed"
+# Add was pressed but not confirmed; never retried, as the card may be in the deck already
+UNCONFIRMED = "unconfirmed"
+
+Notify = typing.Callable[[int, str], typing.Awaitable[None]]
+
+
+@dataclasses.dataclass
+class OutboxItem:
+    id: int
+    chat_id: int
+    reverso_result: reverso_agent.ReversoResult
+    attempts: int
+
+
+class Outbox:
+    """Accepted cards waiting to be written to Anki, kept in SQLite so a restart doesn't lose them."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._db = sqlite3.connect(str(path))
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS cards ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " chat_id INTEGER NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " next_attempt_at REAL NOT NULL,"
+            " last_error TEXT,"
+            " created_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS cards_due ON cards (status, next_attempt_at)")
+        self._db.commit()
+
+    def enqueue(self, reverso_result: reverso_agent.ReversoResult, chat_id: int) -> int:
+        now = time.time()
+        cursor = self._db.execute(
+            "INSERT INTO cards (chat_id, payload, status, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?)",
+            (chat_id, json.dumps(reverso_result.to_dict(), ensure_ascii=False), PENDING, now, now),
+        )
+        self._db.commit()
+        assert cursor.lastrowid is not None
+        return cursor.lastrowid
+
+    def due(self, limit: int) -> typing.List[OutboxItem]:
+        rows = self._db.execute(
+            "SELECT id, chat_id, payload, attempts FROM cards"
+            " WHERE status = ? AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+            (PENDING, time.time(), limit),
+        ).fetchall()
+        return [
+            OutboxItem(id=row[0], chat_id=row[1], reverso_result=reverso_agent.ReversoResult.from_dict(json.loads(row[2])), attempts=row[3])
+            for row in rows
+        ]
+
+    def next_due_at(self) -> Optional[float]:
+        (next_at,) = self._db.execute("SELECT MIN(next_attempt_at) FROM cards WHERE status = ?", (PENDING,)).fetchone()
+        return next_at
+
+    def mark_added(self, item_id: int) -> None:
+        self._db.execute("UPDATE cards SET status = ?, last_error = NULL WHERE id = ?", (ADDED, item_id))
+        self._db.commit()
+
+    def mark_failed(self, item_id: int, error: str, retry_at: Optional[float], status: str = FAILED) -> None:
+        """Record a failed attempt; without retry_at the card is given up on with status."""
+        if retry_at is None:
+            self._db.execute(
+                "UPDATE cards SET status = ?, attempts = attempts + 1, last_error = ? WHERE id = ?",
+                (status, error, item_id),
+            )
+        else:
+            self._db.execute(
+                "UPDATE cards SET attempts = attempts + 1, last_error = ?, next_attempt_at = ? WHERE id = ?",
+                (error, retry_at, item_id),
+            )
+        self._db.commit()
+
+    def prune(self, older_than: float) -> int:
+        """Delete cards no longer pending that were accepted before older_than; returns how many."""
+        cursor = self._db.execute("DELETE FROM cards WHERE status != ? AND created_at < ?", (PENDING, older_than))
+        self._db.commit()
+        return cursor.rowcount
+
+    def count(self, status: str = PENDING) -> int:
+        (count,) = self._db.execute("SELECT COUNT(*) FROM cards WHERE status = ?", (status,)).fetchone()
+        return count
+
+    def close(self) -> None:
+        self._db.close()
+
+
+class OutboxWorker:
+    """Drains the outbox in the background, a batch of due cards per AnkiWeb session.
+
+    Cards that fail are retried with exponential backoff and given up on after
+    ``max_attempts``, except unconfirmed adds, which are never retried so a card
+    can't end up in the deck twice. The chat that accepted a card is told when
+    it lands or fails. Cards done with are deleted after ``retention_seconds``.
+    """
+
+    def __init__(
+        self,
+        outbox: Outbox,
+        notify: Notify,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        backoff_seconds: float = DEFAULT_BACKOFF_SECONDS,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        retention_seconds: float = DEFAULT_RETENTION_SECONDS,
+    ) -> None:
+        self.outbox = outbox
+        self.notify = notify
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self._pruned_at: Optional[float] = None
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        logger.info(f"Starting outbox worker, {self.outbox.count()} cards pending")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    def submit(self, reverso_result: reverso_agent.ReversoResult, chat_id: int) -> int:
+        item_id = self.outbox.enqueue(reverso_result, chat_id)
+        self._wakeup.set()
+        return item_id
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                processed = await self.drain_once()
+            except Exception:
+                logger.exception("Outbox worker iteration failed")
+                processed = 0
+            if processed:
+                continue
+            await self._sleep_until_due()
+
+    async def _sleep_until_due(self) -> None:
+        timeout = self.poll_interval
+        next_due_at = self.outbox.next_due_at()
+        if next_due_at is not None:
+            timeout = min(timeout, max(next_due_at - time.time(), 0.0))
+        self._wakeup.clear()
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+
+    async def drain_once(self) -> int:
+        """Try to add one batch of due cards; returns how many were attempted."""
+        self._prune()
+        items = self.outbox.due(self.batch_size)
+        if not items:
+            return 0
+        logger.info(f"Adding {len(items)} queued cards to Anki")
+        try:
+            reports = await anki_agent.add_cards_to_anki([item.reverso_result for item in items])
+        except resilience.CircuitOpenError as e:
+            # Not the cards' fault, don't spend their attempts; wait until Anki may be tried again
+            logger.warning(f"Not adding queued cards: {e}")
+            await asyncio.sleep(e.retry_after)
+            return 0
+        except Exception as e:
+            logger.exception("Batch add to Anki failed")
+            reports = [anki_agent.CardReport(en_word=item.reverso_result.en_word, added=False, error=str(e)) for item in items]
+
+        for item, report in zip(items, reports):
+            word = item.reverso_result.en_word
+            if report.added:
+                self.outbox.mark_added(item.id)
+                await self._notify(item.chat_id, f"Card for {word} added to Anki")
+                continue
+            error = report.error or "unknown error"
+            attempts = item.attempts + 1
+            if report.unconfirmed:
+                self.outbox.mark_failed(item.id, error, retry_at=None, status=UNCONFIRMED)
+                await self._notify(item.chat_id, f"Anki did not confirm the card for {word}, please check the deck before adding it again")
+            elif attempts >= self.max_attempts:
+                self.outbox.mark_failed(item.id, error, retry_at=None)
+                await self._notify(item.chat_id, f"Error adding card for {word} to Anki: {error}")
+            else:
+                retry_in = self.backoff_seconds * 2 ** (attempts - 1)
+                logger.warning(f"Card for {word} failed ({error}), retry {attempts} in {retry_in}s")
+                self.outbox.mark_failed(item.id, error, retry_at=time.time() + retry_in)
+        return len(items)
+
+    def _prune(self) -> None:
+        now = time.time()
+        if self._pruned_at is not None and now - self._pruned_at < PRUNE_INTERVAL:
+            return
+        self._pruned_at = now
+        pruned = self.outbox.prune(now - self.retention_seconds)
+        if pruned:
+            logger.info(f"Deleted {pruned} cards done with more than {self.retention_seconds:.0f}s ago from the outbox")
+
+    async def _notify(self, chat_id: int, text: str) -> None:
+        try:
+            await self.notify(chat_id, text)
+        except Exception:
+            logger.exception(f"Failed to notify chat {chat_id}")
+
+
+_worker: Optional[OutboxWorker] = None
+
+
+def get_worker() -> Optional[OutboxWorker]:
+    return _worker
+
+
+def start_worker(notify: Notify) -> OutboxWorker:
+    """Start the process-wide worker on the outbox in the data dir."""
+    global _worker
+    if _worker is None:
+        _worker = OutboxWorker(
+            Outbox(env.data_dir() / "outbox.sqlite3"),
+            notify,
+            batch_size=env.get_int("ANKINIZER_OUTBOX_BATCH_SIZE", DEFAULT_BATCH_SIZE),
+            max_attempts=env.get_int("ANKINIZER_OUTBOX_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS),
+            retention_seconds=env.get_int("ANKINIZER_OUTBOX_RETENTION", DEFAULT_RETENTION_SECONDS),
+        )
+        _worker.start()
+    return _worker
+
+
+async def stop_worker() -> None:
+    global _worker
+    worker, _worker = _worker, None
+    if worker is not None:
+        await worker.stop()
+        worker.outbox.close()
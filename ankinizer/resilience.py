@@ -0,0 +1,226 @@
+import asyncio
+import collections
+import logging
+import time
+import typing
+from typing import Optional
+
+from ankinizer import admission
+from ankinizer import env
+from ankinizer import metrics
+
+logger = logging.getLogger(__name__)
+
+T = typing.TypeVar("T")
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+DEFAULT_WINDOW = 20
+DEFAULT_MIN_CALLS = 5
+DEFAULT_FAILURE_RATE = 0.5
+DEFAULT_OPEN_SECONDS = 30.0
+
+# Requests per minute an upstream is allowed by default (0 turns the limiter off)
+# and how many may go out back to back
+DEFAULT_RATES = {"reverso": 120, "ankiweb": 60, "ankiconnect": 0}
+DEFAULT_BURST = 10
+
+CIRCUIT_STATE: metrics.Gauge = metrics.REGISTRY.register(metrics.Gauge(
+    "ankinizer_circuit_state", "Circuit breaker state per upstream (0 closed, 1 half-open, 2 open)", labels=("upstream",),
+))
+CIRCUIT_REJECTED: metrics.Counter = metrics.REGISTRY.register(metrics.Counter(
+    "ankinizer_circuit_rejected_total", "Calls failed fast because the upstream's circuit was open", labels=("upstream",),
+))
+RATE_LIMIT: metrics.Gauge = metrics.REGISTRY.register(metrics.Gauge(
+    "ankinizer_rate_limit_per_second", "Current adaptive request rate allowed per upstream", labels=("upstream",),
+))
+
+
+class CircuitOpenError(Exception):
+    """The upstream failed too often lately; calls fail fast until retry_after seconds have passed."""
+
+    def __init__(self, upstream: str, retry_after: float) -> None:
+        super().__init__(
+            f"{upstream.capitalize()} is having trouble right now, please try again in {max(1, round(retry_after))}s"
+        )
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Stops calling an upstream whose recent calls mostly fail.
+
+    Outcomes of the last window calls are kept; once at least min_calls are in
+    and failure_rate of them failed, the circuit opens and calls are refused
+    for open_seconds. After that one probe call is let through (half-open): its
+    success closes the circuit with a clean slate, its failure opens it again.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        window: int = DEFAULT_WINDOW,
+        min_calls: int = DEFAULT_MIN_CALLS,
+        failure_rate: float = DEFAULT_FAILURE_RATE,
+        open_seconds: float = DEFAULT_OPEN_SECONDS,
+        clock: typing.Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.open_seconds = open_seconds
+        self.clock = clock
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._outcomes: typing.Deque[bool] = collections.deque(maxlen=window)
+        self._probing = False
+        self._set_state(CLOSED)
+
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            logger.warning(f"Circuit for {self.name} is now {state}")
+        self.state = state
+        CIRCUIT_STATE.set(STATE_VALUES[state], upstream=self.name)
+
+    @property
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.open_seconds - self.clock())
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError unless a call may go out now."""
+        if self.state == OPEN and self.retry_after <= 0:
+            self._set_state(HALF_OPEN)
+        if self.state == CLOSED:
+            return
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return
+        CIRCUIT_REJECTED.inc(upstream=self.name)
+        raise CircuitOpenError(self.name, self.retry_after or self.open_seconds)
+
+    def record(self, success: bool) -> None:
+        if self.state == HALF_OPEN:
+            self._probing = False
+            if success:
+                self._outcomes.clear()
+                self._set_state(CLOSED)
+            else:
+                self._open()
+            return
+        self._outcomes.append(success)
+        failures = self._outcomes.count(False)
+        if len(self._outcomes) >= self.min_calls and failures >= self.failure_rate * len(self._outcomes):
+            self._open()
+
+    def release(self) -> None:
+        """A call let through by before_call ended without an outcome."""
+        self._probing = False
+
+    def _open(self) -> None:
+        self.opened_at = self.clock()
+        self._set_state(OPEN)
+
+
+class AdaptiveRateLimiter:
+    """Token bucket whose rate backs off when the upstream struggles.
+
+    Every failure halves the rate (down to min_rate), every success adds
+    back a tenth of max_rate; so a site that starts throttling or challenging
+    us gets fewer requests until it recovers, then the rate climbs back.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_rate: float,
+        burst: int = DEFAULT_BURST,
+        min_rate: Optional[float] = None,
+        clock: typing.Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self.max_rate = max_rate
+        self.min_rate = min_rate if min_rate is not None else max_rate / 20
+        self.rate = max_rate
+        self.burst = burst
+        self.clock = clock
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._lock = asyncio.Lock()
+        RATE_LIMIT.set(self.rate, upstream=name)
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        # The lock keeps waiters in line, each sleeps until its token is there
+        async with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                with metrics.span(f"{self.name}_rate_limit_wait"):
+                    await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+    def record(self, success: bool) -> None:
+        if success:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+        else:
+            self.rate = max(self.min_rate, self.rate / 2)
+        RATE_LIMIT.set(self.rate, upstream=self.name)
+
+
+class Upstream:
+    """A site we depend on, guarded by a circuit breaker and an optional rate limiter."""
+
+    def __init__(self, name: str, breaker: CircuitBreaker, limiter: Optional[AdaptiveRateLimiter] = None) -> None:
+        self.name = name
+        self.breaker = breaker
+        self.limiter = limiter
+
+    async def call(
+        self,
+        work: typing.Callable[[], typing.Awaitable[T]],
+        succeeded: typing.Callable[[T], bool] = lambda result: True,
+    ) -> T:
+        """Run work unless the circuit is open; exceptions and results failing succeeded count as failures.
+
+        AdmissionRejected is the exception: the bot turned the request away
+        itself, before the upstream was asked, so it counts for nothing.
+        """
+        self.breaker.before_call()
+        success: Optional[bool] = None
+        try:
+            if self.limiter is not None:
+                await self.limiter.acquire()
+            result = await work()
+            success = succeeded(result)
+            return result
+        except admission.AdmissionRejected:
+            raise
+        except Exception:
+            success = False
+            raise
+        finally:
+            if success is None:
+                # Cancelled or not admitted: nothing was learned about the upstream
+                self.breaker.release()
+            else:
+                self.breaker.record(success)
+                if self.limiter is not None:
+                    self.limiter.record(success)
+
+
+_upstreams: typing.Dict[str, Upstream] = {}
+
+
+def get_upstream(name: str) -> Upstream:
+    """The process-wide guard for name; ANKINIZER_<NAME>_RATE is its rate limit per minute."""
+    upstream = _upstreams.get(name)
+    if upstream is None:
+        per_minute = env.get_int(f"ANKINIZER_{name.upper()}_RATE", DEFAULT_RATES.get(name, 0))
+        limiter = AdaptiveRateLimiter(name, per_minute / 60) if per_minute > 0 else None
+        upstream = _upstreams[name] = Upstream(name, CircuitBreaker(name), limiter)
+    return upstream
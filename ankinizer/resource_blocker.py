@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import dataclasses
+import logging
+import os
+import typing
+import urllib.parse
+import weakref
+
+from ankinizer import env
+
+if typing.TYPE_CHECKING:
+    import playwright.async_api
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BLOCKED_RESOURCE_TYPES = ("image", "font", "media")
+DEFAULT_BLOCKED_HOSTS = (
+    "doubleclick.net",
+    "googlesyndication.com",
+    "googletagmanager.com",
+    "googletagservices.com",
+    "google-analytics.com",
+    "adservice.google.com",
+    "amazon-adsystem.com",
+    "criteo.com",
+    "criteo.net",
+    "facebook.net",
+    "hotjar.com",
+    "quantserve.com",
+    "scorecardresearch.com",
+    "taboola.com",
+    "outbrain.com",
+    "pubmatic.com",
+    "rubiconproject.com",
+    "adnxs.com",
+    "casalemedia.com",
+    "moatads.com",
+)
+
+
+def _env_list(name: str, default: typing.Iterable[str]) -> typing.Tuple[str, ...]:
+    value = os.environ.get(name)
+    if value is None:
+        return tuple(default)
+    return tuple(item.strip() for item in value.split(",") if item.strip())
+
+
+def _host_matches(host: str, domains: typing.Iterable[str]) -> bool:
+    return any(host == domain or host.endswith("." + domain) for domain in domains)
+
+
+@dataclasses.dataclass
+class BlockingRules:
+    blocked_resource_types: typing.Tuple[str, ...] = DEFAULT_BLOCKED_RESOURCE_TYPES
+    blocked_hosts: typing.Tuple[str, ...] = DEFAULT_BLOCKED_HOSTS
+    allowed_hosts: typing.Tuple[str, ...] = ()
+
+    @classmethod
+    def from_env(cls) -> "BlockingRules":
+        """Rules from ANKINIZER_BLOCK_RESOURCE_TYPES, ANKINIZER_BLOCK_HOSTS and ANKINIZER_ALLOW_HOSTS.
+
+        Each is a comma separated list; an empty value switches that rule off.
+        Blocked hosts are added to the built-in tracker list, allowed hosts win over both.
+        ANKINIZER_BLOCK_RESOURCES=0 lets everything through, e.g. to compare traffic.
+        """
+        if not env.get_int("ANKINIZER_BLOCK_RESOURCES", 1):
+            return cls(blocked_resource_types=(), blocked_hosts=())
+        return cls(
+            blocked_resource_types=_env_list("ANKINIZER_BLOCK_RESOURCE_TYPES", DEFAULT_BLOCKED_RESOURCE_TYPES),
+            blocked_hosts=DEFAULT_BLOCKED_HOSTS + _env_list("ANKINIZER_BLOCK_HOSTS", ()),
+            allowed_hosts=_env_list("ANKINIZER_ALLOW_HOSTS", ()),
+        )
+
+    def should_block(self, url: str, resource_type: str) -> bool:
+        host = urllib.parse.urlsplit(url).hostname or ""
+        if _host_matches(host, self.allowed_hosts):
+            return False
+        return resource_type in self.blocked_resource_types or _host_matches(host, self.blocked_hosts)
+
+
+@dataclasses.dataclass
+class NavigationStats:
+    allowed_requests: int = 0
+    blocked_requests: int = 0
+    received_bytes: int = 0
+    blocked_by_type: typing.Dict[str, int] = dataclasses.field(default_factory=dict)
+
+    def __str__(self) -> str:
+        return (
+            f"{self.allowed_requests} requests / {self.received_bytes} bytes loaded, "
+            f"{self.blocked_requests} requests blocked {self.blocked_by_type}"
+        )
+
+
+class ResourceBlocker:
+    """Aborts unwanted requests of one browser context and counts what was loaded and blocked.
+
+    Attached once when the context is created and left in place for its whole
+    life, so requests a page fires after the lookup is done are blocked too.
+    reset() starts the counts afresh for the next navigation.
+    """
+
+    def __init__(self, rules: typing.Optional[BlockingRules] = None) -> None:
+        self.rules = rules or BlockingRules.from_env()
+        self.stats = NavigationStats()
+
+    async def attach(self, context: playwright.async_api.BrowserContext) -> None:
+        await context.route("**/*", self._handle_route)
+        context.on("requestfinished", self._on_request_finished)
+        _blockers[context] = self
+
+    def reset(self) -> NavigationStats:
+        self.stats = NavigationStats()
+        return self.stats
+
+    async def _handle_route(self, route: playwright.async_api.Route) -> None:
+        request = route.request
+        if self.rules.should_block(request.url, request.resource_type):
+            self.stats.blocked_requests += 1
+            self.stats.blocked_by_type[request.resource_type] = self.stats.blocked_by_type.get(request.resource_type, 0) + 1
+            await route.abort("blockedbyclient")
+            return
+        self.stats.allowed_requests += 1
+        await route.continue_()
+
+    async def _on_request_finished(self, request: playwright.async_api.Request) -> None:
+        import playwright.async_api
+
+        try:
+            sizes = await request.sizes()
+        except playwright.async_api.Error:
+            return
+        self.stats.received_bytes += sizes["responseHeadersSize"] + sizes["responseBodySize"]
+
+
+_blockers: "weakref.WeakKeyDictionary[typing.Any, ResourceBlocker]" = weakref.WeakKeyDictionary()
+
+
+async def install(context: playwright.async_api.BrowserContext) -> None:
+    """Block resources in a new context with the rules from the environment; a browser pool setup_context hook."""
+    await ResourceBlocker().attach(context)
+
+
+def get_blocker(context: playwright.async_api.BrowserContext) -> typing.Optional[ResourceBlocker]:
+    return _blockers.get(context)
@@ -1,13 +1,70 @@
+from __future__ import annotations
+
 import asyncio
 import dataclasses
 import logging
+import os
 import typing
-from bs4 import BeautifulSoup
-from playwright.async_api import async_playwright, TimeoutError
+import urllib.parse
+from html import escape
+
+import httpx
+import lxml.etree
+import lxml.html
+
+from ankinizer import admission
+from ankinizer import browser_pool
+from ankinizer import metrics
+from ankinizer import resilience
+from ankinizer import resource_blocker
+from ankinizer import reverso_cache
+from ankinizer import reverso_http
+from ankinizer import singleflight
+
+if typing.TYPE_CHECKING:
+    import playwright.async_api
 
 
 logger = logging.getLogger(__name__)
 
+LANGUAGE_PAIR = "english-russian"
+REVERSO_URL = "https://context.reverso.net"
+
+# Lookup modes: "http" never starts a browser, "browser" always does,
+# "auto" tries plain HTTP first and falls back to the browser
+LOOKUP_MODES = ("auto", "http", "browser")
+
+MAX_USAGE_SAMPLES = 3
+
+# How a browser lookup gets results out of the page: "evaluate" runs
+# _EXTRACT_SCRIPT in the page and ships back only the terms and example
+# fragments, "content" ships the whole serialized DOM to parse here
+EXTRACT_MODES = ("evaluate", "content")
+
+# The same selectors as the lxml parser's XPaths, the examples capped at the
+# source; example fragments come back as HTML for _render_clean to clean
+_EXTRACT_SCRIPT = """limit => {
+    const terms = Array.from(
+        document.querySelectorAll('#translations-content .translation .display-term'),
+        element => element.textContent.trim(),
+    );
+    const examples = [];
+    for (const example of document.querySelectorAll('#examples-content .example')) {
+        if (limit !== null && examples.length >= limit) break;
+        const en = example.querySelector('.src .text');
+        const ru = example.querySelector('.trg .text');
+        if (en && ru) examples.push([en.outerHTML, ru.outerHTML]);
+    }
+    return {terms, examples};
+}"""
+
+# Concurrent lookups of the same word share one fetch
+_lookups: singleflight.Group["ReversoResult"] = singleflight.Group("reverso_lookup")
+
+CACHE_REQUESTS: metrics.Counter = metrics.REGISTRY.register(metrics.Counter(
+    "ankinizer_reverso_cache_requests_total", "Reverso cache lookups by result (hit, miss, stale)", labels=("result",)
+))
+
 @dataclasses.dataclass
 class PlaywrightParams:
     headless: bool = True
@@ -17,38 +74,148 @@ def replace_em_tags(text: str) -> str:
     """Replace <em> tags with <b> tags in the given text."""
     return text.replace("<em>", "<b>").replace("</em>", "</b>")
 
+
+def _has_class(name: str) -> str:
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+# Compiled equivalents of '#translations-content .translation .display-term',
+# '#examples-content .example', '.src .text' and '.trg .text'
+_TRANSLATION_TERMS = lxml.etree.XPath(
+    f"//*[@id='translations-content']//*[{_has_class('translation')}]//*[{_has_class('display-term')}]"
+)
+_EXAMPLES = lxml.etree.XPath(f"//*[@id='examples-content']//*[{_has_class('example')}]")
+_EXAMPLE_SRC = lxml.etree.XPath(f"(.//*[{_has_class('src')}]//*[{_has_class('text')}])[1]")
+_EXAMPLE_TRG = lxml.etree.XPath(f"(.//*[{_has_class('trg')}]//*[{_has_class('text')}])[1]")
+
+# Tags dropped from examples while keeping their content
+_UNWRAPPED_TAGS = frozenset(("span", "a"))
+_VOID_TAGS = frozenset(("area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"))
+
+
+def _render_attributes(element: lxml.html.HtmlElement) -> str:
+    parts = []
+    for name, value in element.attrib.items():
+        value = escape(value, quote=False)
+        # Quote the way BeautifulSoup did, so cleaned examples stay byte-identical
+        if '"' not in value:
+            parts.append(f' {name}="{value}"')
+        elif "'" not in value:
+            parts.append(f" {name}='{value}'")
+        else:
+            value = value.replace('"', "&quot;")
+            parts.append(f' {name}="{value}"')
+    return "".join(parts)
+
+
+def _render_children(element: lxml.html.HtmlElement, out: typing.List[str], replace_em: bool) -> None:
+    if element.text:
+        out.append(escape(element.text, quote=False))
+    for child in element:
+        _render_node(child, out, replace_em)
+        if child.tail:
+            out.append(escape(child.tail, quote=False))
+
+
+def _render_node(element: lxml.html.HtmlElement, out: typing.List[str], replace_em: bool) -> None:
+    tag = element.tag
+    if not isinstance(tag, str):
+        if isinstance(element, lxml.html.HtmlComment):
+            out.append(f"<!--{element.text or ''}-->")
+        return
+    if tag in _UNWRAPPED_TAGS:
+        _render_children(element, out, replace_em)
+        return
+    if replace_em and tag == "em":
+        tag = "b"
+    if tag in _VOID_TAGS:
+        out.append(f"<{tag}{_render_attributes(element)}/>")
+        return
+    out.append(f"<{tag}{_render_attributes(element)}>")
+    _render_children(element, out, replace_em)
+    out.append(f"</{tag}>")
+
+
+def _render_clean(element: lxml.html.HtmlElement, replace_em: bool) -> str:
+    out: typing.List[str] = []
+    _render_node(element, out, replace_em)
+    return "".join(out).strip()
+
+
+def _parse_document(text: str) -> typing.Optional[lxml.html.HtmlElement]:
+    if not text.strip():
+        return None
+    try:
+        return lxml.html.document_fromstring(text)
+    except lxml.etree.ParserError:
+        return None
+
+
+def _extract_examples(root: lxml.html.HtmlElement, replace_em: bool, limit: int | None) -> typing.List[typing.Tuple[str, str]]:
+    examples = []
+    for element in _EXAMPLES(root):
+        if limit is not None and len(examples) >= limit:
+            break
+        en_text = _EXAMPLE_SRC(element)
+        ru_text = _EXAMPLE_TRG(element)
+        if en_text and ru_text:
+            examples.append((_render_clean(en_text[0], replace_em), _render_clean(ru_text[0], replace_em)))
+    return examples
+
+
 def clean_html(text: str) -> str:
     """Clean HTML by removing span and a tags while preserving their content."""
-    soup = BeautifulSoup(text, 'html.parser')
-    # Remove span tags but keep their content
-    for span in soup.find_all('span'):
-        span.unwrap()
-    # Remove a tags but keep their content
-    for a in soup.find_all('a'):
-        a.unwrap()
-    return str(soup).strip()
+    out: typing.List[str] = []
+    for fragment in lxml.html.fragments_fromstring(text) if text.strip() else []:
+        if isinstance(fragment, str):
+            out.append(escape(fragment, quote=False))
+        else:
+            _render_node(fragment, out, replace_em=False)
+            if fragment.tail:
+                out.append(escape(fragment.tail, quote=False))
+    return "".join(out).strip()
 
 def parse_translations(html: str) -> typing.List[str]:
     """Parse translations from HTML content."""
-    soup = BeautifulSoup(html, 'html.parser')
-    translations = []
-    for element in soup.select('#translations-content .translation .display-term'):
-        translations.append(element.text.strip())
-    return translations
+    root = _parse_document(html)
+    if root is None:
+        return []
+    return [element.text_content().strip() for element in _TRANSLATION_TERMS(root)]
 
 def parse_examples(html: str) -> typing.List[typing.Dict[str, str]]:
     """Parse examples from HTML content."""
-    soup = BeautifulSoup(html, 'html.parser')
-    examples = []
-    for element in soup.select('#examples-content .example'):
-        en_text = element.select_one('.src .text')
-        ru_text = element.select_one('.trg .text')
-        if en_text and ru_text:
-            examples.append({
-                'en': clean_html(str(en_text)),
-                'ru': clean_html(str(ru_text))
-            })
-    return examples
+    root = _parse_document(html)
+    if root is None:
+        return []
+    return [{'en': en, 'ru': ru} for en, ru in _extract_examples(root, replace_em=False, limit=None)]
+
+def extract_page(html: str, max_examples: int | None = None) -> typing.Tuple[typing.List[str], typing.List["ReversoTranslationSample"]]:
+    """Translations and cleaned examples from a single parse of a Reverso page.
+
+    Examples come back with span/a tags unwrapped and <em> turned into <b>,
+    the same as running parse_examples, clean_html and replace_em_tags in turn.
+    """
+    root = _parse_document(html)
+    if root is None:
+        return [], []
+    translations = [element.text_content().strip() for element in _TRANSLATION_TERMS(root)]
+    samples = [
+        ReversoTranslationSample(en=en, ru=ru)
+        for en, ru in _extract_examples(root, replace_em=True, limit=max_examples)
+    ]
+    return translations, samples
+
+
+def parse_extracted(word: str, extracted: typing.Dict[str, typing.Any]) -> "ReversoResult":
+    """Build a ReversoResult from what _EXTRACT_SCRIPT returned, cleaned the same as parse_result."""
+    with metrics.span("reverso_parse"):
+        samples = [
+            ReversoTranslationSample(
+                en=_render_clean(lxml.html.fragment_fromstring(en), replace_em=True),
+                ru=_render_clean(lxml.html.fragment_fromstring(ru), replace_em=True),
+            )
+            for en, ru in extracted["examples"]
+        ]
+    return ReversoResult(en_word=word, ru_translations=extracted["terms"], usage_samples=samples)
 
 
 # global requests_count
@@ -68,7 +235,9 @@ def parse_examples(html: str) -> typing.List[typing.Dict[str, str]]:
 
 # requests.Session.send = custom_send
 
-@dataclasses.dataclass
+# Results are kept per user between lookup and answer, so they are slotted
+# and hold tuples rather than lists to stay small
+@dataclasses.dataclass(slots=True)
 class ReversoTranslationSample:
     en: str
     ru: str
@@ -80,11 +249,15 @@ class ReversoTranslationSample:
         return f"{self.en} -> {self.ru}"
 
 
-@dataclasses.dataclass
+@dataclasses.dataclass(slots=True)
 class ReversoResult:
     en_word: str
-    ru_translations: typing.List[str]
-    usage_samples: typing.List[ReversoTranslationSample]
+    ru_translations: typing.Tuple[str, ...]
+    usage_samples: typing.Tuple[ReversoTranslationSample, ...]
+
+    def __post_init__(self) -> None:
+        self.ru_translations = tuple(self.ru_translations)
+        self.usage_samples = tuple(self.usage_samples)
 
     def __repr__(self) -> str:
         return "\n".join(
@@ -98,34 +271,38 @@ class ReversoResult:
     def get_usage_samples_html(self) -> str:
         return "\n\n".join(str(sample) for sample in self.usage_samples)
 
-async def get_reverso_result(word: str, playwright_params: PlaywrightParams | None = None) -> ReversoResult:
-    """Get translation and examples from Reverso Context using Playwright.
-    
-    Args:
-        word: English word to translate
-        playwright_params: Optional parameters for Playwright browser
-        
-    Returns:
-        ReversoResult object with translations and examples
-    """
+    def to_dict(self) -> typing.Dict[str, typing.Any]:
+        return {
+            "en_word": self.en_word,
+            "ru_translations": list(self.ru_translations),
+            "usage_samples": [dataclasses.asdict(sample) for sample in self.usage_samples],
+        }
+
+    @classmethod
+    def from_dict(cls, data: typing.Dict[str, typing.Any]) -> "ReversoResult":
+        return cls(
+            en_word=data["en_word"],
+            ru_translations=tuple(data["ru_translations"]),
+            usage_samples=tuple(ReversoTranslationSample(**sample) for sample in data["usage_samples"]),
+        )
+
+def get_pool_params(playwright_params: PlaywrightParams | None = None, size: int | None = None) -> browser_pool.PoolParams:
+    """Browser pool configuration that makes Reverso see a regular desktop Chrome."""
     if playwright_params is None:
         playwright_params = PlaywrightParams()
-        logger.info(f"Playwright params: {playwright_params}")
-        
-    async with async_playwright() as p:
+    return browser_pool.PoolParams(
+        size=browser_pool.get_pool_size() if size is None else size,
+        name="reverso",
+        headless=playwright_params.headless,
+        slow_mo=playwright_params.slow_mo,
         # Configure browser to look more like a real user
-        browser = await p.chromium.launch(
-            headless=playwright_params.headless,
-            slow_mo=playwright_params.slow_mo,
-            args=[
-                '--disable-blink-features=AutomationControlled',
-                '--disable-features=IsolateOrigins,site-per-process',
-                '--disable-site-isolation-trials',
-            ]
-        )
-        
+        launch_args=[
+            '--disable-blink-features=AutomationControlled',
+            '--disable-features=IsolateOrigins,site-per-process',
+            '--disable-site-isolation-trials',
+        ],
         # Create a context with realistic viewport and user agent
-        context = await browser.new_context(
+        context_options=dict(
             viewport={'width': 1920, 'height': 1080},
             user_agent='Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36',
             locale='en-GB',
@@ -143,59 +320,172 @@ async def get_reverso_result(word: str, playwright_params: PlaywrightParams | No
                 'Sec-Fetch-Site': 'none',
                 'Sec-Fetch-User': '?1',
                 'Cache-Control': 'max-age=0',
-            }
-        )
-        
-        # Create a new page and set up realistic behavior
-        page = await context.new_page()
-        await page.set_extra_http_headers({
+            },
+        ),
+        page_headers={
             'DNT': '1',
             'Sec-Ch-Ua': '"Chromium";v="122", "Not(A:Brand";v="24", "Google Chrome";v="122"',
             'Sec-Ch-Ua-Mobile': '?0',
             'Sec-Ch-Ua-Platform': '"macOS"',
-        })
-        
-        # Add random mouse movements and delays to simulate human behavior
-        await page.mouse.move(100, 100)
-        await asyncio.sleep(0.5)
-        await page.mouse.move(200, 200)
-        await asyncio.sleep(0.5)
-        
-        # Navigate to Reverso Context
-        url = f"https://context.reverso.net/translation/english-russian/{word}"
-        logger.info(f"Navigating to {url}")
-        await page.goto(url, wait_until='networkidle')
-        
-        # Wait for translations and examples to load
+        },
+        setup_context=resource_blocker.install,
+    )
+
+def get_lookup_mode() -> str:
+    mode = os.environ.get("ANKINIZER_REVERSO_MODE", "auto")
+    if mode not in LOOKUP_MODES:
+        raise ValueError(f"Unknown ANKINIZER_REVERSO_MODE {mode!r}, expected one of {LOOKUP_MODES}")
+    return mode
+
+def get_extract_mode() -> str:
+    mode = os.environ.get("ANKINIZER_REVERSO_EXTRACT", "evaluate")
+    if mode not in EXTRACT_MODES:
+        raise ValueError(f"Unknown ANKINIZER_REVERSO_EXTRACT {mode!r}, expected one of {EXTRACT_MODES}")
+    return mode
+
+def get_translation_url(word: str) -> str:
+    base_url = os.environ.get("ANKINIZER_REVERSO_URL", REVERSO_URL).rstrip("/")
+    return f"{base_url}/translation/{LANGUAGE_PAIR}/{urllib.parse.quote(word)}"
+
+async def _open_translation_page(page: playwright.async_api.Page, word: str) -> None:
+    import playwright.async_api
+
+    # Navigate to Reverso Context
+    url = get_translation_url(word)
+    logger.info(f"Navigating to {url}")
+    with metrics.span("reverso_goto"):
+        await page.goto(url, wait_until='domcontentloaded')
+
+    # Once the document is parsed the translations and examples are complete,
+    # no need to wait for ads and analytics to go quiet
+    with metrics.span("reverso_wait_selectors"):
         try:
-            await page.wait_for_selector("#translations-content", timeout=10000)
-        except TimeoutError:
+            await page.wait_for_selector("#translations-content", state='attached', timeout=10000)
+        except playwright.async_api.TimeoutError:
             await page.screenshot(path="screenshot.png")
             logger.error("Timeout waiting for translations content")
             raise
-        await page.wait_for_selector("#examples-content", timeout=10000)
-        
-        # Get page content
-        content = await page.content()
-        
-        await context.close()
-        await browser.close()
-        
-        # Parse translations and examples using BeautifulSoup
-        translations = parse_translations(content)
-        examples = parse_examples(content)
+        await page.wait_for_selector("#examples-content", state='attached', timeout=10000)
+
+async def _extract_in_page(page: playwright.async_api.Page, word: str) -> ReversoResult | None:
+    """Run _EXTRACT_SCRIPT in the page; None when the full page should be parsed instead."""
+    import playwright.async_api
+
+    try:
+        with metrics.span("reverso_page_evaluate"):
+            extracted = await page.evaluate(_EXTRACT_SCRIPT, MAX_USAGE_SAMPLES)
+    except playwright.async_api.Error as e:
+        logger.warning(f"In-page extraction for {word=} failed, parsing the page instead: {e}")
+        return None
+    if not extracted["terms"]:
+        # Rule out the script missing what the parser would find before reporting nothing
+        return None
+    return parse_extracted(word, extracted)
+
+async def _fetch_from_browser(pool: browser_pool.BrowserPool, word: str) -> ReversoResult:
+    async with pool.acquire() as page:
+        blocker = resource_blocker.get_blocker(page.context)
+        stats = blocker.reset() if blocker is not None else None
+        await _open_translation_page(page, word)
+        result = None
+        if get_extract_mode() == "evaluate":
+            result = await _extract_in_page(page, word)
+        if result is None:
+            with metrics.span("reverso_page_content"):
+                content = await page.content()
+            result = parse_result(word, content)
+        if stats is not None:
+            logger.info(f"Lookup {word=}: {stats}")
+        return result
+
+async def get_reverso_result(
+    word: str,
+    playwright_params: PlaywrightParams | None = None,
+    use_cache: bool = True,
+    on_queued: admission.OnQueued | None = None,
+) -> ReversoResult:
+    """Get translation and examples from Reverso Context using Playwright.
+    
+    Args:
+        word: English word to translate
+        playwright_params: Optional parameters for Playwright browser
+        use_cache: Set to False to bypass the on-disk result cache
+        on_queued: Called with the place in line if the lookup has to wait for a browser
         
-        # Create ReversoResult object with <em> tags replaced by <b> tags
-        return ReversoResult(
-            en_word=word,
-            ru_translations=translations,
-            usage_samples=[
-                ReversoTranslationSample(
-                    en=replace_em_tags(e['en']),
-                    ru=replace_em_tags(e['ru'])
-                ) for e in examples[:3]
-            ]
-        )
+    Returns:
+        ReversoResult object with translations and examples
+    """
+    use_cache = use_cache and reverso_cache.is_enabled()
+    if use_cache:
+        cached = reverso_cache.get_cache().get(word, LANGUAGE_PAIR)
+        CACHE_REQUESTS.inc(result="miss" if cached is None else "hit")
+        if cached is not None:
+            logger.info(f"Cache hit for {word=}: {reverso_cache.get_cache().stats()}")
+            result = ReversoResult.from_dict(cached)
+            result.en_word = word
+            return result
+
+    async def lookup() -> ReversoResult:
+        with metrics.track("reverso_lookup"):
+            return await resilience.get_upstream("reverso").call(lambda: _lookup(word, playwright_params, on_queued))
+
+    try:
+        if playwright_params is None:
+            key = (reverso_cache.normalize_word(word), LANGUAGE_PAIR)
+            shared_result = await _lookups.do(key, lookup)
+            # Callers change their result (e.g. trim translations), give each its own
+            result = ReversoResult.from_dict(shared_result.to_dict())
+            result.en_word = word
+        else:
+            result = await lookup()
+    except resilience.CircuitOpenError:
+        stale = reverso_cache.get_cache().get_stale(word, LANGUAGE_PAIR) if use_cache else None
+        if stale is None:
+            raise
+        logger.warning(f"Reverso circuit is open, serving {word=} from expired cache")
+        CACHE_REQUESTS.inc(result="stale")
+        result = ReversoResult.from_dict(stale)
+        result.en_word = word
+        return result
+    if use_cache and result.ru_translations:
+        reverso_cache.get_cache().put(word, LANGUAGE_PAIR, result.to_dict())
+    return result
+
+async def _lookup(word: str, playwright_params: PlaywrightParams | None, on_queued: admission.OnQueued | None = None) -> ReversoResult:
+    mode = get_lookup_mode()
+    # Explicit Playwright params mean the caller wants to watch the browser
+    if mode != "browser" and playwright_params is None:
+        try:
+            with metrics.span("reverso_http_fetch"):
+                content = await reverso_http.fetch_html(get_translation_url(word))
+        except (reverso_http.BotChallengeError, httpx.HTTPError) as e:
+            if mode == "http":
+                raise
+            logger.warning(f"HTTP lookup for {word=} failed, falling back to browser: {e}")
+        else:
+            result = parse_result(word, content)
+            if result.ru_translations or mode == "http":
+                return result
+            logger.warning(f"HTTP lookup for {word=} parsed nothing, falling back to browser")
+
+    # Only browser lookups take an admission slot; cache hits, HTTP lookups and
+    # callers sharing another caller's lookup never wait for one
+    async with admission.get_controller().admit(on_queued):
+        pool = browser_pool.get_pool()
+        if pool is not None:
+            return await _fetch_from_browser(pool, word)
+        # No shared pool running (e.g. a one-off script), spin up a private one
+        if playwright_params is None:
+            playwright_params = PlaywrightParams()
+            logger.info(f"Playwright params: {playwright_params}")
+        async with browser_pool.BrowserPool(get_pool_params(playwright_params, size=1)) as pool:
+            return await _fetch_from_browser(pool, word)
+
+def parse_result(word: str, content: str) -> ReversoResult:
+    """Build a ReversoResult from a Reverso Context translation page."""
+    with metrics.span("reverso_parse"):
+        translations, samples = extract_page(content, max_examples=MAX_USAGE_SAMPLES)
+    return ReversoResult(en_word=word, ru_translations=translations, usage_samples=samples)
 
 async def main():
     result = await get_reverso_result(
@@ -0,0 +1,117 @@
+import dataclasses
+import json
+import logging
+import sqlite3
+import time
+import typing
+from pathlib import Path
+from typing import Optional
+
+from ankinizer import env
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_SECONDS = 30 * 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 5000
+
+
+def normalize_word(word: str) -> str:
+    return " ".join(word.lower().split())
+
+
+@dataclasses.dataclass
+class CacheStats:
+    hits: int
+    misses: int
+    entries: int
+
+
+class ReversoCache:
+    """SQLite-backed cache of parsed Reverso lookups.
+
+    Entries expire ``ttl_seconds`` after they were stored. Expired entries
+    are misses but are kept until evicted, so get_stale can still serve them
+    while Reverso is down. When more than ``max_entries`` are stored, the
+    least recently read ones are evicted.
+    """
+
+    def __init__(self, path: Path, ttl_seconds: int = DEFAULT_TTL_SECONDS, max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._db = sqlite3.connect(str(path))
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY,"
+            " payload TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+        self._db.commit()
+
+    @staticmethod
+    def make_key(word: str, language_pair: str) -> str:
+        return f"{language_pair}:{normalize_word(word)}"
+
+    def get(self, word: str, language_pair: str) -> Optional[typing.Dict[str, typing.Any]]:
+        key = self.make_key(word, language_pair)
+        row = self._db.execute("SELECT payload, created_at FROM entries WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        if row is None or now - row[1] > self.ttl_seconds:
+            self.misses += 1
+            return None
+        self._db.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+        self._db.commit()
+        self.hits += 1
+        return json.loads(row[0])
+
+    def get_stale(self, word: str, language_pair: str) -> Optional[typing.Dict[str, typing.Any]]:
+        """Like get, but expired entries are returned too."""
+        row = self._db.execute("SELECT payload FROM entries WHERE key = ?", (self.make_key(word, language_pair),)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def put(self, word: str, language_pair: str, payload: typing.Dict[str, typing.Any]) -> None:
+        now = time.time()
+        self._db.execute(
+            "INSERT OR REPLACE INTO entries (key, payload, created_at, last_access) VALUES (?, ?, ?, ?)",
+            (self.make_key(word, language_pair), json.dumps(payload, ensure_ascii=False), now, now),
+        )
+        self._db.execute(
+            "DELETE FROM entries WHERE key IN ("
+            " SELECT key FROM entries ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+        self._db.commit()
+
+    def clear(self) -> None:
+        self._db.execute("DELETE FROM entries")
+        self._db.commit()
+
+    def stats(self) -> CacheStats:
+        (entries,) = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()
+        return CacheStats(hits=self.hits, misses=self.misses, entries=entries)
+
+    def close(self) -> None:
+        self._db.close()
+
+
+_cache: Optional[ReversoCache] = None
+
+
+def is_enabled() -> bool:
+    return env.get_int("ANKINIZER_REVERSO_CACHE", 1) != 0
+
+
+def get_cache() -> ReversoCache:
+    """Process-wide cache stored in the data dir, created on first use."""
+    global _cache
+    if _cache is None:
+        _cache = ReversoCache(
+            env.data_dir() / "reverso_cache.sqlite3",
+            ttl_seconds=env.get_int("ANKINIZER_REVERSO_CACHE_TTL", DEFAULT_TTL_SECONDS),
+            max_entries=env.get_int("ANKINIZER_REVERSO_CACHE_SIZE", DEFAULT_MAX_ENTRIES),
+        )
+    return _cache
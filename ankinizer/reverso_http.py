@@ -0,0 +1,70 @@
+import importlib.util
+import logging
+from typing import Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
+    'Accept-Language': 'en-GB,en;q=0.9',
+    'DNT': '1',
+    'Upgrade-Insecure-Requests': '1',
+    'Sec-Fetch-Dest': 'document',
+    'Sec-Fetch-Mode': 'navigate',
+    'Sec-Fetch-Site': 'none',
+    'Sec-Fetch-User': '?1',
+}
+
+# Status codes and page markers Reverso's bot protection answers with
+CHALLENGE_STATUS_CODES = (403, 429, 503)
+CHALLENGE_MARKERS = ("challenge-platform", "cf-challenge", "<title>Just a moment...</title>", "g-recaptcha")
+
+
+class BotChallengeError(Exception):
+    """Reverso answered with a bot check instead of the translation page."""
+
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Process-wide keep-alive client; cookies set by Reverso stick to it."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            headers=HEADERS,
+            # HTTP/2 needs the optional h2 package, keep-alive HTTP/1.1 otherwise
+            http2=importlib.util.find_spec("h2") is not None,
+            follow_redirects=True,
+            timeout=httpx.Timeout(10.0),
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=5, keepalive_expiry=60.0),
+        )
+    return _client
+
+
+async def close_client() -> None:
+    global _client
+    client, _client = _client, None
+    if client is not None:
+        await client.aclose()
+
+
+async def fetch_html(url: str) -> str:
+    """GET a Reverso page without a browser.
+
+    Raises:
+        BotChallengeError: if the response is a bot check
+        httpx.HTTPError: on network errors and other non-2xx answers
+    """
+    logger.info(f"Fetching {url} over HTTP")
+    response = await get_client().get(url)
+    if response.status_code in CHALLENGE_STATUS_CODES:
+        raise BotChallengeError(f"{url} answered with HTTP {response.status_code}")
+    response.raise_for_status()
+    html = response.text
+    if any(marker in html for marker in CHALLENGE_MARKERS):
+        raise BotChallengeError(f"{url} answered with a challenge page")
+    return html
@@ -0,0 +1,157 @@
+import asyncio
+import collections
+import contextlib
+import dataclasses
+import logging
+import sys
+import time
+import typing
+from typing import Any, Optional
+
+from telegram.ext import Application
+
+from ankinizer import env
+from ankinizer import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_IDLE_TTL = 30 * 60
+DEFAULT_MAX_USERS = 1000
+DEFAULT_MAX_PENDING = 10
+
+SESSIONS: metrics.Gauge = metrics.REGISTRY.register(metrics.Gauge(
+    "ankinizer_sessions", "Users with conversation state held in memory",
+    callback=lambda: get_store().count() if get_store() is not None else 0,
+))
+SESSION_BYTES: metrics.Gauge = metrics.REGISTRY.register(metrics.Gauge(
+    "ankinizer_session_bytes", "Approximate memory held by conversation state",
+    callback=lambda: get_store().size_bytes() if get_store() is not None else 0,
+))
+SESSIONS_EVICTED: metrics.Counter = metrics.REGISTRY.register(metrics.Counter(
+    "ankinizer_sessions_evicted_total", "Conversation state dropped, by reason (idle, limit)", labels=("reason",),
+))
+
+
+def deep_sizeof(obj: Any, seen: Optional[typing.Set[int]] = None) -> int:
+    """sys.getsizeof of obj and everything it holds, each object counted once."""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        size += sum(deep_sizeof(getattr(obj, field.name), seen) for field in dataclasses.fields(obj))
+    return size
+
+
+class SessionStore:
+    """Bounds the per-user conversation state PTB keeps in application.user_data.
+
+    PTB holds each user's user_data for the life of the process. Here users
+    are tracked by last activity: state idle for idle_ttl seconds is dropped
+    by sweep(), and beyond max_users the least recently active user's state
+    goes first. A handler finding its state gone asks the user to send the
+    word again. The ConversationHandler's own per-user state expires after the
+    same idle_ttl through its conversation_timeout.
+    """
+
+    def __init__(
+        self,
+        application: Application,
+        idle_ttl: float = DEFAULT_IDLE_TTL,
+        max_users: int = DEFAULT_MAX_USERS,
+        max_pending: int = DEFAULT_MAX_PENDING,
+    ) -> None:
+        self.application = application
+        self.idle_ttl = idle_ttl
+        self.max_users = max_users
+        self.max_pending = max_pending
+        # user id -> monotonic time of the last update, least recent first
+        self._last_seen: typing.OrderedDict[int, float] = collections.OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+
+    def touch(self, user_id: int) -> None:
+        self._last_seen[user_id] = time.monotonic()
+        self._last_seen.move_to_end(user_id)
+        while len(self._last_seen) > self.max_users:
+            oldest = next(iter(self._last_seen))
+            self.evict(oldest, "limit")
+
+    def evict(self, user_id: int, reason: str) -> None:
+        self._last_seen.pop(user_id, None)
+        if user_id in self.application.user_data:
+            self.application.drop_user_data(user_id)
+            SESSIONS_EVICTED.inc(reason=reason)
+
+    def sweep(self) -> int:
+        """Drop the state of users idle for longer than idle_ttl; returns how many."""
+        deadline = time.monotonic() - self.idle_ttl
+        idle = [user_id for user_id, seen in self._last_seen.items() if seen < deadline]
+        for user_id in idle:
+            self.evict(user_id, "idle")
+        if idle:
+            logger.info(f"Dropped conversation state of {len(idle)} idle users")
+        return len(idle)
+
+    def cap_pending(self, pending: typing.Dict[str, Any]) -> None:
+        """Keep only the newest max_pending results of a multi-word lookup waiting for an answer."""
+        while len(pending) > self.max_pending:
+            pending.pop(next(iter(pending)))
+
+    def count(self) -> int:
+        return sum(1 for data in self.application.user_data.values() if data)
+
+    def size_bytes(self) -> int:
+        return deep_sizeof(dict(self.application.user_data))
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(min(self.idle_ttl / 4, 60.0))
+            self.sweep()
+
+    def start(self) -> None:
+        if self.idle_ttl > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+
+
+_store: Optional[SessionStore] = None
+
+
+def get_idle_ttl() -> int:
+    return env.get_int("ANKINIZER_SESSION_TTL", DEFAULT_IDLE_TTL)
+
+
+def get_store() -> Optional[SessionStore]:
+    return _store
+
+
+def start(application: Application) -> SessionStore:
+    """Track the application's users; ANKINIZER_SESSION_TTL=0 turns idle eviction off."""
+    global _store
+    if _store is None:
+        _store = SessionStore(
+            application,
+            idle_ttl=get_idle_ttl(),
+            max_users=env.get_int("ANKINIZER_SESSION_MAX_USERS", DEFAULT_MAX_USERS),
+            max_pending=env.get_int("ANKINIZER_SESSION_MAX_PENDING", DEFAULT_MAX_PENDING),
+        )
+        _store.start()
+    return _store
+
+
+async def stop() -> None:
+    global _store
+    store, _store = _store, None
+    if store is not None:
+        await store.stop()
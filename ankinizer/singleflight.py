@@ -0,0 +1,72 @@
+import asyncio
+import dataclasses
+import logging
+import typing
+
+from ankinizer import metrics
+
+logger = logging.getLogger(__name__)
+
+T = typing.TypeVar("T")
+
+CALLS: metrics.Counter = metrics.REGISTRY.register(metrics.Counter(
+    "ankinizer_singleflight_calls_total",
+    "Calls through a single-flight group, by whether they started the work (leader) or joined it (shared)",
+    labels=("group", "role"),
+))
+
+
+@dataclasses.dataclass
+class _Call:
+    task: asyncio.Task
+    waiters: int = 0
+
+
+class Group(typing.Generic[T]):
+    """Runs the work for a key once, however many callers ask for it concurrently.
+
+    The first caller starts the work as a task and later callers with the same
+    key await that task instead of starting their own; the key is forgotten as
+    soon as the task finishes, so this is not a cache. A caller that is
+    cancelled just stops waiting; the work itself is only cancelled once every
+    caller waiting for it is gone.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._calls: typing.Dict[typing.Hashable, _Call] = {}
+
+    def in_flight(self, key: typing.Hashable) -> bool:
+        return key in self._calls
+
+    async def do(self, key: typing.Hashable, work: typing.Callable[[], typing.Awaitable[T]]) -> T:
+        """Result of work for key; every caller gets the same object."""
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.ensure_future(work()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._on_done(key, call))
+            CALLS.inc(group=self.name, role="leader")
+        else:
+            CALLS.inc(group=self.name, role="shared")
+        call.waiters += 1
+        try:
+            # shield: cancelling this caller must not cancel the work for the others
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                logger.info(f"Nobody waits for {self.name} {key!r} anymore, cancelling it")
+                call.task.cancel()
+                # A caller arriving before the task has wound down starts afresh
+                self._forget(key, call)
+
+    def _forget(self, key: typing.Hashable, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def _on_done(self, key: typing.Hashable, call: _Call) -> None:
+        self._forget(key, call)
+        if not call.task.cancelled():
+            # Retrieve the exception so a failure nobody waits for anymore isn't logged as unhandled
+            call.task.exception()
@@ -0,0 +1,114 @@
+from unittest.mock import AsyncMock, MagicMock, call
+
+import pytest
+from telegram import CallbackQuery, Message, Update
+from telegram.ext import CallbackContext
+
+from ankinizer import added_index
+from ankinizer import anki_agent
+from ankinizer import reverso_agent
+from ankinizer import tgram
+from ankinizer.anki_connect import AnkiConnectBackend
+from ankinizer.benchmarks import fakes
+
+
+def make_result(word):
+    return reverso_agent.ReversoResult(
+        en_word=word,
+        ru_translations=["тест"],
+        usage_samples=[reverso_agent.ReversoTranslationSample(en=f"A <b>{word}</b>.", ru="<b>Тест</b>.")],
+    )
+
+
+def test_word_from_front():
+    result = make_result("Take for  granted")
+    assert added_index.word_from_front(anki_agent.format_front_html(result)) == "take for granted"
+    assert added_index.word_from_front("<b>rock &amp; roll</b><br>whatever") == "rock & roll"
+
+
+def test_index_keeps_first_entry_until_forgotten(empty_added_index):
+    index = empty_added_index
+    index.record("Test", "front", "back")
+    assert index.record_many([("test", "other"), ("new", "hash")], added_index.SYNC) == 1
+
+    entry = index.get(" TEST ")
+    assert entry.source == added_index.BOT
+    assert entry.content_hash == added_index.content_hash("front", "back")
+    assert index.count() == 2
+    assert index.forget("test")
+    assert index.get("test") is None
+
+
+@pytest.mark.asyncio
+async def test_sync_indexes_existing_deck_notes(monkeypatch, empty_added_index):
+    anki = fakes.FakeAnkiWeb()
+    await anki.start()
+    anki.notes = [
+        {"fields": {"Front": anki_agent.format_front_html(make_result("serendipity")), "Back": "b"}},
+        {"front": "Run<div>sample</div>", "back": "b"},
+    ]
+    backend = AnkiConnectBackend(url=anki.url)
+    monkeypatch.setattr(anki_agent, "_backend", backend)
+    try:
+        assert await added_index.sync_from_deck() == 2
+    finally:
+        await backend.close()
+        await anki.stop()
+
+    assert empty_added_index.get("serendipity").source == added_index.SYNC
+    assert empty_added_index.get("run") is not None
+    assert empty_added_index.synced_at is not None
+
+
+@pytest.mark.asyncio
+async def test_seeding_on_ankiweb_is_skipped_quietly(monkeypatch, empty_added_index, caplog):
+    monkeypatch.setattr(anki_agent, "_backend", anki_agent.AnkiWebBackend())
+    with caplog.at_level("INFO"):
+        await added_index.seed_once()
+    assert [r.levelname for r in caplog.records if r.name == added_index.__name__] == ["INFO"]
+    assert empty_added_index.synced_at is None
+
+@pytest.mark.asyncio
+async def test_add_skips_words_the_deck_has(monkeypatch, empty_added_index):
+    backend = MagicMock(spec=anki_agent.AnkiBackend)
+    backend.add_card = AsyncMock(return_value=True)
+    backend.add_cards = AsyncMock(side_effect=lambda results: [anki_agent.CardReport(r.en_word, True) for r in results])
+    monkeypatch.setattr(anki_agent, "_backend", backend)
+
+    assert await anki_agent.add_card_to_anki(make_result("first"))
+    assert await anki_agent.add_card_to_anki(make_result("First"))
+    backend.add_card.assert_awaited_once()
+
+    reports = await anki_agent.add_cards_to_anki([make_result("new"), make_result("first")])
+    assert [(r.en_word, r.added, r.already_added) for r in reports] == [("new", True, False), ("first", True, True)]
+    assert [r.en_word for r in backend.add_cards.await_args.args[0]] == ["new"]
+    assert empty_added_index.get("new") is not None
+
+
+@pytest.mark.asyncio
+async def test_bot_warns_on_lookup_and_skips_add(monkeypatch, empty_added_index):
+    result = make_result("test")
+    empty_added_index.record("test", "front", "back")
+    monkeypatch.setattr(reverso_agent, "get_reverso_result", AsyncMock(return_value=result))
+    add_card = AsyncMock()
+    monkeypatch.setattr(anki_agent, "add_card_to_anki", add_card)
+    update = MagicMock(spec=Update)
+    update.message = MagicMock(spec=Message)
+    update.message.text = "test"
+    update.message.reply_text.return_value = MagicMock(spec=Message)
+    update.callback_query = MagicMock(spec=CallbackQuery)
+    update.callback_query.message = MagicMock(spec=Message)
+    context = MagicMock(spec=CallbackContext)
+    context.user_data = {}
+
+    await tgram.get_word(update, context)
+    notice = tgram.already_added_notice("test")
+    assert notice.startswith("Already in your Anki deck, added ")
+    update.message.reply_text.assert_called_once_with(f"Looking up test... ({notice})")
+
+    update.callback_query.data = tgram.AcceptBoth.key
+    await tgram.accept_or_decline(update, context)
+    add_card.assert_not_awaited()
+    assert update.callback_query.edit_message_text.call_args == call(
+        tgram.render_result_html(result, f"{notice}, not adding it again"), parse_mode=tgram.ParseMode.HTML
+    )
@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+from ankinizer import admission
+
+
+@pytest.mark.asyncio
+async def test_waiters_are_admitted_in_order_and_told_their_place():
+    controller = admission.AdmissionController(max_sessions=1, max_queue=5)
+    release = asyncio.Event()
+    order, positions = [], []
+
+    async def job(name):
+        async def on_queued(position):
+            positions.append((name, position))
+        async with controller.admit(on_queued):
+            order.append(name)
+            await release.wait()
+
+    tasks = [asyncio.create_task(job(name)) for name in "abc"]
+    await asyncio.sleep(0)
+    assert (controller.active, controller.queued) == (1, 2)
+    release.set()
+    await asyncio.gather(*tasks)
+
+    assert order == ["a", "b", "c"]
+    assert positions == [("b", 1), ("c", 2)]
+    assert (controller.active, controller.queued) == (0, 0)
+
+
+@pytest.mark.asyncio
+async def test_failing_queue_notice_keeps_the_place_in_line():
+    controller = admission.AdmissionController(max_sessions=1, max_queue=5)
+    release = asyncio.Event()
+    admitted = []
+
+    async def on_queued(position):
+        raise RuntimeError("message to edit not found")
+
+    async def job(name, notice=None):
+        async with controller.admit(notice):
+            admitted.append(name)
+            await release.wait()
+
+    tasks = [asyncio.create_task(job("a")), asyncio.create_task(job("b", on_queued))]
+    await asyncio.sleep(0)
+    assert controller.queued == 1
+    release.set()
+    await asyncio.gather(*tasks)
+    assert admitted == ["a", "b"]
+
+
+@pytest.mark.asyncio
+async def test_full_queue_is_rejected_right_away():
+    controller = admission.AdmissionController(max_sessions=1, max_queue=1)
+    release = asyncio.Event()
+
+    async def job():
+        async with controller.admit():
+            await release.wait()
+
+    tasks = [asyncio.create_task(job()) for _ in range(2)]
+    await asyncio.sleep(0)
+    with pytest.raises(admission.AdmissionRejected) as rejected:
+        async with controller.admit():
+            pass
+    assert rejected.value.queued == 1
+    release.set()
+    await asyncio.gather(*tasks)
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_gives_up_its_place():
+    controller = admission.AdmissionController(max_sessions=1, max_queue=5)
+    release = asyncio.Event()
+    admitted = []
+
+    async def job(name):
+        async with controller.admit():
+            admitted.append(name)
+            await release.wait()
+
+    first = asyncio.create_task(job("first"))
+    cancelled = asyncio.create_task(job("cancelled"))
+    last = asyncio.create_task(job("last"))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    release.set()
+    await asyncio.gather(first, last)
+
+    assert admitted == ["first", "last"]
+    assert (controller.active, controller.queued) == (0, 0)
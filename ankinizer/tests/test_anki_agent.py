@@ -1,4 +1,10 @@
+import asyncio
+
+import playwright.async_api
 import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from ankinizer import anki_agent
 from ankinizer.anki_agent import format_front_html, format_back_html
 from ankinizer.reverso_agent import ReversoResult, ReversoTranslationSample
 
@@ -141,4 +147,127 @@ def test_format_html_integration():
             "I wish I knew what he meant by \"<b>serendipity</b>\". -> Хотелось бы мне знать, что он имел в виду под \"<b>интуитивной прозорливостью</b>\"."
         ])
     )
-    assert format_back_html(result) == back_expected 
\ No newline at end of file
+    assert format_back_html(result) == back_expected 
+
+class FakeSession:
+    def __init__(self, editor_ready):
+        self.lock = asyncio.Lock()
+        self.editor_ready = editor_ready
+        self.opened = 0
+        self.pages = 0
+
+    async def open_add_editor(self):
+        if not self.editor_ready:
+            self.opened += 1
+        self.editor_ready = True
+        return MagicMock()
+
+    def invalidate_editor(self):
+        self.editor_ready = False
+
+    def page_done(self):
+        self.pages += 1
+
+
+@pytest.mark.asyncio
+async def test_reused_editor_is_retried_once():
+    session = FakeSession(editor_ready=True)
+    fill = AsyncMock(side_effect=[anki_agent.AnkiStepTimeout("fill front"), True])
+    with patch("ankinizer.anki_agent._fill_card", fill):
+        assert await anki_agent._add_card_with_session(session, MagicMock())
+    assert fill.await_count == 2
+    assert session.opened == 1
+    assert session.editor_ready
+    assert session.pages == 2
+
+
+@pytest.mark.asyncio
+async def test_fresh_editor_failure_is_not_retried():
+    session = FakeSession(editor_ready=False)
+    fill = AsyncMock(side_effect=anki_agent.AnkiStepTimeout("fill front"))
+    with patch("ankinizer.anki_agent._fill_card", fill):
+        with pytest.raises(anki_agent.AnkiStepTimeout):
+            await anki_agent._add_card_with_session(session, MagicMock())
+    assert fill.await_count == 1
+    assert not session.editor_ready
+
+
+@pytest.mark.asyncio
+async def test_failure_after_pressing_add_is_not_retried():
+    session = FakeSession(editor_ready=True)
+    fill = AsyncMock(side_effect=anki_agent.AnkiAddUnconfirmed("test"))
+    with patch("ankinizer.anki_agent._fill_card", fill):
+        with pytest.raises(anki_agent.AnkiAddUnconfirmed):
+            await anki_agent._add_card_with_session(session, MagicMock())
+    assert fill.await_count == 1
+    assert not session.editor_ready
+
+
+@pytest.mark.asyncio
+async def test_add_cards_flags_unconfirmed_adds():
+    session = FakeSession(editor_ready=True)
+    fill = AsyncMock(side_effect=anki_agent.AnkiAddUnconfirmed("a"))
+    with patch("ankinizer.anki_agent._fill_card", fill):
+        (report,) = await anki_agent._add_cards_with_session(session, [MagicMock(en_word="a")])
+    assert (report.added, report.unconfirmed) == (False, True)
+    assert fill.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_fill_card_reports_unconfirmed_add():
+    page = MagicMock()
+    page.screenshot = AsyncMock()
+    page.get_by_role.return_value.click = AsyncMock()
+    page.get_by_text.return_value.wait_for = AsyncMock(
+        side_effect=playwright.async_api.TimeoutError("Timeout 10000ms exceeded")
+    )
+    result = ReversoResult(en_word="test", ru_translations=["тест"], usage_samples=[])
+    with patch("ankinizer.anki_agent._set_field_html", AsyncMock(return_value="test")):
+        with pytest.raises(anki_agent.AnkiAddUnconfirmed) as excinfo:
+            await anki_agent._fill_card(page, result)
+    assert isinstance(excinfo.value.__cause__, anki_agent.AnkiStepTimeout)
+    assert excinfo.value.__cause__.step == "Add: confirmation"
+
+
+@pytest.mark.asyncio
+async def test_add_cards_reports_each_card():
+    session = FakeSession(editor_ready=False)
+    results = [ReversoResult(en_word=word, ru_translations=[], usage_samples=[]) for word in ("a", "b", "c")]
+    error = playwright.async_api.Error("boom")
+    # "b" fails in the reused editor and again after the retry from the deck list
+    fill = AsyncMock(side_effect=[True, error, error, True])
+    with patch("ankinizer.anki_agent._fill_card", fill):
+        reports = await anki_agent._add_cards_with_session(session, results)
+    assert reports == [
+        anki_agent.CardReport(en_word="a", added=True),
+        anki_agent.CardReport(en_word="b", added=False, error="boom"),
+        anki_agent.CardReport(en_word="c", added=True),
+    ]
+    assert session.opened == 3
+
+
+@pytest.mark.asyncio
+async def test_step_timeout_names_the_step():
+    page = MagicMock()
+    page.screenshot = AsyncMock()
+    with pytest.raises(anki_agent.AnkiStepTimeout) as excinfo:
+        async with anki_agent._step(page, "Back: content kept by editor"):
+            raise playwright.async_api.TimeoutError("Timeout 10000ms exceeded")
+    assert excinfo.value.step == "Back: content kept by editor"
+    assert "Back: content kept by editor" in str(excinfo.value)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_first_callers_share_one_session(monkeypatch):
+    monkeypatch.setattr(anki_agent, "_session", None)
+    starts = 0
+
+    async def start(self):
+        nonlocal starts
+        starts += 1
+        await asyncio.sleep(0.01)
+
+    with patch.object(anki_agent.AnkiSession, "start", start):
+        sessions = await asyncio.gather(*(anki_agent.start_session() for _ in range(3)))
+    assert starts == 1
+    assert sessions[0] is sessions[1] is sessions[2]
@@ -0,0 +1,125 @@
+import http.server
+import json
+import threading
+
+import pytest
+import pytest_asyncio
+
+from ankinizer import anki_agent
+from ankinizer import resilience
+from ankinizer import reverso_agent
+from ankinizer.anki_connect import AnkiConnectBackend, AnkiConnectError
+
+
+class StubAnkiConnect(http.server.BaseHTTPRequestHandler):
+    """Stands in for the AnkiConnect add-on; notes whose Front starts with "dup" or "bad" are rejected."""
+
+    requests = []
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.requests.append(payload)
+        params = payload["params"]
+        if payload["action"] == "addNote":
+            ids, errors = self.add_notes([params["note"]])
+            answer = {"result": ids[0], "error": errors[0] if errors else None}
+        elif payload["action"] == "addNotes":
+            ids, errors = self.add_notes(params["notes"])
+            answer = {"result": ids, "error": str(errors) if errors else None}
+        else:
+            answer = {"result": None, "error": "unsupported action"}
+        body = json.dumps(answer).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def add_notes(self, notes):
+        ids, errors = [], []
+        for i, note in enumerate(notes):
+            if note["fields"]["Front"].startswith("dup"):
+                ids.append(None)
+                errors.append("cannot create note because it is a duplicate")
+            elif note["fields"]["Front"].startswith("bad"):
+                ids.append(None)
+                errors.append("cannot create note because it is empty")
+            else:
+                ids.append(1000 + i)
+        return ids, errors
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest_asyncio.fixture
+async def backend():
+    StubAnkiConnect.requests = []
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StubAnkiConnect)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    backend = AnkiConnectBackend(url=f"http://127.0.0.1:{server.server_address[1]}")
+    yield backend
+    await backend.close()
+    server.shutdown()
+
+
+def make_result(word):
+    return reverso_agent.ReversoResult(
+        en_word=word,
+        ru_translations=["тест"],
+        usage_samples=[reverso_agent.ReversoTranslationSample(en=f"A <b>{word}</b>.", ru="<b>Тест</b>.")],
+    )
+
+
+@pytest.mark.asyncio
+async def test_add_card(backend):
+    assert await backend.add_card(make_result("test"))
+    (request,) = StubAnkiConnect.requests
+    assert request["action"] == "addNote"
+    assert request["version"] == 6
+    note = request["params"]["note"]
+    assert note["deckName"] == anki_agent.DECK_NAME
+    assert note["fields"]["Front"] == anki_agent.format_front_html(make_result("test"))
+    assert note["fields"]["Back"] == anki_agent.format_back_html(make_result("test"))
+
+    # The deck has it already, which is as good as adding it
+    assert await backend.add_card(make_result("dup"))
+    with pytest.raises(AnkiConnectError, match="empty"):
+        await backend.add_card(make_result("bad"))
+
+
+@pytest.mark.asyncio
+async def test_add_cards_is_one_request(backend):
+    reports = await backend.add_cards([make_result("one"), make_result("dup"), make_result("bad"), make_result("two")])
+    assert len(StubAnkiConnect.requests) == 1
+    assert [(r.en_word, r.added, r.already_added) for r in reports] == [
+        ("one", True, False), ("dup", True, True), ("bad", False, False), ("two", True, False)
+    ]
+    assert "empty" in reports[2].error
+
+
+@pytest.mark.asyncio
+async def test_failed_adds_count_against_the_upstream(backend):
+    breaker = resilience.get_upstream("ankiconnect").breaker
+    for _ in range(resilience.DEFAULT_MIN_CALLS):
+        assert await backend.add_card(make_result("dup"))
+    assert breaker.state == resilience.CLOSED
+
+    for _ in range(resilience.DEFAULT_MIN_CALLS):
+        with pytest.raises(AnkiConnectError):
+            await backend.add_card(make_result("bad"))
+    with pytest.raises(resilience.CircuitOpenError):
+        await backend.add_card(make_result("test"))
+
+
+@pytest.mark.asyncio
+async def test_backend_is_selected_from_env(monkeypatch):
+    monkeypatch.setattr(anki_agent, "_backend", None)
+    monkeypatch.setenv("ANKINIZER_ANKI_BACKEND", "ankiconnect")
+    backend = anki_agent.get_backend()
+    assert isinstance(backend, AnkiConnectBackend)
+    await anki_agent.close_backend()
+
+    monkeypatch.setenv("ANKINIZER_ANKI_BACKEND", "ankiweb")
+    assert isinstance(anki_agent.get_backend(), anki_agent.AnkiWebBackend)
+    monkeypatch.setattr(anki_agent, "_backend", None)
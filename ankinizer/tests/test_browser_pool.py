@@ -0,0 +1,160 @@
+import asyncio
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from ankinizer import browser_pool
+from ankinizer import chromium_watchdog
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.connected = True
+        self.contexts = []
+        self.on_disconnected = []
+
+    def is_connected(self):
+        return self.connected
+
+    def on(self, event, callback):
+        if event == "disconnected":
+            self.on_disconnected.append(callback)
+
+    def crash(self):
+        self.connected = False
+        for callback in self.on_disconnected:
+            callback(self)
+
+    async def new_context(self, **kwargs):
+        page = MagicMock()
+        page.is_closed.return_value = False
+        page.set_extra_http_headers = AsyncMock()
+        page.goto = AsyncMock()
+        context = MagicMock()
+        context.new_page = AsyncMock(return_value=page)
+        context.close = AsyncMock()
+        self.contexts.append(context)
+        return context
+
+    async def close(self):
+        if self.connected:
+            self.crash()
+
+
+@pytest.fixture
+def fake_playwright():
+    browsers = []
+
+    async def launch(**kwargs):
+        browser = FakeBrowser()
+        browsers.append(browser)
+        return browser
+
+    driver = MagicMock()
+    driver.chromium.launch = AsyncMock(side_effect=launch)
+    driver.stop = AsyncMock()
+    manager = MagicMock()
+    manager.start = AsyncMock(return_value=driver)
+    with patch("playwright.async_api.async_playwright", return_value=manager):
+        yield browsers
+
+
+@pytest.mark.asyncio
+async def test_pages_are_reused(fake_playwright):
+    async with browser_pool.BrowserPool(browser_pool.PoolParams(size=2)) as pool:
+        async with pool.acquire() as first:
+            pass
+        async with pool.acquire() as second:
+            pass
+        assert first is second
+        assert len(fake_playwright) == 1
+        assert len(fake_playwright[0].contexts) == 2
+
+
+@pytest.mark.asyncio
+async def test_contexts_are_set_up_once_and_pages_parked_on_return(fake_playwright):
+    setup_context = AsyncMock()
+    async with browser_pool.BrowserPool(browser_pool.PoolParams(size=1, setup_context=setup_context)) as pool:
+        for _ in range(2):
+            async with pool.acquire() as page:
+                pass
+        setup_context.assert_awaited_once_with(fake_playwright[0].contexts[0])
+        page.goto.assert_awaited_with("about:blank")
+
+
+@pytest.mark.asyncio
+async def test_acquire_is_bounded_by_size(fake_playwright):
+    async with browser_pool.BrowserPool(browser_pool.PoolParams(size=1)) as pool:
+        async with pool.acquire():
+            waiter = asyncio.ensure_future(pool.acquire().__aenter__())
+            await asyncio.sleep(0)
+            assert not waiter.done()
+        await asyncio.wait_for(waiter, timeout=1)
+
+
+@pytest.mark.asyncio
+async def test_crashed_browser_is_relaunched(fake_playwright):
+    async with browser_pool.BrowserPool(browser_pool.PoolParams(size=1)) as pool:
+        async with pool.acquire() as before:
+            pass
+        fake_playwright[0].connected = False
+        async with pool.acquire() as after:
+            pass
+        assert after is not before
+        assert len(fake_playwright) == 2
+
+
+@pytest.mark.asyncio
+async def test_failed_lookup_discards_slot(fake_playwright):
+    async with browser_pool.BrowserPool(browser_pool.PoolParams(size=1)) as pool:
+        with pytest.raises(ValueError):
+            async with pool.acquire() as failed:
+                raise ValueError("boom")
+        async with pool.acquire() as page:
+            assert page is not failed
+        fake_playwright[0].contexts[0].close.assert_awaited()
+
+
+@pytest.mark.asyncio
+async def test_browser_is_recycled_after_max_pages(fake_playwright, monkeypatch):
+    monkeypatch.setenv("ANKINIZER_BROWSER_MAX_PAGES", "2")
+    async with browser_pool.BrowserPool(browser_pool.PoolParams(size=1, name="test")) as pool:
+        for _ in range(2):
+            async with pool.acquire():
+                pass
+        assert len(fake_playwright) == 1
+        async with pool.acquire():
+            assert len(fake_playwright) == 2
+        assert not fake_playwright[0].connected
+    assert chromium_watchdog.BROWSER_RECYCLES.value(browser="test", reason="pages") == 1
+
+
+@pytest.mark.asyncio
+async def test_recycle_drains_the_old_browser_under_load(fake_playwright, monkeypatch):
+    monkeypatch.setenv("ANKINIZER_BROWSER_MAX_PAGES", "1")
+    async with browser_pool.BrowserPool(browser_pool.PoolParams(size=2)) as pool:
+        async with pool.acquire() as old_page:
+            async with pool.acquire():
+                pass
+            # Due for recycling while a page is still out: new borrows get the replacement
+            async with pool.acquire() as new_page:
+                assert len(fake_playwright) == 2
+                assert new_page is not old_page
+                assert fake_playwright[0].connected
+        assert not fake_playwright[0].connected
+        assert fake_playwright[1].connected
+
+
+@pytest.mark.asyncio
+async def test_only_unexpected_disconnects_are_errors(fake_playwright, monkeypatch, caplog):
+    monkeypatch.setenv("ANKINIZER_BROWSER_MAX_PAGES", "1")
+    async with browser_pool.BrowserPool(browser_pool.PoolParams(size=1, name="test")) as pool:
+        # The first browser is drained and closed by a recycle
+        for _ in range(2):
+            async with pool.acquire():
+                pass
+        assert not fake_playwright[0].connected
+        assert "disconnected" not in caplog.text
+
+        fake_playwright[1].crash()
+        assert "Browser disconnected" in caplog.text
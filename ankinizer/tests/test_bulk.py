@@ -0,0 +1,71 @@
+import io
+from unittest.mock import AsyncMock
+
+import pytest
+
+from ankinizer import anki_agent
+from ankinizer import bulk
+from ankinizer import reverso_agent
+
+
+def test_words_are_read_from_txt_and_csv(tmp_path):
+    txt = tmp_path / "words.txt"
+    txt.write_text("# my list\nserendipity\n\n  take for granted \n")
+    assert list(bulk.read_words(txt)) == ["serendipity", "take for granted"]
+
+    csv_list = tmp_path / "vocab.csv"
+    csv_list.write_text('word,note\nrun,"a, b"\n,empty\nwalk\n')
+    assert list(bulk.read_words(csv_list, "word")) == ["run", "walk"]
+    assert list(bulk.read_words(csv_list, "1")) == ["note", "a, b", "empty"]
+
+
+async def fake_lookup(word):
+    if word == "broken":
+        raise TimeoutError("slow")
+    translations = [] if word == "xyzzy" else ["перевод"]
+    return reverso_agent.ReversoResult(word, translations, [])
+
+
+async def fake_add(results):
+    return [
+        anki_agent.CardReport(r.en_word, added=r.en_word not in ("rejected", "unsure"), unconfirmed=r.en_word == "unsure")
+        for r in results
+    ]
+
+
+@pytest.mark.asyncio
+async def test_import_batches_cards_and_resumes_from_checkpoint(tmp_path, monkeypatch):
+    words = tmp_path / "words.txt"
+    words.write_text("one\ntwo\nxyzzy\nbroken\nOne\nrejected\nthree\nunsure\n")
+    lookup = AsyncMock(side_effect=fake_lookup)
+    add = AsyncMock(side_effect=fake_add)
+    monkeypatch.setattr(reverso_agent, "get_reverso_result", lookup)
+    monkeypatch.setattr(anki_agent, "add_cards_to_anki", add)
+    checkpoint = bulk.Checkpoint(bulk.default_checkpoint_path(words))
+    out = io.StringIO()
+
+    progress = await bulk.BulkImport(words, checkpoint, concurrency=2, batch_size=2, out=out).run()
+
+    assert progress.statuses == {bulk.ADDED: 3, bulk.ALREADY_ADDED: 0, bulk.NOT_FOUND: 1, bulk.FAILED: 2, bulk.UNCONFIRMED: 1}
+    assert progress.skipped == 1
+    assert lookup.await_count == 7
+    assert all(len(call.args[0]) <= 2 for call in add.await_args_list)
+    assert "8/8 words" in out.getvalue()
+
+    lookup.reset_mock()
+    progress = await bulk.BulkImport(words, checkpoint, out=io.StringIO()).run()
+    checkpoint.close()
+
+    # Unconfirmed adds aren't retried, the card may be in the deck
+    assert sorted(call.args[0] for call in lookup.await_args_list) == ["broken", "rejected"]
+    assert progress.skipped == 6
+    assert progress.statuses[bulk.FAILED] == 2
+
+
+def test_progress_line_has_throughput_and_eta():
+    progress = bulk.Progress(total=100, skipped=10)
+    progress.started -= 10
+    progress.count([bulk.Outcome("w", bulk.ADDED)] * 20)
+    assert progress.line() == (
+        "30/100 words (added 20, already added 0, not found 0, failed 0, unconfirmed 0, skipped 10) 2.0 words/s, ETA 0m35s"
+    )
@@ -0,0 +1,101 @@
+from unittest.mock import patch
+
+import pytest
+
+from ankinizer import chromium_watchdog
+
+BOT = 100
+
+
+class FakeProc:
+    """A /proc directory with just the files the watchdog reads."""
+
+    def __init__(self, path):
+        self.path = path
+        self.start_times = {}
+
+    def spawn(self, pid, ppid, name, pss_kb=0):
+        directory = self.path / str(pid)
+        directory.mkdir()
+        start_time = self.start_times.setdefault(pid, 1000 + pid)
+        fields = ["S", str(ppid), *["0"] * 17, str(start_time)]
+        (directory / "stat").write_text(f"{pid} ({name}) {' '.join(fields)}\n")
+        (directory / "smaps_rollup").write_text(f"Rss: {pss_kb * 2} kB\nPss: {pss_kb} kB\n")
+
+    def browser(self, pid, pss_kb=0, parent=BOT + 1):
+        """A Chromium under the Playwright driver: browser, zygote and renderer."""
+        self.spawn(pid, parent, "chrome", pss_kb)
+        self.spawn(pid + 1, pid, "chrome", pss_kb)
+        self.spawn(pid + 2, pid + 1, "chrome", pss_kb)
+
+    def exit(self, pid):
+        for name in ("stat", "smaps_rollup"):
+            (self.path / str(pid) / name).unlink()
+        (self.path / str(pid)).rmdir()
+
+
+@pytest.fixture
+def proc(tmp_path):
+    fake = FakeProc(tmp_path)
+    fake.spawn(BOT, 1, "python")
+    fake.spawn(BOT + 1, BOT, "node")
+    fake.spawn(50, 1, "chrome")  # someone else's browser
+    return fake
+
+
+def test_browsers_are_found_under_the_bot(proc):
+    proc.browser(200)
+    processes = chromium_watchdog.list_processes(proc.path)
+    assert chromium_watchdog.chromium_roots(processes, BOT) == {200}
+    assert sorted(chromium_watchdog.descendants(200, processes)) == [201, 202]
+    assert chromium_watchdog.memory_bytes(201, proc.path) == 0
+
+
+@pytest.mark.asyncio
+async def test_launch_is_tracked_and_recycled_over_memory(proc):
+    watchdog = chromium_watchdog.Watchdog(max_memory=5 << 20, proc=proc.path, pid=BOT)
+    async with watchdog.launching("test") as tracked:
+        proc.browser(200, pss_kb=2048)
+    assert tracked.process.pid == 200
+
+    watchdog.check()
+    assert tracked.memory == 6 << 20
+    assert chromium_watchdog.BROWSER_MEMORY._values[("test",)] == 6 << 20
+    assert tracked.recycle_due
+
+    watchdog.closed(tracked)
+    assert not tracked.recycle_due
+    assert chromium_watchdog.BROWSER_RECYCLES.value(browser="test", reason="memory") == 1
+
+
+@pytest.mark.asyncio
+async def test_browser_outliving_close_is_killed(proc):
+    watchdog = chromium_watchdog.Watchdog(proc=proc.path, pid=BOT)
+    async with watchdog.launching("test") as tracked:
+        proc.browser(200)
+    watchdog.closed(tracked)
+
+    with patch("os.kill") as kill:
+        watchdog.check()
+    assert sorted(call.args[0] for call in kill.call_args_list) == [200, 201, 202]
+
+
+@pytest.mark.asyncio
+async def test_failed_launch_leftovers_are_killed(proc):
+    watchdog = chromium_watchdog.Watchdog(proc=proc.path, pid=BOT)
+    with patch("os.kill") as kill, pytest.raises(TimeoutError):
+        async with watchdog.launching("test"):
+            proc.browser(200)
+            raise TimeoutError("launch timed out")
+    assert sorted(call.args[0] for call in kill.call_args_list) == [200, 201, 202]
+    assert watchdog.browsers == []
+
+
+def test_unowned_browser_is_killed_when_seen_twice(proc):
+    watchdog = chromium_watchdog.Watchdog(proc=proc.path, pid=BOT)
+    proc.browser(300)
+    with patch("os.kill") as kill:
+        watchdog.check()
+        kill.assert_not_called()
+        watchdog.check()
+    assert sorted(call.args[0] for call in kill.call_args_list) == [300, 301, 302]
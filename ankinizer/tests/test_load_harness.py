@@ -0,0 +1,38 @@
+import pytest
+
+from ankinizer import admission
+from ankinizer.benchmarks import load
+
+ENV_KEYS = (
+    "ANKINIZER_REVERSO_URL", "ANKINIZER_REVERSO_MODE", "ANKINIZER_REVERSO_CACHE", "ANKINIZER_ANKIWEB_URL",
+    "ANKINIZER_ANKICONNECT_URL", "ANKINIZER_ANKI_BACKEND", "ANKINIZER_DATA_DIR", "ANKINIZER_METRICS_PORT",
+    "ANKINIZER_REVERSO_RATE", "ANKINIZER_ANKIWEB_RATE", "ANKI_USERNAME", "ANKI_PASSWORD",
+)
+
+
+def test_percentile():
+    values = [i / 100 for i in range(1, 101)]
+    assert load.percentile(values, 50) == 0.5
+    assert load.percentile(values, 99) == 0.99
+    assert load.percentile([0.3], 95) == 0.3
+    assert load.percentile([], 50) == 0.0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("telegram_mode", ["polling", "webhook"])
+async def test_users_get_cards_added(monkeypatch, telegram_mode):
+    # load.run() sets these for the bot; have them restored afterwards
+    for key in ENV_KEYS:
+        monkeypatch.setenv(key, "")
+    monkeypatch.setattr(admission, "_controller", None)
+
+    report = await load.run(load.LoadParams(
+        users=3, words_per_user=2, reverso_latency=0, anki_latency=0, telegram_mode=telegram_mode, step_timeout=10
+    ))
+
+    assert report.completed == 6
+    for stage in load.STAGES:
+        assert report.stages[stage].count == 6
+        assert report.stages[stage].errors == 0
+        assert 0 < report.stages[stage].p50 <= report.stages[stage].p99
+    assert report.peak_rss_bytes > 0
@@ -0,0 +1,60 @@
+import asyncio
+
+import httpx
+import pytest
+
+from ankinizer import metrics
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = metrics.Registry()
+    histogram = registry.register(metrics.Histogram("test_seconds", "Test", labels=("stage",), buckets=(0.1, 1.0)))
+    histogram.observe(0.05, stage="goto")
+    histogram.observe(0.5, stage="goto")
+    histogram.observe(5, stage="goto")
+
+    assert registry.render().splitlines() == [
+        "# HELP test_seconds Test",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{stage="goto",le="0.1"} 1',
+        'test_seconds_bucket{stage="goto",le="1.0"} 2',
+        'test_seconds_bucket{stage="goto",le="+Inf"} 3',
+        'test_seconds_sum{stage="goto"} 5.55',
+        'test_seconds_count{stage="goto"} 3',
+    ]
+
+
+def test_track_counts_outcomes():
+    with metrics.track("test_op"):
+        pass
+    with pytest.raises(ValueError):
+        with metrics.track("test_op"):
+            raise ValueError()
+    with pytest.raises(asyncio.TimeoutError):
+        with metrics.track("test_op"):
+            raise asyncio.TimeoutError()
+
+    for outcome in ("success", "failure", "timeout"):
+        assert metrics.OPERATIONS.value(operation="test_op", outcome=outcome) == 1
+    assert metrics.OPERATION_SECONDS.count(operation="test_op") == 3
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint(monkeypatch):
+    monkeypatch.setenv("ANKINIZER_METRICS_PORT", "0")
+    assert await metrics.start_server() is None
+
+    server = metrics.http_server.HttpServer()
+    metrics.add_routes(server)
+    await server.start()
+    try:
+        with metrics.span("test_stage"):
+            pass
+        async with httpx.AsyncClient() as client:
+            response = await client.get(f"http://127.0.0.1:{server.port}/metrics")
+            missing = await client.get(f"http://127.0.0.1:{server.port}/nothing")
+    finally:
+        await server.stop()
+    assert response.status_code == 200
+    assert 'ankinizer_stage_seconds_count{stage="test_stage"} 1' in response.text
+    assert missing.status_code == 404
@@ -0,0 +1,101 @@
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from ankinizer import anki_agent
+from ankinizer import reverso_agent
+from ankinizer import outbox
+from ankinizer.outbox import Outbox, OutboxWorker
+
+
+def make_result(word):
+    return reverso_agent.ReversoResult(en_word=word, ru_translations=["тест"], usage_samples=[])
+
+
+@pytest.fixture
+def outbox_db(tmp_path):
+    outbox = Outbox(tmp_path / "outbox.sqlite3")
+    yield outbox
+    outbox.close()
+
+
+def test_pending_cards_survive_reopen(tmp_path):
+    outbox = Outbox(tmp_path / "outbox.sqlite3")
+    outbox.enqueue(make_result("first"), chat_id=1)
+    outbox.enqueue(make_result("second"), chat_id=2)
+    outbox.close()
+
+    outbox = Outbox(tmp_path / "outbox.sqlite3")
+    items = outbox.due(limit=10)
+    assert [(item.chat_id, item.reverso_result) for item in items] == [(1, make_result("first")), (2, make_result("second"))]
+    outbox.close()
+
+
+@pytest.mark.asyncio
+async def test_worker_adds_batch_and_notifies(outbox_db):
+    notify = AsyncMock()
+    worker = OutboxWorker(outbox_db, notify, batch_size=2)
+    for word in ("a", "b", "c"):
+        worker.submit(make_result(word), chat_id=7)
+
+    reports = [anki_agent.CardReport(en_word="a", added=True), anki_agent.CardReport(en_word="b", added=True)]
+    with patch("ankinizer.anki_agent.add_cards_to_anki", AsyncMock(return_value=reports)) as add_cards:
+        assert await worker.drain_once() == 2
+    assert [r.en_word for r in add_cards.call_args[0][0]] == ["a", "b"]
+    notify.assert_any_await(7, "Card for a added to Anki")
+    assert outbox_db.count() == 1
+
+
+@pytest.mark.asyncio
+async def test_worker_retries_with_backoff_then_gives_up(outbox_db):
+    notify = AsyncMock()
+    worker = OutboxWorker(outbox_db, notify, max_attempts=2, backoff_seconds=10)
+    with patch("time.time", return_value=1000.0):
+        worker.submit(make_result("a"), chat_id=7)
+
+    with patch("ankinizer.anki_agent.add_cards_to_anki", AsyncMock(side_effect=RuntimeError("down"))), \
+            patch("time.time", return_value=1000.0):
+        assert await worker.drain_once() == 1
+        notify.assert_not_awaited()
+        assert outbox_db.next_due_at() == 1010.0
+        assert await worker.drain_once() == 0
+
+    with patch("ankinizer.anki_agent.add_cards_to_anki", AsyncMock(side_effect=RuntimeError("down"))), \
+            patch("time.time", return_value=1011.0):
+        assert await worker.drain_once() == 1
+    notify.assert_awaited_once_with(7, "Error adding card for a to Anki: down")
+    assert outbox_db.count() == 0
+
+
+@pytest.mark.asyncio
+async def test_unconfirmed_add_is_tried_once(outbox_db):
+    notify = AsyncMock()
+    worker = OutboxWorker(outbox_db, notify, backoff_seconds=0)
+    worker.submit(make_result("a"), chat_id=7)
+
+    report = anki_agent.CardReport(en_word="a", added=False, error="not confirmed", unconfirmed=True)
+    with patch("ankinizer.anki_agent.add_cards_to_anki", AsyncMock(return_value=[report])) as add_cards:
+        assert await worker.drain_once() == 1
+        assert await worker.drain_once() == 0
+    assert add_cards.await_count == 1
+    assert outbox_db.count() == 0
+    assert outbox_db.count(outbox.UNCONFIRMED) == 1
+    notify.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_cards_done_with_are_pruned_after_retention(outbox_db):
+    worker = OutboxWorker(outbox_db, AsyncMock(), retention_seconds=100)
+    with patch("time.time", return_value=1000.0):
+        added, failed, waiting = (outbox_db.enqueue(make_result(word), chat_id=7) for word in ("a", "b", "c"))
+        outbox_db.mark_added(added)
+        outbox_db.mark_failed(failed, "boom", retry_at=None)
+        outbox_db.mark_failed(waiting, "boom", retry_at=10_000.0)
+    with patch("time.time", return_value=1050.0):
+        recent = outbox_db.enqueue(make_result("d"), chat_id=7)
+        outbox_db.mark_added(recent)
+
+    with patch("time.time", return_value=1101.0):
+        assert await worker.drain_once() == 0
+    assert outbox_db.count(outbox.ADDED) == 1
+    assert outbox_db.count(outbox.FAILED) == 0
+    assert outbox_db.count() == 1
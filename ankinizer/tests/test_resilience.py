@@ -0,0 +1,143 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from ankinizer import admission
+from ankinizer import resilience
+from ankinizer import reverso_agent
+from ankinizer import reverso_cache
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_breaker_opens_on_failure_rate_and_probes_after_cooldown():
+    clock = FakeClock()
+    breaker = resilience.CircuitBreaker("test", window=10, min_calls=4, failure_rate=0.5, open_seconds=30, clock=clock)
+    for success in (True, False, True):
+        breaker.before_call()
+        breaker.record(success)
+    assert breaker.state == resilience.CLOSED
+    breaker.before_call()
+    breaker.record(False)
+    assert breaker.state == resilience.OPEN
+
+    clock.now = 10
+    with pytest.raises(resilience.CircuitOpenError) as e:
+        breaker.before_call()
+    assert e.value.retry_after == 20
+
+    clock.now = 31
+    breaker.before_call()  # the probe
+    assert breaker.state == resilience.HALF_OPEN
+    with pytest.raises(resilience.CircuitOpenError):
+        breaker.before_call()  # only one probe at a time
+    breaker.record(True)
+    assert breaker.state == resilience.CLOSED
+
+
+def test_failed_probe_opens_again():
+    clock = FakeClock()
+    breaker = resilience.CircuitBreaker("test", min_calls=1, open_seconds=5, clock=clock)
+    breaker.before_call()
+    breaker.record(False)
+    clock.now = 6
+    breaker.before_call()
+    breaker.record(False)
+    assert breaker.state == resilience.OPEN
+    assert breaker.retry_after == 5
+
+
+def test_rate_backs_off_on_failures_and_recovers():
+    limiter = resilience.AdaptiveRateLimiter("test", max_rate=10, min_rate=1)
+    limiter.record(False)
+    limiter.record(False)
+    assert limiter.rate == 2.5
+    for _ in range(4):
+        limiter.record(False)
+    assert limiter.rate == 1
+    for _ in range(20):
+        limiter.record(True)
+    assert limiter.rate == 10
+
+
+@pytest.mark.asyncio
+async def test_limiter_spaces_calls_beyond_the_burst():
+    limiter = resilience.AdaptiveRateLimiter("test", max_rate=100, burst=2)
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    for _ in range(4):
+        await limiter.acquire()
+    assert loop.time() - started >= 0.015
+
+
+@pytest.mark.asyncio
+async def test_cancelled_call_releases_the_probe():
+    breaker = resilience.CircuitBreaker("test", min_calls=1, open_seconds=0)
+    upstream = resilience.Upstream("test", breaker)
+    breaker.before_call()
+    breaker.record(False)
+
+    task = asyncio.create_task(upstream.call(lambda: asyncio.sleep(10)))
+    await asyncio.sleep(0)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert breaker.state == resilience.HALF_OPEN
+
+    async def ok():
+        return "ok"
+
+    assert await upstream.call(ok) == "ok"
+    assert breaker.state == resilience.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_admission_rejections_dont_count_against_the_upstream():
+    breaker = resilience.CircuitBreaker("test", min_calls=1)
+    limiter = resilience.AdaptiveRateLimiter("test", max_rate=100, burst=100)
+    upstream = resilience.Upstream("test", breaker, limiter)
+    controller = admission.AdmissionController(max_sessions=1, max_queue=0)
+
+    async def admitted_work():
+        async with controller.admit():
+            return "ok"
+
+    async with controller.admit():
+        for _ in range(10):
+            with pytest.raises(admission.AdmissionRejected):
+                await upstream.call(admitted_work)
+
+    assert breaker.state == resilience.CLOSED
+    assert limiter.rate == 100
+    assert await upstream.call(admitted_work) == "ok"
+
+
+@pytest.mark.asyncio
+async def test_open_reverso_circuit_serves_expired_cache_or_fails_fast(tmp_path, monkeypatch):
+    monkeypatch.setenv("ANKINIZER_DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(reverso_cache, "_cache", None)
+    cached = reverso_agent.ReversoResult("test", ["тест"], [])
+    with patch("time.time", return_value=0.0):
+        reverso_cache.get_cache().put("test", reverso_agent.LANGUAGE_PAIR, cached.to_dict())
+
+    with patch.object(reverso_agent, "_lookup", side_effect=TimeoutError("slow")) as mock_lookup:
+        for _ in range(resilience.DEFAULT_MIN_CALLS):
+            with pytest.raises(TimeoutError):
+                await reverso_agent.get_reverso_result("other")
+        assert resilience.get_upstream("reverso").breaker.state == resilience.OPEN
+
+        result = await reverso_agent.get_reverso_result("Test")
+        with pytest.raises(resilience.CircuitOpenError, match="try again"):
+            await reverso_agent.get_reverso_result("other")
+
+    assert mock_lookup.call_count == resilience.DEFAULT_MIN_CALLS
+    assert result.ru_translations == ("тест",)
+    assert result.en_word == "Test"
+    reverso_cache._cache.close()
@@ -0,0 +1,56 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from ankinizer import resource_blocker
+from ankinizer.resource_blocker import BlockingRules, ResourceBlocker
+
+
+def make_route(url, resource_type):
+    route = MagicMock()
+    route.request.url = url
+    route.request.resource_type = resource_type
+    route.abort = AsyncMock()
+    route.continue_ = AsyncMock()
+    return route
+
+
+def test_rules_from_env(monkeypatch):
+    monkeypatch.setenv("ANKINIZER_BLOCK_RESOURCE_TYPES", "image")
+    monkeypatch.setenv("ANKINIZER_BLOCK_HOSTS", "ads.example.com")
+    monkeypatch.setenv("ANKINIZER_ALLOW_HOSTS", "static.reverso.net")
+    rules = BlockingRules.from_env()
+
+    assert rules.should_block("https://cdn.reverso.net/logo.png", "image")
+    assert not rules.should_block("https://static.reverso.net/logo.png", "image")
+    assert not rules.should_block("https://cdn.reverso.net/font.woff2", "font")
+    assert rules.should_block("https://x.ads.example.com/pixel.js", "script")
+    assert rules.should_block("https://www.googletagmanager.com/gtag/js", "script")
+    assert not rules.should_block("https://context.reverso.net/translation/english-russian/test", "document")
+
+    monkeypatch.setenv("ANKINIZER_BLOCK_RESOURCES", "0")
+    assert not BlockingRules.from_env().should_block("https://www.googletagmanager.com/gtag/js", "script")
+
+
+@pytest.mark.asyncio
+async def test_blocker_counts_requests():
+    context = MagicMock()
+    context.route = AsyncMock()
+    blocker = ResourceBlocker(BlockingRules())
+    await blocker.attach(context)
+    assert resource_blocker.get_blocker(context) is blocker
+    await blocker._handle_route(make_route("https://ads.doubleclick.net/ad.js", "script"))
+
+    stats = blocker.reset()
+    await blocker._handle_route(make_route("https://context.reverso.net/translation", "document"))
+    await blocker._handle_route(make_route("https://cdn.reverso.net/a.png", "image"))
+    await blocker._handle_route(make_route("https://cdn.reverso.net/b.png", "image"))
+    request = MagicMock()
+    request.sizes = AsyncMock(return_value={"responseHeadersSize": 100, "responseBodySize": 900})
+    await blocker._on_request_finished(request)
+
+    # Routed once for the context's whole life, never unrouted between navigations
+    context.route.assert_awaited_once()
+    assert stats.allowed_requests == 1
+    assert stats.blocked_requests == 2
+    assert stats.blocked_by_type == {"image": 2}
+    assert stats.received_bytes == 1000
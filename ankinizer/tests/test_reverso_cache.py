@@ -0,0 +1,77 @@
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from ankinizer import reverso_agent
+from ankinizer import reverso_cache
+from ankinizer.reverso_cache import ReversoCache
+
+
+@pytest.fixture
+def sample_reverso_result():
+    return reverso_agent.ReversoResult(
+        en_word="test",
+        ru_translations=["тест"],
+        usage_samples=[
+            reverso_agent.ReversoTranslationSample(en="A <b>test</b>.", ru="<b>Тест</b>.")
+        ]
+    )
+
+
+@pytest.fixture
+def default_cache(tmp_path, monkeypatch):
+    monkeypatch.setenv("ANKINIZER_DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(reverso_cache, "_cache", None)
+    yield
+    if reverso_cache._cache is not None:
+        reverso_cache._cache.close()
+
+
+def test_roundtrip_survives_reopen(tmp_path, sample_reverso_result):
+    cache = ReversoCache(tmp_path / "cache.sqlite3")
+    cache.put("Test", "english-russian", sample_reverso_result.to_dict())
+    cache.close()
+
+    cache = ReversoCache(tmp_path / "cache.sqlite3")
+    cached = cache.get("  TEST ", "english-russian")
+    assert reverso_agent.ReversoResult.from_dict(cached) == sample_reverso_result
+    assert cache.get("test", "english-french") is None
+    assert cache.stats() == reverso_cache.CacheStats(hits=1, misses=1, entries=1)
+
+
+def test_expired_entries_are_misses(tmp_path, sample_reverso_result):
+    cache = ReversoCache(tmp_path / "cache.sqlite3", ttl_seconds=60)
+    with patch("time.time", return_value=1000.0):
+        cache.put("test", "english-russian", sample_reverso_result.to_dict())
+    with patch("time.time", return_value=1059.0):
+        assert cache.get("test", "english-russian") is not None
+    with patch("time.time", return_value=1061.0):
+        assert cache.get("test", "english-russian") is None
+    # Kept for when Reverso is down
+    assert cache.get_stale("test", "english-russian") == sample_reverso_result.to_dict()
+    assert cache.stats().entries == 1
+
+
+def test_least_recently_used_is_evicted(tmp_path, sample_reverso_result):
+    cache = ReversoCache(tmp_path / "cache.sqlite3", max_entries=2)
+    for now, word in [(1.0, "a"), (2.0, "b")]:
+        with patch("time.time", return_value=now):
+            cache.put(word, "english-russian", sample_reverso_result.to_dict())
+    with patch("time.time", return_value=3.0):
+        cache.get("a", "english-russian")
+    with patch("time.time", return_value=4.0):
+        cache.put("c", "english-russian", sample_reverso_result.to_dict())
+        assert cache.get("b", "english-russian") is None
+        assert cache.get("a", "english-russian") is not None
+        assert cache.get("c", "english-russian") is not None
+
+
+@pytest.mark.asyncio
+async def test_get_reverso_result_uses_cache(default_cache, sample_reverso_result):
+    with patch("ankinizer.reverso_agent._lookup", AsyncMock(return_value=sample_reverso_result)) as lookup:
+        await reverso_agent.get_reverso_result("test")
+        cached = await reverso_agent.get_reverso_result("test")
+        assert cached == sample_reverso_result
+        assert lookup.await_count == 1
+
+        await reverso_agent.get_reverso_result("test", use_cache=False)
+        assert lookup.await_count == 2
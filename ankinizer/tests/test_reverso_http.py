@@ -0,0 +1,74 @@
+import http.server
+import threading
+from pathlib import Path
+
+import pytest
+import pytest_asyncio
+from unittest.mock import AsyncMock, patch
+
+from ankinizer import reverso_agent
+from ankinizer import reverso_http
+
+PAGES_DIR = Path(__file__).parent / "data" / "reverso"
+
+
+class StubReversoHandler(http.server.BaseHTTPRequestHandler):
+    """Serves saved pages as /translation/<pair>/<word>; "challenge" gets a 403."""
+
+    def do_GET(self):
+        word = self.path.rsplit("/", 1)[-1]
+        if word == "challenge":
+            self.send_response(403)
+            self.end_headers()
+            return
+        page = PAGES_DIR / f"{word}.html"
+        body = page.read_bytes() if page.exists() else b"<html><body>No results</body></html>"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest_asyncio.fixture
+async def stub_reverso(monkeypatch):
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StubReversoHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv("ANKINIZER_REVERSO_URL", f"http://127.0.0.1:{server.server_address[1]}")
+    monkeypatch.setenv("ANKINIZER_REVERSO_CACHE", "0")
+    yield
+    await reverso_http.close_client()
+    server.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_http_lookup_parses_saved_page(stub_reverso):
+    with patch("ankinizer.reverso_agent._fetch_from_browser", AsyncMock()) as browser:
+        result = await reverso_agent.get_reverso_result("serendipity")
+    browser.assert_not_called()
+    assert result.ru_translations[:2] == ("серендипность", "интуитивная прозорливость")
+    assert result.usage_samples[0].en == "Process art in its employment of <b>serendipity</b> has a marked correspondence with Dada."
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("word", ["challenge", "nothing"])
+async def test_falls_back_to_browser(stub_reverso, word):
+    page = (PAGES_DIR / "serendipity.html").read_text()
+    with patch("ankinizer.browser_pool.get_pool", return_value=object()), \
+            patch("ankinizer.reverso_agent._fetch_from_browser",
+                  AsyncMock(side_effect=lambda pool, word: reverso_agent.parse_result(word, page))) as browser:
+        result = await reverso_agent.get_reverso_result(word)
+    browser.assert_awaited_once()
+    assert result.en_word == word
+    assert result.ru_translations
+
+
+@pytest.mark.asyncio
+async def test_http_only_mode_surfaces_challenge(stub_reverso, monkeypatch):
+    monkeypatch.setenv("ANKINIZER_REVERSO_MODE", "http")
+    with pytest.raises(reverso_http.BotChallengeError):
+        await reverso_agent.get_reverso_result("challenge")
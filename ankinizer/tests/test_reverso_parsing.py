@@ -0,0 +1,139 @@
+import contextlib
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import playwright.async_api
+import pytest
+from bs4 import BeautifulSoup
+
+from ankinizer import reverso_agent
+from ankinizer.benchmarks import extraction
+from ankinizer.benchmarks import fakes
+from ankinizer.benchmarks import parsing
+
+PAGES_DIR = Path(__file__).parent / "data" / "reverso"
+
+
+# The BeautifulSoup pipeline the lxml extraction replaced, kept as a reference
+def bs4_clean_html(text):
+    soup = BeautifulSoup(text, 'html.parser')
+    for tag in soup.find_all(['span', 'a']):
+        tag.unwrap()
+    return str(soup).strip()
+
+
+def bs4_parse(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    translations = [e.text.strip() for e in soup.select('#translations-content .translation .display-term')]
+    examples = []
+    for element in soup.select('#examples-content .example'):
+        en_text = element.select_one('.src .text')
+        ru_text = element.select_one('.trg .text')
+        if en_text and ru_text:
+            examples.append({'en': bs4_clean_html(str(en_text)), 'ru': bs4_clean_html(str(ru_text))})
+    return translations, examples
+
+
+@pytest.mark.parametrize("page", sorted(PAGES_DIR.glob("*.html")), ids=lambda p: p.stem)
+def test_matches_beautifulsoup_pipeline(page):
+    html = page.read_text()
+    translations, examples = bs4_parse(html)
+
+    assert reverso_agent.parse_translations(html) == translations
+    assert reverso_agent.parse_examples(html) == examples
+
+    extracted_translations, samples = reverso_agent.extract_page(html)
+    assert extracted_translations == translations
+    assert [(s.en, s.ru) for s in samples] == [
+        (reverso_agent.replace_em_tags(e['en']), reverso_agent.replace_em_tags(e['ru'])) for e in examples
+    ]
+
+
+@pytest.mark.parametrize("fragment", [
+    '<span class="text">plain &amp; <a href="#"><em>linked</em></a> &lt;text&gt;</span>',
+    '<div class="text">kept <span>div</span><br> and <i title="a &quot;b&quot;">i</i></div>',
+    'loose <span>text</span> with a tail',
+    '',
+])
+def test_clean_html_matches_beautifulsoup(fragment):
+    assert reverso_agent.clean_html(fragment) == bs4_clean_html(fragment)
+
+
+def test_extract_page_caps_examples():
+    html = (PAGES_DIR / "serendipity.html").read_text()
+    _, samples = reverso_agent.extract_page(html, max_examples=2)
+    assert len(samples) == 2
+    assert reverso_agent.extract_page("") == ([], [])
+
+
+@pytest.mark.parametrize("page", parsing.load_corpus(), ids=lambda p: p.name)
+def test_matches_golden(page):
+    assert parsing.check_golden(page) == []
+
+
+def test_benchmark_covers_every_case():
+    (page,) = parsing.load_corpus(["serendipity"])
+    results = parsing.run([page], min_time=0)
+    assert {r.case for r in results} == set(parsing.make_cases(page))
+    assert all(r.calls > 0 and r.peak_bytes > 0 for r in results)
+
+
+@pytest.mark.parametrize("page", parsing.load_corpus(), ids=lambda p: p.name)
+def test_in_page_extraction_matches_parse_result(page):
+    extracted = extraction.emulate_extract(page.html)
+    assert len(extracted["examples"]) <= reverso_agent.MAX_USAGE_SAMPLES
+    assert (
+        reverso_agent.parse_extracted(page.word, extracted).to_dict()
+        == reverso_agent.parse_result(page.word, page.html).to_dict()
+    )
+    assert extraction.payload_bytes(extracted) < extraction.payload_bytes(page.html)
+
+
+@pytest.mark.asyncio
+async def test_extract_script_in_chromium_matches_parse_result(monkeypatch):
+    async with playwright.async_api.async_playwright() as driver:
+        try:
+            browser = await driver.chromium.launch()
+        except playwright.async_api.Error as e:
+            pytest.skip(f"Chromium is not available: {str(e).splitlines()[0]}")
+        reverso = fakes.FakeReverso()
+        await reverso.start()
+        monkeypatch.setenv("ANKINIZER_REVERSO_URL", reverso.url)
+        try:
+            page = await browser.new_page()
+            for corpus_page in parsing.load_corpus():
+                await page.goto(reverso_agent.get_translation_url(corpus_page.word))
+                extracted = await page.evaluate(reverso_agent._EXTRACT_SCRIPT, reverso_agent.MAX_USAGE_SAMPLES)
+                assert (
+                    reverso_agent.parse_extracted(corpus_page.word, extracted).to_dict()
+                    == reverso_agent.parse_result(corpus_page.word, corpus_page.html).to_dict()
+                ), corpus_page.name
+        finally:
+            await reverso.stop()
+            await browser.close()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("evaluate, uses_content", [
+    (AsyncMock(return_value={"terms": ["серендипность"], "examples": []}), False),
+    (AsyncMock(return_value={"terms": [], "examples": []}), True),
+    (AsyncMock(side_effect=playwright.async_api.Error("script failed")), True),
+])
+async def test_browser_lookup_falls_back_to_page_content(evaluate, uses_content):
+    html = (PAGES_DIR / "serendipity.html").read_text()
+    page = MagicMock()
+    page.evaluate = evaluate
+    page.content = AsyncMock(return_value=html)
+    pool = MagicMock()
+    pool.acquire = contextlib.asynccontextmanager(lambda: _yield(page))
+
+    with patch.object(reverso_agent, "_open_translation_page", AsyncMock()):
+        result = await reverso_agent._fetch_from_browser(pool, "serendipity")
+
+    evaluate.assert_awaited_once_with(reverso_agent._EXTRACT_SCRIPT, reverso_agent.MAX_USAGE_SAMPLES)
+    assert page.content.await_count == int(uses_content)
+    assert result.ru_translations[0] == "серендипность"
+
+
+async def _yield(value):
+    yield value
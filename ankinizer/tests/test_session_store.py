@@ -0,0 +1,135 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+from telegram import CallbackQuery, Message, Update
+from telegram.ext import CallbackContext
+
+from ankinizer import reverso_agent
+from ankinizer import session_store
+from ankinizer import tgram
+
+
+class FakeApplication:
+    """The slice of telegram.ext.Application the store uses."""
+
+    def __init__(self) -> None:
+        self.user_data = {}
+
+    def drop_user_data(self, user_id: int) -> None:
+        del self.user_data[user_id]
+
+
+def make_result(word):
+    return reverso_agent.ReversoResult(
+        en_word=word,
+        ru_translations=["тест"],
+        usage_samples=[reverso_agent.ReversoTranslationSample(en=f"A {word}.", ru="Тест.")],
+    )
+
+
+def test_idle_users_are_swept():
+    app = FakeApplication()
+    store = session_store.SessionStore(app, idle_ttl=60)
+    with patch("time.monotonic", return_value=0.0):
+        store.touch(1)
+        app.user_data[1] = {"reverso_result": make_result("old")}
+    with patch("time.monotonic", return_value=50.0):
+        store.touch(2)
+        app.user_data[2] = {"reverso_result": make_result("new")}
+    with patch("time.monotonic", return_value=100.0):
+        assert store.sweep() == 1
+
+    assert list(app.user_data) == [2]
+    assert session_store.SESSIONS_EVICTED.value(reason="idle") >= 1
+
+
+def test_least_recently_active_user_goes_first_beyond_the_limit():
+    app = FakeApplication()
+    store = session_store.SessionStore(app, max_users=2)
+    for user_id in (1, 2):
+        store.touch(user_id)
+        app.user_data[user_id] = {"reverso_result": make_result(str(user_id))}
+    store.touch(1)
+    store.touch(3)
+
+    assert sorted(app.user_data) == [1]
+    assert store.count() == 1
+
+
+def test_pending_results_are_capped_oldest_first():
+    store = session_store.SessionStore(FakeApplication(), max_pending=2)
+    pending = {str(i): make_result(str(i)) for i in range(4)}
+    store.cap_pending(pending)
+    assert list(pending) == ["2", "3"]
+
+
+def test_results_are_compact_and_measured():
+    result = make_result("test")
+    assert not hasattr(result, "__dict__")
+    assert isinstance(result.ru_translations, tuple)
+    assert isinstance(result.usage_samples, tuple)
+
+    app = FakeApplication()
+    store = session_store.SessionStore(app)
+    empty = store.size_bytes()
+    app.user_data[1] = {"reverso_result": result}
+    assert store.size_bytes() > empty + session_store.deep_sizeof(result.en_word)
+
+
+@pytest.mark.asyncio
+async def test_answer_to_an_evicted_lookup_asks_for_the_word_again():
+    update = MagicMock(spec=Update)
+    update.callback_query = MagicMock(spec=CallbackQuery)
+    update.callback_query.message = MagicMock(spec=Message)
+    update.callback_query.data = tgram.AcceptBoth.key
+    context = MagicMock(spec=CallbackContext)
+    context.user_data = {}
+
+    assert await tgram.accept_or_decline(update, context) == tgram.ConversationHandler.END
+    update.callback_query.message.reply_text.assert_called_once_with(tgram.EXPIRED_TEXT)
+
+
+@pytest.mark.asyncio
+async def test_evicted_result_ids_are_not_handed_out_again(monkeypatch):
+    monkeypatch.setattr(session_store, "_store", session_store.SessionStore(FakeApplication(), max_pending=2))
+    statuses = []
+
+    async def reply_text(text):
+        statuses.append(MagicMock(spec=Message))
+        return statuses[-1]
+
+    update = MagicMock(spec=Update)
+    update.message = MagicMock(spec=Message)
+    update.message.text = "a, b, c, d"
+    update.message.reply_text.side_effect = reply_text
+    context = MagicMock(spec=CallbackContext)
+    context.user_data = {}
+    with patch.object(reverso_agent, "get_reverso_result", side_effect=lambda word, on_queued=None: make_result(word)):
+        await tgram.get_word(update, context)
+
+    ids = [
+        status.edit_text.call_args.kwargs["reply_markup"].inline_keyboard[0][0].callback_data.partition(":")[2]
+        for status in statuses
+    ]
+    assert len(set(ids)) == 4
+    # Lookups finish in any order; the two that finished last stay, each under its own message's id
+    pending = context.user_data["reverso_results"]
+    words = dict(zip(ids, "abcd"))
+    assert len(pending) == 2
+    assert all(result.en_word == words[result_id] for result_id, result in pending.items())
+
+
+@pytest.mark.asyncio
+async def test_timed_out_conversation_drops_the_user_state(monkeypatch):
+    app = FakeApplication()
+    store = session_store.SessionStore(app)
+    monkeypatch.setattr(session_store, "_store", store)
+    store.touch(1)
+    app.user_data[1] = {"reverso_result": make_result("old")}
+    update = MagicMock(spec=Update)
+    update.effective_user.id = 1
+
+    await tgram.conversation_timed_out(update, MagicMock(spec=CallbackContext))
+
+    assert app.user_data == {}
+    assert store.count() == 0
@@ -0,0 +1,141 @@
+import asyncio
+
+import pytest
+from unittest.mock import patch
+
+from ankinizer import admission
+from ankinizer import browser_pool
+from ankinizer import reverso_agent
+from ankinizer import singleflight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_callers_share_one_call():
+    group = singleflight.Group("test_share")
+    release = asyncio.Event()
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await release.wait()
+        return object()
+
+    callers = [asyncio.create_task(group.do("key", work)) for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*callers)
+
+    assert calls == 1
+    assert results[0] is results[1] is results[2]
+    assert not group.in_flight("key")
+    assert singleflight.CALLS.value(group="test_share", role="shared") == 2
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_leaves_the_work_running_for_others():
+    group = singleflight.Group("test_cancel_one")
+    release = asyncio.Event()
+
+    async def work():
+        await release.wait()
+        return "done"
+
+    first = asyncio.create_task(group.do("key", work))
+    second = asyncio.create_task(group.do("key", work))
+    await asyncio.sleep(0)
+    first.cancel()
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await second == "done"
+    with pytest.raises(asyncio.CancelledError):
+        await first
+
+
+@pytest.mark.asyncio
+async def test_work_is_cancelled_when_every_waiter_is_gone():
+    group = singleflight.Group("test_cancel_all")
+    started, cancelled = asyncio.Event(), asyncio.Event()
+
+    async def work():
+        started.set()
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    caller = asyncio.create_task(group.do("key", work))
+    await started.wait()
+    caller.cancel()
+    await asyncio.wait_for(cancelled.wait(), 1)
+    assert not group.in_flight("key")
+
+    async def again():
+        return "fresh"
+
+    assert await group.do("key", again) == "fresh"
+
+
+@pytest.mark.asyncio
+async def test_failure_reaches_every_waiter_and_is_not_remembered():
+    group = singleflight.Group("test_failure")
+
+    async def work():
+        await asyncio.sleep(0)
+        raise RuntimeError("boom")
+
+    results = await asyncio.gather(group.do("key", work), group.do("key", work), return_exceptions=True)
+
+    assert [type(r) for r in results] == [RuntimeError, RuntimeError]
+    assert not group.in_flight("key")
+
+
+@pytest.mark.asyncio
+async def test_same_word_lookups_fetch_once_but_get_own_results(monkeypatch):
+    monkeypatch.setenv("ANKINIZER_REVERSO_CACHE", "0")
+    fetched = asyncio.Event()
+
+    async def lookup(word, playwright_params, on_queued=None):
+        await fetched.wait()
+        return reverso_agent.ReversoResult(word, ["тест", "проверка"], [])
+
+    with patch.object(reverso_agent, "_lookup", side_effect=lookup) as mock_lookup:
+        callers = [
+            asyncio.create_task(reverso_agent.get_reverso_result(word)) for word in ("test", " Test")
+        ]
+        await asyncio.sleep(0)
+        fetched.set()
+        first, second = await asyncio.gather(*callers)
+
+    assert mock_lookup.call_count == 1
+    assert (first.en_word, second.en_word) == ("test", " Test")
+    first.ru_translations = first.ru_translations[:1]
+    assert second.ru_translations == ("тест", "проверка")
+
+
+@pytest.mark.asyncio
+async def test_only_the_caller_driving_the_browser_takes_an_admission_slot(monkeypatch):
+    monkeypatch.setenv("ANKINIZER_REVERSO_CACHE", "0")
+    monkeypatch.setenv("ANKINIZER_REVERSO_MODE", "browser")
+    # No room to queue: a second caller asking for a slot would be turned away
+    controller = admission.AdmissionController(max_sessions=1, max_queue=0)
+    monkeypatch.setattr(admission, "_controller", controller)
+    monkeypatch.setattr(browser_pool, "get_pool", lambda: object())
+    fetched = asyncio.Event()
+
+    async def fetch(pool, word):
+        assert controller.active == 1
+        await fetched.wait()
+        return reverso_agent.ReversoResult(word, ["тест"], [])
+
+    with patch.object(reverso_agent, "_fetch_from_browser", side_effect=fetch) as mock_fetch:
+        callers = [asyncio.create_task(reverso_agent.get_reverso_result("test")) for _ in range(3)]
+        await asyncio.sleep(0)
+        fetched.set()
+        results = await asyncio.gather(*callers)
+
+    assert mock_fetch.call_count == 1
+    assert [r.ru_translations for r in results] == [("тест",)] * 3
+    assert controller.active == 0
@@ -1,7 +1,10 @@
+import asyncio
+
 import pytest
-from unittest.mock import MagicMock, patch, call
+from unittest.mock import ANY, MagicMock, patch, call
 
 from telegram import Update, CallbackQuery, Message, User, Chat
+from telegram.constants import ParseMode
 from telegram.ext import CallbackContext
 
 import sys
@@ -20,6 +23,8 @@ def mock_update():
     update.message.chat.id = 123
     update.message.from_user = MagicMock(spec=User)
     update.message.from_user.id = 123
+    # The "Looking up..." status message that is later edited into the result
+    update.message.reply_text.return_value = MagicMock(spec=Message)
     update.callback_query = MagicMock(spec=CallbackQuery)
     update.callback_query.message = MagicMock(spec=Message)
     return update
@@ -58,10 +63,17 @@ async def test_accept_both_flow(mock_update, mock_context, sample_reverso_result
         state = await tgram.get_word(mock_update, mock_context)
         assert state == tgram.ACCEPT_OR_DECLINE
         
-        # Verify messages were sent
-        assert mock_update.message.reply_text.call_count >= 3  # Word, translation, context
-        mock_update.message.reply_text.assert_any_call("Word: test")
-        mock_update.message.reply_markdown_v2.assert_any_call("Translation: ` тест1, тест2, тест3 (3), тест4, тест5 (5), тест6 `")
+        # One status message, edited into the result with the keyboard
+        mock_update.message.reply_text.assert_called_once_with("Looking up test...")
+        status = mock_update.message.reply_text.return_value
+        status.edit_text.assert_called_once()
+        text = status.edit_text.call_args.args[0]
+        assert text.startswith("<b>test</b>")
+        assert "Translation: <code>тест1, тест2, тест3 (3), тест4, тест5 (5), тест6</code>" in text
+        assert "This is a test -> Это тест" in text
+        assert status.edit_text.call_args.kwargs["parse_mode"] == ParseMode.HTML
+        keyboard = status.edit_text.call_args.kwargs["reply_markup"].inline_keyboard
+        assert [b.callback_data for b in keyboard[0]] == [a.key for a in tgram.Actions.get_all()]
         
         # Test accepting both
         mock_update.callback_query.data = tgram.AcceptBoth.key
@@ -70,11 +82,12 @@ async def test_accept_both_flow(mock_update, mock_context, sample_reverso_result
             assert state == tgram.ConversationHandler.END
             mock_add_card.assert_called_once()
             called_reverso_result = mock_add_card.call_args[0][0]
-            assert called_reverso_result.ru_translations == ["тест1", "тест2", "тест3", "тест4", "тест5", "тест6"]
-            mock_update.callback_query.message.reply_text.assert_has_calls([
-                call("Adding card to Anki..."),
-                call("Card added to Anki")
+            assert called_reverso_result.ru_translations == ("тест1", "тест2", "тест3", "тест4", "тест5", "тест6")
+            mock_update.callback_query.edit_message_text.assert_has_calls([
+                call(tgram.render_result_html(sample_reverso_result, "Adding card to Anki..."), parse_mode=ParseMode.HTML),
+                call(tgram.render_result_html(sample_reverso_result, "Card added to Anki"), parse_mode=ParseMode.HTML),
             ])
+            mock_update.callback_query.message.reply_text.assert_not_called()
 
 
 @pytest.mark.asyncio
@@ -98,7 +111,7 @@ async def test_accept_first_n_flow(mock_update, mock_context, sample_reverso_res
             assert state == tgram.ConversationHandler.END
             modified_result = mock_context.user_data["reverso_result"]
             assert len(modified_result.ru_translations) == n
-            mock_add_card.assert_called_once_with(modified_result)
+            mock_add_card.assert_called_once_with(modified_result, on_queued=ANY)
 
 @pytest.mark.asyncio
 async def test_custom_translation_by_text_input(mock_update, mock_context, sample_reverso_result):
@@ -119,7 +132,11 @@ async def test_custom_translation_by_text_input(mock_update, mock_context, sampl
     # Verify modified result
     modified_result = mock_context.user_data["reverso_result"]
     assert modified_result.en_word == "test"
-    assert modified_result.ru_translations == ["проверка"]
+    assert modified_result.ru_translations == ("проверка",)
+    mock_update.message.reply_html.assert_called_once()
+    assert "<code>проверка</code>" in mock_update.message.reply_html.call_args.args[0]
+    keyboard = mock_update.message.reply_html.call_args.kwargs["reply_markup"].inline_keyboard
+    assert [b.callback_data for b in keyboard[0]] == [a.key for a in tgram.Actions.get_base_actions()]
     
     # Test accepting modified result
     mock_update.callback_query = MagicMock(spec=CallbackQuery)
@@ -128,11 +145,10 @@ async def test_custom_translation_by_text_input(mock_update, mock_context, sampl
     with patch("ankinizer.anki_agent.add_card_to_anki") as mock_add_card:
         state = await tgram.accept_or_decline(mock_update, mock_context)
         assert state == tgram.ConversationHandler.END
-        mock_add_card.assert_called_once_with(modified_result)
-        mock_update.callback_query.message.reply_text.assert_has_calls([
-            call("Adding card to Anki..."),
-            call("Card added to Anki")
-        ])
+        mock_add_card.assert_called_once_with(modified_result, on_queued=ANY)
+        mock_update.callback_query.edit_message_text.assert_called_with(
+            tgram.render_result_html(modified_result, "Card added to Anki"), parse_mode=ParseMode.HTML
+        )
 
 
 @pytest.mark.asyncio
@@ -151,3 +167,172 @@ async def test_reject_flow(mock_update, mock_context, sample_reverso_result):
             state = await tgram.accept_or_decline(mock_update, mock_context)
             assert state == tgram.ConversationHandler.END
             mock_add_card.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_card_anki_did_not_take_is_reported(mock_update, mock_context, sample_reverso_result):
+    mock_context.user_data["reverso_result"] = sample_reverso_result
+    mock_update.callback_query.data = tgram.AcceptBoth.key
+    with patch("ankinizer.anki_agent.add_card_to_anki", return_value=False):
+        await tgram.accept_or_decline(mock_update, mock_context)
+    mock_update.callback_query.edit_message_text.assert_called_with(
+        tgram.render_result_html(sample_reverso_result, "Anki did not take the card, please try again"),
+        parse_mode=ParseMode.HTML,
+    )
+
+
+def test_parse_words():
+    assert tgram.parse_words(" Serendipity, ephemeral;ubiquitous\nephemeral ,, ") == [
+        "serendipity", "ephemeral", "ubiquitous"
+    ]
+    assert tgram.parse_words("make up") == ["make up"]
+
+
+@pytest.mark.asyncio
+async def test_multi_word_flow(mock_update, mock_context):
+    mock_update.message.text = "alpha, beta"
+    statuses = {}
+
+    async def reply_text(text):
+        statuses[text] = MagicMock(spec=Message)
+        return statuses[text]
+
+    async def lookup(word, on_queued=None):
+        return reverso_agent.ReversoResult(en_word=word, ru_translations=[word.upper()], usage_samples=[])
+
+    mock_update.message.reply_text.side_effect = reply_text
+    with patch("ankinizer.reverso_agent.get_reverso_result", side_effect=lookup):
+        state = await tgram.get_word(mock_update, mock_context)
+    assert state == tgram.ACCEPT_OR_DECLINE
+
+    # A status message per word, each edited into its own result
+    assert list(statuses) == ["Looking up alpha...", "Looking up beta..."]
+    callback_data = {}
+    for word, status in zip(["alpha", "beta"], statuses.values()):
+        status.edit_text.assert_called_once()
+        assert status.edit_text.call_args.args[0].startswith(f"<b>{word}</b>")
+        callback_data[word] = status.edit_text.call_args.kwargs["reply_markup"].inline_keyboard[0][0].callback_data
+    ids = {word: data.partition(":")[2] for word, data in callback_data.items()}
+    assert {k: v.en_word for k, v in mock_context.user_data["reverso_results"].items()} == {
+        ids["alpha"]: "alpha", ids["beta"]: "beta"
+    }
+
+    with patch("ankinizer.anki_agent.add_card_to_anki") as mock_add_card:
+        mock_update.callback_query.data = f"{tgram.AcceptBoth.key}:{ids['beta']}"
+        state = await tgram.accept_or_decline(mock_update, mock_context)
+        assert state == tgram.ACCEPT_OR_DECLINE
+        mock_add_card.assert_called_once()
+        assert mock_add_card.call_args[0][0].en_word == "beta"
+
+        mock_update.callback_query.data = f"{tgram.Reject.key}:{ids['alpha']}"
+        state = await tgram.accept_or_decline(mock_update, mock_context)
+        assert state == tgram.ConversationHandler.END
+        mock_add_card.assert_called_once()
+        rejected = mock_context.user_data["reverso_result"]
+        assert rejected.en_word == "alpha"
+        mock_update.callback_query.edit_message_text.assert_called_with(
+            tgram.render_result_html(rejected, "Rejected"), parse_mode=ParseMode.HTML
+        )
+
+
+@pytest.mark.asyncio
+async def test_too_many_words_are_refused(mock_update, mock_context, monkeypatch):
+    monkeypatch.setenv("ANKINIZER_MAX_WORDS", "2")
+    mock_update.message.text = "alpha, beta, gamma"
+    with patch("ankinizer.reverso_agent.get_reverso_result") as mock_lookup:
+        state = await tgram.get_word(mock_update, mock_context)
+    assert state == tgram.ConversationHandler.END
+    mock_lookup.assert_not_called()
+    mock_update.message.reply_text.assert_called_once_with("That's 3 words, please send at most 2 at a time")
+
+
+@pytest.mark.asyncio
+async def test_lookups_start_before_all_statuses_are_sent(mock_update, mock_context):
+    mock_update.message.text = "alpha, beta"
+    alpha_started = asyncio.Event()
+
+    async def reply_text(text):
+        if text == "Looking up beta...":
+            # Would time out if alpha only started after every status was sent
+            await asyncio.wait_for(alpha_started.wait(), 1)
+        return MagicMock(spec=Message)
+
+    async def lookup(word, on_queued=None):
+        if word == "alpha":
+            alpha_started.set()
+        return reverso_agent.ReversoResult(en_word=word, ru_translations=[word.upper()], usage_samples=[])
+
+    mock_update.message.reply_text.side_effect = reply_text
+    with patch("ankinizer.reverso_agent.get_reverso_result", side_effect=lookup):
+        await tgram.get_word(mock_update, mock_context)
+    assert len(mock_context.user_data["reverso_results"]) == 2
+
+
+@pytest.mark.asyncio
+async def test_lookups_are_bounded(monkeypatch):
+    monkeypatch.setenv("ANKINIZER_LOOKUP_CONCURRENCY", "2")
+    monkeypatch.setattr(tgram, "_lookup_semaphore", None)
+    running = 0
+    peak = 0
+
+    async def lookup(word, on_queued=None):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    with patch("ankinizer.reverso_agent.get_reverso_result", side_effect=lookup):
+        await asyncio.gather(*(tgram.lookup_word(f"word{i}") for i in range(5)))
+    assert peak == 2
+
+
+def make_update(update_id, user_id):
+    user = User(id=user_id, first_name="u", is_bot=False)
+    message = Message(message_id=update_id, date=None, chat=Chat(id=user_id, type="private"), from_user=user, text="x")
+    return Update(update_id=update_id, message=message)
+
+
+@pytest.mark.asyncio
+async def test_updates_are_ordered_per_user_only():
+    processor = tgram.PerUserUpdateProcessor(max_concurrent_updates=8)
+    events = []
+
+    async def handle(name, delay=0.0):
+        events.append(f"{name} start")
+        await asyncio.sleep(delay)
+        events.append(f"{name} end")
+
+    await asyncio.gather(
+        processor.process_update(make_update(1, 1), handle("a1", delay=0.05)),
+        processor.process_update(make_update(2, 1), handle("a2")),
+        processor.process_update(make_update(3, 2), handle("b1")),
+    )
+
+    # b1 from another user ran while a1 was busy, a2 waited for a1
+    assert events.index("b1 end") < events.index("a1 end")
+    assert events.index("a1 end") < events.index("a2 start")
+    assert processor._locks == {}
+
+
+@pytest.mark.asyncio
+async def test_queued_updates_of_one_user_dont_hold_shared_slots():
+    processor = tgram.PerUserUpdateProcessor(max_concurrent_updates=1)
+    release = asyncio.Event()
+    started = []
+
+    async def handle(name):
+        started.append(name)
+        if name == "a1":
+            await release.wait()
+
+    tasks = [
+        asyncio.create_task(processor.process_update(make_update(update_id, user_id), handle(name)))
+        for update_id, user_id, name in [(1, 1, "a1"), (2, 1, "a2"), (3, 1, "a3"), (4, 2, "b1")]
+    ]
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(*tasks)
+
+    # a2 and a3 waited for a1 without taking the only slot, so b1 got it next
+    assert started == ["a1", "b1", "a2", "a3"]
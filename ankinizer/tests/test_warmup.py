@@ -0,0 +1,104 @@
+import asyncio
+import time
+from unittest.mock import AsyncMock, MagicMock
+
+import httpx
+import pytest
+
+from ankinizer import admission
+from ankinizer import anki_agent
+from ankinizer import http_server
+from ankinizer import reverso_agent
+from ankinizer import warmup
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    backend = MagicMock(spec=anki_agent.AnkiBackend)
+    backend.warm_up = AsyncMock(return_value=True)
+    monkeypatch.setattr(anki_agent, "get_backend", lambda: backend)
+    monkeypatch.setattr(admission, "_controller", None)
+    return backend
+
+
+@pytest.fixture
+def lookup(monkeypatch):
+    lookup = AsyncMock(return_value=reverso_agent.ReversoResult("hello", ["привет"], []))
+    monkeypatch.setattr(reverso_agent, "get_reverso_result", lookup)
+    return lookup
+
+
+@pytest.mark.asyncio
+async def test_healthz_reports_ready_after_warm_up(monkeypatch, backend, lookup):
+    warmer = warmup.Warmer(rewarm_idle=0)
+    monkeypatch.setattr(warmup, "_warmer", warmer)
+    server = http_server.HttpServer()
+    warmup.add_routes(server)
+    await server.start()
+    try:
+        async with httpx.AsyncClient() as client:
+            cold = await client.get(f"http://127.0.0.1:{server.port}/healthz")
+            assert await warmer.warm_up()
+            warm = await client.get(f"http://127.0.0.1:{server.port}/healthz")
+    finally:
+        await server.stop()
+
+    assert cold.status_code == 503
+    assert cold.json()["status"] == "warming"
+    assert warm.status_code == 200
+    assert warm.json()["components"]["anki"]["ready"] is True
+    lookup.assert_awaited_once_with("hello", use_cache=False)
+    backend.warm_up.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_failed_component_keeps_it_unready(backend, lookup):
+    backend.warm_up.side_effect = RuntimeError("login page changed")
+    warmer = warmup.Warmer(rewarm_idle=0)
+
+    assert not await warmer.warm_up()
+
+    assert warmer.components["reverso"].ready
+    assert not warmer.components["anki"].ready
+    assert warmer.components["anki"].error == "RuntimeError: login page changed"
+    assert warmer.to_dict()["status"] == "warming"
+
+
+@pytest.mark.asyncio
+async def test_rewarms_after_idle_period_only(backend, lookup):
+    warmer = warmup.Warmer(rewarm_idle=0.05)
+    warmer.start()
+    try:
+        # Activity keeps pushing the re-warm back
+        for _ in range(5):
+            await asyncio.sleep(0.02)
+            warmer.touch()
+        assert backend.warm_up.await_count == 1
+        started = time.monotonic()
+        while backend.warm_up.await_count < 2 and time.monotonic() - started < 1:
+            await asyncio.sleep(0.01)
+    finally:
+        await warmer.stop()
+    assert backend.warm_up.await_count == 2
+    assert lookup.await_count == 2
+
+
+@pytest.mark.asyncio
+async def test_rewarming_stops_after_long_idle_until_touched(backend, lookup):
+    warmer = warmup.Warmer(rewarm_idle=0.02, rewarm_max_idle=0.05)
+    warmer.start()
+    try:
+        await asyncio.sleep(0.2)
+        idle_warm_ups = backend.warm_up.await_count
+        # Boot plus re-warms within the first 0.05s of idleness only
+        assert 2 <= idle_warm_ups <= 4
+        await asyncio.sleep(0.1)
+        assert backend.warm_up.await_count == idle_warm_ups
+
+        warmer.touch()
+        started = time.monotonic()
+        while backend.warm_up.await_count == idle_warm_ups and time.monotonic() - started < 1:
+            await asyncio.sleep(0.01)
+    finally:
+        await warmer.stop()
+    assert backend.warm_up.await_count > idle_warm_ups
@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+from telegram.ext import ApplicationBuilder, MessageHandler, filters
+
+from ankinizer import webhook
+from ankinizer.benchmarks import fakes
+
+
+@pytest.mark.asyncio
+async def test_updates_are_pushed_with_secret_token():
+    telegram = fakes.FakeTelegram()
+    await telegram.start()
+    received = asyncio.Queue()
+    initialized = []
+
+    async def post_init(application):
+        initialized.append(application)
+
+    async def on_text(update, context):
+        await received.put(update.message.text)
+
+    application = ApplicationBuilder().token(telegram.token).base_url(telegram.base_url).post_init(post_init).build()
+    application.add_handler(MessageHandler(filters.TEXT, on_text))
+    stop = asyncio.Event()
+    config = webhook.WebhookConfig(listen="127.0.0.1", port=0, secret="s3cret")
+    serving = asyncio.create_task(webhook.run(application, config, stop))
+    try:
+        while not telegram.webhook_url:
+            await asyncio.sleep(0.01)
+        assert telegram.webhook_url.endswith(webhook.DEFAULT_PATH)
+        assert telegram.webhook_secret == "s3cret"
+        assert initialized == [application]
+
+        await telegram.send_text(42, "serendipity")
+        assert await asyncio.wait_for(received.get(), 5) == "serendipity"
+
+        forged = await telegram.post_to_webhook({"update_id": 999, "message": {}}, secret="guess")
+        assert forged.status_code == 403
+        malformed = await telegram.post_to_webhook({"update_id": "x", "message": "nope"}, secret="s3cret")
+        assert malformed.status_code == 400
+        assert received.empty()
+    finally:
+        stop.set()
+        await serving
+        await telegram.stop()
+
+
+def test_config_from_env(monkeypatch):
+    monkeypatch.setenv("ANKINIZER_WEBHOOK_URL", "https://bot.example.com/hook/abc")
+    monkeypatch.setenv("ANKINIZER_WEBHOOK_PORT", "8080")
+    monkeypatch.delenv("ANKINIZER_WEBHOOK_SECRET", raising=False)
+    config = webhook.WebhookConfig.from_env()
+    assert (config.path, config.listen, config.port) == ("/hook/abc", webhook.DEFAULT_LISTEN, 8080)
+    assert len(config.secret) > 20
+
+    monkeypatch.setenv("ANKINIZER_TELEGRAM_MODE", "carrier-pigeon")
+    with pytest.raises(ValueError):
+        webhook.get_telegram_mode()
@@ -1,20 +1,40 @@
+import asyncio
 import dataclasses
 import logging
 import os
-from typing import Dict, Any, cast
+import re
+import secrets
+import time
+from html import escape
+from typing import Dict, Any, Awaitable, List, Optional, Tuple, cast
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update, Message, CallbackQuery
+from telegram.constants import ParseMode
 from telegram.ext import (
+    Application,
     ApplicationBuilder,
+    BaseUpdateProcessor,
     CallbackQueryHandler,
     CommandHandler,
     ContextTypes,
     ConversationHandler,
     filters,
     MessageHandler,
+    TypeHandler,
 )
 
+from ankinizer import added_index
+from ankinizer import admission
 from ankinizer import anki_agent
+from ankinizer import browser_pool
+from ankinizer import chromium_watchdog
+from ankinizer import metrics
+from ankinizer import outbox
+from ankinizer import resilience
+from ankinizer import session_store
 from ankinizer import reverso_agent
+from ankinizer import reverso_http
+from ankinizer import warmup
+from ankinizer import webhook
 from ankinizer import env
 
 # Enable logging
@@ -26,8 +46,17 @@ logger = logging.getLogger(__name__)
 # Define states for the conversation
 WORD, CUSTOM_TRANSLATION, ACCEPT_OR_DECLINE = range(3)
 
-# Store user data
-user_data: Dict[str, Any] = {}
+# A message may list several words separated by commas, semicolons or new lines
+WORD_SEPARATORS = re.compile(r"[,;\n]+")
+# Buttons of a multi-word message carry "<action key>:<result id>"
+CALLBACK_DATA_SEPARATOR = ":"
+DEFAULT_MAX_CONCURRENT_UPDATES = 64
+# Words looked up at once across all users, whether from the cache, over HTTP or in a browser
+DEFAULT_LOOKUP_CONCURRENCY = 10
+# Words one message may list
+DEFAULT_MAX_WORDS = 10
+_lookup_semaphore: Optional[asyncio.Semaphore] = None
+EXPIRED_TEXT = "This lookup has expired, please send the word again"
 
 
 class AcceptBoth:
@@ -91,34 +120,153 @@ def format_ru_translations(ru_translations):
 
 
 
+def parse_words(text: str) -> List[str]:
+    """Split a message into the words it lists, e.g. "serendipity, ephemeral"."""
+    words = (word.strip().lower() for word in WORD_SEPARATORS.split(text))
+    return list(dict.fromkeys(word for word in words if word))
+
+
+def get_lookup_semaphore() -> asyncio.Semaphore:
+    global _lookup_semaphore
+    if _lookup_semaphore is None:
+        _lookup_semaphore = asyncio.Semaphore(env.get_int("ANKINIZER_LOOKUP_CONCURRENCY", DEFAULT_LOOKUP_CONCURRENCY))
+    return _lookup_semaphore
+
+
+async def lookup_word(word: str, on_queued: Optional[admission.OnQueued] = None) -> reverso_agent.ReversoResult:
+    warmup.touch()
+    # Admission only gates browser lookups; this bounds HTTP lookups too
+    async with get_lookup_semaphore():
+        return await reverso_agent.get_reverso_result(word, on_queued=on_queued)
+
+
+def queue_notice(status: Message, word: str) -> admission.OnQueued:
+    """Show the user's place in line on the status message while a lookup waits for a browser."""
+    async def notify(position: int) -> None:
+        await status.edit_text(f"Busy, you're #{position} in queue for {word}...")
+    return notify
+
+
+def already_added_notice(word: str) -> Optional[str]:
+    """Tell the user when the deck already has the word, per the added-words index."""
+    entry = added_index.lookup(word)
+    if entry is None:
+        return None
+    if entry.source == added_index.BOT:
+        return f"Already in your Anki deck, added {time.strftime('%Y-%m-%d', time.localtime(entry.added_at))}"
+    return "Already in your Anki deck"
+
+
+def render_result_html(results: reverso_agent.ReversoResult, status: Optional[str] = None) -> str:
+    """Word, translations, examples and an optional status line as one HTML message."""
+    translation = ", ".join(format_ru_translations(list(results.ru_translations)))
+    parts = [f"<b>{escape(results.en_word)}</b>", f"Translation: <code>{escape(translation)}</code>"]
+    samples = results.get_usage_samples_html()
+    if samples:
+        parts.append(samples)
+    if status:
+        parts.append(f"<i>{escape(status)}</i>")
+    return "\n\n".join(parts)
+
+
+def result_keyboard(actions: List[Any], result_id: Optional[str] = None) -> InlineKeyboardMarkup:
+    """The accept buttons; result_id tags them when several words from one message are pending."""
+    suffix = "" if result_id is None else f"{CALLBACK_DATA_SEPARATOR}{result_id}"
+    return InlineKeyboardMarkup([[InlineKeyboardButton(a.text, callback_data=a.key + suffix) for a in actions]])
+
+
+async def show_result(status: Message, results: reverso_agent.ReversoResult, result_id: Optional[str] = None, note: Optional[str] = None) -> None:
+    """Turn the status message into the lookup result with the accept keyboard."""
+    await status.edit_text(
+        render_result_html(results, note),
+        parse_mode=ParseMode.HTML,
+        reply_markup=result_keyboard(Actions.get_all(), result_id),
+    )
+
+
+async def show_status(query: CallbackQuery, results: reverso_agent.ReversoResult, status: str) -> None:
+    """Keep the result on the answered message, swapping the keyboard for a status line."""
+    await query.edit_message_text(render_result_html(results, status), parse_mode=ParseMode.HTML)
+
+
 async def get_word(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     if update.message is None or update.message.text is None:
         return ConversationHandler.END
-    
-    word = update.message.text.strip().lower()
-    await update.message.reply_text(f"{word=} received, getting translation...")
-    results = await reverso_agent.get_reverso_result(word)
-    await update.message.reply_text(f"Word: {results.en_word}")
-
 
     if context.user_data is None:
         context.user_data = {}
-    context.user_data["reverso_result"] = results
+    context.user_data["reverso_results"] = {}
 
-    display_ru_translations = list(results.ru_translations)
-    translation = ", ".join(format_ru_translations(display_ru_translations))
-    await update.message.reply_markdown_v2(f"Translation: ` {translation} `")
-    logger.info(results.get_usage_samples_html())
-    await update.message.reply_html(results.get_usage_samples_html())
-    
-    keyboard = [
-        [InlineKeyboardButton(a.text, callback_data=a.key) for a in Actions.get_all()]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await update.message.reply_text("Add to anki?", reply_markup=reply_markup)
+    words = parse_words(update.message.text)
+    if not words:
+        return ConversationHandler.END
+    max_words = env.get_int("ANKINIZER_MAX_WORDS", DEFAULT_MAX_WORDS)
+    if len(words) > max_words:
+        await update.message.reply_text(f"That's {len(words)} words, please send at most {max_words} at a time")
+        return ConversationHandler.END
+    if len(words) > 1:
+        return await get_words(update.message, context, words)
+
+    word = words[0]
+    notice = already_added_notice(word)
+    status = await update.message.reply_text(f"Looking up {word}..." + (f" ({notice})" if notice else ""))
+    try:
+        results = await lookup_word(word, queue_notice(status, word))
+    except (admission.AdmissionRejected, resilience.CircuitOpenError) as e:
+        await status.edit_text(str(e))
+        return ConversationHandler.END
+    context.user_data["reverso_result"] = results
+    await show_result(status, results, note=notice)
     return ACCEPT_OR_DECLINE
 
 
+async def get_words(message: Message, context: ContextTypes.DEFAULT_TYPE, words: List[str]) -> int:
+    """Look up several words at once, each in its own message that fills in as its result arrives."""
+    assert context.user_data is not None
+
+    async def lookup(word: str, status: Message) -> Tuple[str, Message, Optional[reverso_agent.ReversoResult], Optional[Exception]]:
+        try:
+            return word, status, await lookup_word(word, queue_notice(status, word)), None
+        except admission.AdmissionRejected as e:
+            return word, status, None, e
+        except Exception as e:
+            logger.exception(f"Lookup of {word=} failed")
+            return word, status, None, e
+
+    # Each lookup starts as soon as its status message is out, not after all of them
+    lookups = []
+    try:
+        for word in words:
+            status = await message.reply_text(f"Looking up {word}...")
+            lookups.append(asyncio.ensure_future(lookup(word, status)))
+    except BaseException:
+        for task in lookups:
+            task.cancel()
+        raise
+
+    pending = context.user_data["reverso_results"]
+    for lookup_done in asyncio.as_completed(lookups):
+        word, status, results, error = await lookup_done
+        if results is None:
+            await status.edit_text(f"Failed to get translation for {word}: {error}")
+            continue
+        # Never reused, so a button on a message whose result was evicted can't pick up a newer one
+        result_id = secrets.token_hex(8)
+        pending[result_id] = results
+        store = session_store.get_store()
+        if store is not None:
+            store.cap_pending(pending)
+        await show_result(status, results, result_id, note=already_added_notice(word))
+    return ACCEPT_OR_DECLINE if pending else ConversationHandler.END
+
+
+def next_state(context: ContextTypes.DEFAULT_TYPE) -> int:
+    """Stay in the conversation while other words from the same message still wait for an answer."""
+    if context.user_data and context.user_data.get("reverso_results"):
+        return ACCEPT_OR_DECLINE
+    return ConversationHandler.END
+
+
 async def handle_add_to_anki(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle the case when user accepts both translation and context."""
     if update.callback_query is None or update.callback_query.message is None or context.user_data is None:
@@ -130,13 +278,33 @@ async def handle_add_to_anki(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await query.message.reply_text("Error: Invalid reverso result")
         return
         
-    await query.message.reply_text("Adding card to Anki...")
+    notice = already_added_notice(reverso_results.en_word)
+    if notice is not None:
+        # Nothing to do in Anki, don't spend a browser session finding that out
+        await show_status(query, reverso_results, f"{notice}, not adding it again")
+        return
+
+    warmup.touch()
+    worker = outbox.get_worker()
+    if worker is not None:
+        worker.submit(reverso_results, query.message.chat_id)
+        await show_status(query, reverso_results, "Card queued for Anki, I'll let you know when it's added")
+        return
+
+    async def on_queued(position: int) -> None:
+        await show_status(query, reverso_results, f"Busy, you're #{position} in queue for Anki...")
+
+    await show_status(query, reverso_results, "Adding card to Anki...")
     try:
-        await anki_agent.add_card_to_anki(reverso_results)
-        await query.message.reply_text("Card added to Anki")
+        added = await anki_agent.add_card_to_anki(reverso_results, on_queued=on_queued)
     except Exception as e:
         logging.exception(e)
-        await query.message.reply_text(f"Error adding card to Anki: {str(e)}")
+        await show_status(query, reverso_results, f"Error adding card to Anki: {str(e)}")
+        return
+    if added:
+        await show_status(query, reverso_results, "Card added to Anki")
+    else:
+        await show_status(query, reverso_results, "Anki did not take the card, please try again")
 
 
 async def accept_or_decline(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -147,29 +315,34 @@ async def accept_or_decline(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if query.data is None:
         return ConversationHandler.END
         
-    answer = query.data
+    answer, _, result_id = query.data.partition(CALLBACK_DATA_SEPARATOR)
+    if result_id:
+        # One of several words from the same message, make it the current result
+        pending = context.user_data.get("reverso_results") or {}
+        context.user_data["reverso_result"] = pending.pop(result_id, None)
     reverso_results = context.user_data.get("reverso_result")
     if not isinstance(reverso_results, reverso_agent.ReversoResult):
+        # Answered already, or dropped by the session store while idle
         if query.message is not None:
-            await query.message.reply_text("Error: Invalid reverso result")
-        return ConversationHandler.END
+            await query.message.reply_text(EXPIRED_TEXT)
+        return next_state(context)
         
     if query.message is None:
         return ConversationHandler.END
         
-    await query.edit_message_text(text=Actions.get_key_to_text_map()[answer])
+    # Accepting answers get their status line from handle_add_to_anki
     if answer == Reject.key:
-        pass
+        await show_status(query, reverso_results, "Rejected")
     elif answer == AcceptBoth.key:
         await handle_add_to_anki(update, context)
     elif answer == AcceptContextFixTranslation.key:
-        await query.message.reply_text("Enter custom translation:")
+        await show_status(query, reverso_results, "Enter custom translation:")
         return CUSTOM_TRANSLATION
     elif answer == First3.key:
         return await handle_first_n_translations(update, context, First3.n)
     elif answer == First5.key:
         return await handle_first_n_translations(update, context, First5.n)
-    return ConversationHandler.END
+    return next_state(context)
 
 
 async def handle_first_n_translations(update: Update, context: ContextTypes.DEFAULT_TYPE, n: int) -> int:
@@ -185,7 +358,7 @@ async def handle_first_n_translations(update: Update, context: ContextTypes.DEFA
     reverso_results = cast(reverso_agent.ReversoResult, context.user_data.get("reverso_result"))
     reverso_results.ru_translations = reverso_results.ru_translations[:n]
     await handle_add_to_anki(update, context)
-    return ConversationHandler.END
+    return next_state(context)
 
 
 async def handle_custom_translation(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -194,27 +367,21 @@ async def handle_custom_translation(update: Update, context: ContextTypes.DEFAUL
         custom_translation = update.message.text
         reverso_results = context.user_data.get("reverso_result")
         if not isinstance(reverso_results, reverso_agent.ReversoResult):
-            await update.message.reply_text("Error: Invalid reverso result")
+            await update.message.reply_text(EXPIRED_TEXT)
             return ConversationHandler.END
             
         # Create a new ReversoResult with the custom translation
         modified_results = reverso_agent.ReversoResult(
             en_word=reverso_results.en_word,
-            ru_translations=[custom_translation],  # Replace with user's translation
+            ru_translations=(custom_translation,),  # Replace with user's translation
             usage_samples=reverso_results.usage_samples  # Keep original context
         )
         context.user_data["reverso_result"] = modified_results
         
         # Show the modified result and prompt for acceptance
-        await update.message.reply_text(f"Word: {modified_results.en_word}")
-        await update.message.reply_markdown_v2(f"Translation: `{custom_translation}`")
-        await update.message.reply_html(modified_results.get_usage_samples_html())
-        
-        keyboard = [
-            [InlineKeyboardButton(a.text, callback_data=a.key) for a in Actions.get_base_actions()]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await update.message.reply_text("Add to anki?", reply_markup=reply_markup)
+        await update.message.reply_html(
+            render_result_html(modified_results), reply_markup=result_keyboard(Actions.get_base_actions())
+        )
         return ACCEPT_OR_DECLINE
     
     if update.callback_query and update.callback_query.message:
@@ -238,15 +405,124 @@ async def handle_text_during_accept_or_decline(update: Update, context: ContextT
     return ConversationHandler.END
 
 
-def main() -> None:
-    env.setup_env()
+async def conversation_timed_out(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """A lookup went unanswered for the session TTL; drop the user's state along with the conversation."""
+    store = session_store.get_store()
+    if store is not None and update.effective_user is not None:
+        store.evict(update.effective_user.id, "idle")
+    elif context.user_data:
+        context.user_data.clear()
 
-    # Build and run the application
-    application = (
+
+async def post_init(application: Application) -> None:
+    """Warm up shared resources before the bot starts taking updates."""
+    server = await metrics.start_server()
+    if server is not None:
+        warmup.add_routes(server)
+    else:
+        logger.info("Not serving /metrics or /healthz, ANKINIZER_METRICS_PORT is 0")
+    if reverso_agent.get_lookup_mode() != "http":
+        await browser_pool.start_pool(reverso_agent.get_pool_params())
+    chromium_watchdog.start()
+    warmup.start()
+    added_index.start_seeding()
+    session_store.start(application)
+
+    async def notify(chat_id: int, text: str) -> None:
+        await application.bot.send_message(chat_id=chat_id, text=text)
+
+    outbox.start_worker(notify)
+
+
+async def post_shutdown(application: Application) -> None:
+    await warmup.stop()
+    await added_index.stop_seeding()
+    await session_store.stop()
+    await outbox.stop_worker()
+    await browser_pool.close_pool()
+    await anki_agent.close_backend()
+    await chromium_watchdog.stop()
+    await reverso_http.close_client()
+    await metrics.stop_server()
+
+
+async def track_session(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Note the user's activity so their conversation state is kept while they use it."""
+    store = session_store.get_store()
+    if store is not None and update.effective_user is not None:
+        store.touch(update.effective_user.id)
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Handles updates of different users concurrently, but each user's in the order they came.
+
+    A user's next message or button press must see the conversation state left
+    by the previous one, so updates from the same user wait for each other.
+    """
+
+    def __init__(self, max_concurrent_updates: int) -> None:
+        super().__init__(max_concurrent_updates)
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._waiting: Dict[int, int] = {}
+
+    @staticmethod
+    def get_key(update: object) -> Optional[int]:
+        if not isinstance(update, Update):
+            return None
+        if update.effective_user is not None:
+            return update.effective_user.id
+        if update.effective_chat is not None:
+            return update.effective_chat.id
+        return None
+
+    async def process_update(self, update: object, coroutine: Awaitable[Any]) -> None:  # type: ignore[misc]
+        # Overrides the base class's (final) semaphore wrapper: an update first
+        # waits for its user's earlier ones and only then takes a shared slot, so
+        # one user's burst doesn't hold slots other users' updates could run in
+        key = self.get_key(update)
+        if key is None:
+            await super().process_update(update, coroutine)
+            return
+        # Updates are handed over in arrival order and asyncio.Lock is FIFO
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._waiting[key] = self._waiting.get(key, 0) + 1
+        try:
+            async with lock:
+                await super().process_update(update, coroutine)
+        finally:
+            self._waiting[key] -= 1
+            if not self._waiting[key]:
+                del self._waiting[key], self._locks[key]
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+
+def build_application(token: str, base_url: Optional[str] = None) -> Application:
+    """The bot with all its handlers; base_url points it at a Bot API other than Telegram's."""
+    max_updates = env.get_int("ANKINIZER_MAX_CONCURRENT_UPDATES", DEFAULT_MAX_CONCURRENT_UPDATES)
+    builder = (
         ApplicationBuilder()
-        .token(os.environ["TELEGRAM_BOT_TOKEN"])
-        .build()
+        .token(token)
+        .concurrent_updates(PerUserUpdateProcessor(max_updates))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
     )
+    if base_url is not None:
+        builder = builder.base_url(base_url)
+    application = builder.build()
+
+    # Without a timeout the handler remembers every user's state for good; the
+    # timeout needs the JobQueue (APScheduler), PTB warns when it's missing
+    conversation_timeout = session_store.get_idle_ttl() or None
+    if application.job_queue is None:
+        conversation_timeout = None
 
     conv_handler = ConversationHandler(
         entry_points=[MessageHandler(filters.TEXT & ~filters.COMMAND, get_word)],
@@ -258,12 +534,27 @@ def main() -> None:
             CUSTOM_TRANSLATION: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, handle_custom_translation)
             ],
+            ConversationHandler.TIMEOUT: [TypeHandler(Update, conversation_timed_out)],
         },
         fallbacks=[CommandHandler("cancel", cancel)],
+        conversation_timeout=conversation_timeout,
     )
 
+    # Group -1 runs before the conversation for every update
+    application.add_handler(TypeHandler(Update, track_session), group=-1)
     application.add_handler(conv_handler)
-    application.run_polling()
+    return application
+
+
+def main() -> None:
+    env.setup_env()
+
+    # Build and run the application
+    application = build_application(os.environ["TELEGRAM_BOT_TOKEN"])
+    if webhook.get_telegram_mode() == "webhook":
+        asyncio.run(webhook.run(application, webhook.WebhookConfig.from_env()))
+    else:
+        application.run_polling()
 
 
 if __name__ == "__main__":
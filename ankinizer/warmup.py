@@ -0,0 +1,195 @@
+import asyncio
+import contextlib
+import dataclasses
+import json
+import logging
+import time
+import typing
+from typing import Optional
+
+from ankinizer import anki_agent
+from ankinizer import env
+from ankinizer import http_server
+from ankinizer import metrics
+from ankinizer import reverso_agent
+
+logger = logging.getLogger(__name__)
+
+COMPONENTS = ("reverso", "anki")
+DEFAULT_CANARY_WORD = "hello"
+DEFAULT_REWARM_IDLE = 600
+# After this long without users, re-warming waits for the next one
+DEFAULT_REWARM_MAX_IDLE = 6 * 3600
+# How soon a failed warm-up is tried again
+RETRY_INTERVAL = 60.0
+
+WARMUP_READY: metrics.Gauge = metrics.REGISTRY.register(metrics.Gauge(
+    "ankinizer_warmup_ready", "1 when the component was warmed up successfully", labels=("component",),
+))
+WARMUPS: metrics.Counter = metrics.REGISTRY.register(metrics.Counter(
+    "ankinizer_warmups_total", "Warm-ups run, by component and outcome", labels=("component", "outcome"),
+))
+
+
+@dataclasses.dataclass
+class ComponentState:
+    ready: bool = False
+    warmed_at: Optional[float] = None
+    seconds: float = 0.0
+    error: str = ""
+
+
+class Warmer:
+    """Does the slow first-use work at boot and again after the bot sat idle.
+
+    Reverso is warmed with a canary lookup that bypasses the cache, so the
+    browser page (or HTTP connection) and parser have been through a real
+    request; Anki by the backend's warm_up (AnkiWeb login and Add editor).
+    Idle browsers and sessions go stale (expired cookies, closed
+    connections), so after rewarm_idle seconds without a user lookup or add
+    both are warmed again; 0 turns that off. Once nobody has used the bot for
+    rewarm_max_idle seconds (0 for no limit) re-warming stops until someone
+    does, rather than logging in to AnkiWeb every few minutes for good.
+    """
+
+    def __init__(
+        self,
+        canary_word: str = DEFAULT_CANARY_WORD,
+        rewarm_idle: float = DEFAULT_REWARM_IDLE,
+        rewarm_max_idle: float = DEFAULT_REWARM_MAX_IDLE,
+    ) -> None:
+        self.canary_word = canary_word
+        self.rewarm_idle = rewarm_idle
+        self.rewarm_max_idle = rewarm_max_idle
+        self.components = {name: ComponentState() for name in COMPONENTS}
+        self.last_activity = time.monotonic()
+        self._last_warm_up = 0.0
+        self._warming = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return all(state.ready for state in self.components.values())
+
+    def touch(self) -> None:
+        """Record user activity; the idle timer for re-warming starts over."""
+        self.last_activity = time.monotonic()
+
+    async def warm_up(self) -> bool:
+        async with self._warming:
+            await asyncio.gather(
+                self._warm("reverso", self._warm_reverso),
+                self._warm("anki", anki_agent.get_backend().warm_up),
+            )
+            self._last_warm_up = time.monotonic()
+        return self.ready
+
+    async def _warm_reverso(self) -> bool:
+        result = await reverso_agent.get_reverso_result(self.canary_word, use_cache=False)
+        return bool(result.ru_translations)
+
+    async def _warm(self, name: str, warm: typing.Callable[[], typing.Awaitable[bool]]) -> None:
+        state = self.components[name]
+        started = time.perf_counter()
+        try:
+            ok = await warm()
+            state.error = "" if ok else "not usable after warm-up"
+        except Exception as e:
+            logger.exception(f"Warming up {name} failed")
+            ok = False
+            state.error = f"{type(e).__name__}: {e}"
+        state.seconds = time.perf_counter() - started
+        state.ready = ok
+        if ok:
+            state.warmed_at = time.time()
+            logger.info(f"Warmed up {name} in {state.seconds:.2f}s")
+        WARMUP_READY.set(int(ok), component=name)
+        WARMUPS.inc(component=name, outcome="success" if ok else "failure")
+
+    def _next_check(self) -> float:
+        """Seconds until a warm-up is due: a retry after a failure, or a re-warm once idle."""
+        now = time.monotonic()
+        if not self.ready:
+            return self._last_warm_up + RETRY_INTERVAL - now
+        due = max(self.last_activity, self._last_warm_up) + self.rewarm_idle
+        if self.rewarm_max_idle > 0 and due - self.last_activity > self.rewarm_max_idle:
+            # Idle for too long, look again once a user may have come back
+            return self.rewarm_idle
+        return due - now
+
+    async def run(self) -> None:
+        await self.warm_up()
+        while self.rewarm_idle > 0 or not self.ready:
+            delay = self._next_check()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            logger.info("Re-warming" if self.ready else "Retrying warm-up")
+            await self.warm_up()
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+
+    def to_dict(self) -> typing.Dict[str, typing.Any]:
+        return {
+            "status": "ok" if self.ready else "warming",
+            "components": {name: dataclasses.asdict(state) for name, state in self.components.items()},
+        }
+
+
+_warmer: Optional[Warmer] = None
+
+
+def get_warmer() -> Optional[Warmer]:
+    return _warmer
+
+
+def is_enabled() -> bool:
+    return env.get_int("ANKINIZER_WARMUP", 1) != 0
+
+
+def start() -> Optional[Warmer]:
+    """Warm up in the background, so the bot takes updates while it runs; see ANKINIZER_WARMUP."""
+    global _warmer
+    if _warmer is None and is_enabled():
+        _warmer = Warmer(
+            canary_word=env.get_str("ANKINIZER_CANARY_WORD", DEFAULT_CANARY_WORD),
+            rewarm_idle=env.get_int("ANKINIZER_REWARM_IDLE", DEFAULT_REWARM_IDLE),
+            rewarm_max_idle=env.get_int("ANKINIZER_REWARM_MAX_IDLE", DEFAULT_REWARM_MAX_IDLE),
+        )
+        _warmer.start()
+    return _warmer
+
+
+async def stop() -> None:
+    global _warmer
+    warmer, _warmer = _warmer, None
+    if warmer is not None:
+        await warmer.stop()
+
+
+def touch() -> None:
+    if _warmer is not None:
+        _warmer.touch()
+
+
+async def _serve_health(request: http_server.Request) -> http_server.Response:
+    # Without warm-up there is nothing to wait for: being able to answer is healthy
+    body = _warmer.to_dict() if _warmer is not None else {"status": "ok", "components": {}}
+    return http_server.Response(
+        status=200 if body["status"] == "ok" else 503,
+        body=json.dumps(body).encode(),
+        content_type="application/json",
+    )
+
+
+def add_routes(server: http_server.HttpServer) -> None:
+    """Serve /healthz; the bot adds it to the metrics server, so ANKINIZER_METRICS_PORT=0 turns it off too."""
+    server.route("GET", "/healthz", _serve_health)
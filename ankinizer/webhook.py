@@ -0,0 +1,137 @@
+import asyncio
+import contextlib
+import dataclasses
+import hmac
+import json
+import logging
+import secrets
+import signal
+import urllib.parse
+from typing import Optional
+
+from telegram import Update
+from telegram.ext import Application
+
+from ankinizer import env
+from ankinizer import http_server
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_MODES = ("polling", "webhook")
+SECRET_HEADER = "x-telegram-bot-api-secret-token"
+DEFAULT_LISTEN = "0.0.0.0"
+DEFAULT_PORT = 8443
+DEFAULT_PATH = "/telegram"
+
+
+def get_telegram_mode() -> str:
+    mode = env.get_str("ANKINIZER_TELEGRAM_MODE", "polling")
+    if mode not in TELEGRAM_MODES:
+        raise ValueError(f"Unknown ANKINIZER_TELEGRAM_MODE {mode!r}, expected one of {TELEGRAM_MODES}")
+    return mode
+
+
+@dataclasses.dataclass
+class WebhookConfig:
+    """Where Telegram should push updates and where we listen for them.
+
+    url is the public address given to Telegram (usually https behind a
+    reverse proxy); when empty, the local listen address is used, which is
+    only good for local testing. The server answers on url's path.
+    """
+
+    url: str = ""
+    listen: str = DEFAULT_LISTEN
+    port: int = DEFAULT_PORT
+    secret: str = ""
+
+    def __post_init__(self) -> None:
+        if not self.secret:
+            # Telegram echoes it back on every push; a fresh one per start is fine
+            self.secret = secrets.token_urlsafe(32)
+
+    @property
+    def path(self) -> str:
+        return urllib.parse.urlsplit(self.url).path or DEFAULT_PATH
+
+    @classmethod
+    def from_env(cls) -> "WebhookConfig":
+        return cls(
+            url=env.get_str("ANKINIZER_WEBHOOK_URL", ""),
+            listen=env.get_str("ANKINIZER_WEBHOOK_LISTEN", DEFAULT_LISTEN),
+            port=env.get_int("ANKINIZER_WEBHOOK_PORT", DEFAULT_PORT),
+            secret=env.get_str("ANKINIZER_WEBHOOK_SECRET", ""),
+        )
+
+
+class WebhookServer:
+    """Receives pushed updates and feeds them to the application's update queue.
+
+    Built on http_server rather than Application.run_webhook, which needs
+    tornado; requests without the secret token Telegram was given are refused.
+    """
+
+    def __init__(self, application: Application, config: WebhookConfig) -> None:
+        self.application = application
+        self.config = config
+        self.server = http_server.HttpServer(config.listen, config.port)
+        self.server.route("POST", config.path, self.handle_update)
+
+    @property
+    def url(self) -> str:
+        return self.config.url or f"http://{self.server.host}:{self.server.port}{self.config.path}"
+
+    async def start(self) -> None:
+        await self.server.start()
+        await self.application.bot.set_webhook(
+            url=self.url, secret_token=self.config.secret, allowed_updates=Update.ALL_TYPES
+        )
+        logger.info(f"Webhook set to {self.url}")
+
+    async def stop(self) -> None:
+        await self.server.stop()
+
+    async def handle_update(self, request: http_server.Request) -> http_server.Response:
+        token = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(token.encode(), self.config.secret.encode()):
+            logger.warning("Webhook request with a wrong secret token")
+            return http_server.Response.text("Forbidden\n", status=403)
+        try:
+            update = Update.de_json(json.loads(request.body), self.application.bot)
+        except Exception:
+            logger.exception("Malformed webhook update")
+            return http_server.Response.text("Bad request\n", status=400)
+        if update is not None:
+            await self.application.update_queue.put(update)
+        return http_server.Response()
+
+
+async def run(application: Application, config: WebhookConfig, stop: Optional[asyncio.Event] = None) -> None:
+    """Serve the bot in webhook mode until stop is set (or SIGINT/SIGTERM without one).
+
+    Mirrors the lifecycle run_polling drives: post_init after initialize,
+    post_shutdown after shutdown.
+    """
+    if stop is None:
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            with contextlib.suppress(NotImplementedError):
+                loop.add_signal_handler(signum, stop.set)
+
+    webhook = WebhookServer(application, config)
+    await application.initialize()
+    try:
+        if application.post_init is not None:
+            await application.post_init(application)
+        await webhook.start()
+        await application.start()
+        try:
+            await stop.wait()
+        finally:
+            await application.stop()
+            await webhook.stop()
+    finally:
+        await application.shutdown()
+        if application.post_shutdown is not None:
+            await application.post_shutdown(application)
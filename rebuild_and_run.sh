@@ -1,6 +1,7 @@
 docker build -t ankinizer -f build/Dockerfile .
 docker rm -f ankinizer_container || true
 docker run -d --name ankinizer_container \
+    -v ankinizer_data:/app/.data \
     -e ANKI_USERNAME=$(cat .sensitive/.username) \
     -e ANKI_PASSWORD=$(cat .sensitive/.password) \
     -e TELEGRAM_BOT_TOKEN=$(cat .sensitive/.telegram_bot_token) \